@@ -0,0 +1,1104 @@
+# batch_engine.py - 向量化湿空气批量计算引擎
+"""
+使用 NumPy 对整批状态点同时求解湿空气参数。
+
+计算基于 ASHRAE Handbook Fundamentals (2017) 第 1 章的关联式：
+Hyland-Wexler 饱和水蒸气压、Greenspan 增强因子、理想气体含湿量/焓值公式，
+由 CoolProp 拟合的焓值多项式，以及绝热饱和能量平衡求湿球温度。
+非 (T, x) 输入组合通过向量化试位法/牛顿法求解干球温度；(H, R)、(B, R) 整批求解时
+以相邻锚点的解为初值做牛顿迭代（solve_temperature），收敛统计计入 /metrics。
+
+与 CoolProp (HAPropsSI) 的偏差在 COOLPROP_TOLERANCE 给出的范围内
+（-30~50 °C、压力 70~110 kPa 的常用暖通范围），可通过
+``python batch_engine.py`` 或 validate_against_coolprop() 复核。
+（湿球温度在 0 °C 附近 ±1 K 内冰面/水面两支解并存，该带宽内取水面解，可能与 CoolProp 不同。）
+超出关联式适用范围、无法求解的点以及 (B, H) 这类病态组合自动回退到 CoolProp 逐点计算。
+"""
+import math
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+# HAPropsSI 调用计数与耗时、逆向求解收敛统计（metrics 模块不可用时不记录）
+try:
+    from metrics import record_haprops, record_solver
+except ImportError:
+    record_haprops = None
+    record_solver = None
+
+# 支持的输入参数代码（与 CoolProp HAPropsSI 一致）
+SUPPORTED_INPUTS = ('T', 'B', 'R', 'W', 'H', 'D')
+
+# 输出列（与 calculate_properties 的返回字段一致）
+OUTPUT_COLUMNS = ('tdb', 'twb', 'rh', 'w', 'h', 'tdp')
+
+# 标准状态列：干球温度 (K)、含湿量 (kg/kg)、压力 (Pa)
+STATE_COLUMNS = ('T', 'W', 'P')
+
+# 与 CoolProp 的最大允许偏差（输出单位：°C, %, g/kg, kJ/kg）
+COOLPROP_TOLERANCE = {
+    'tdb': 0.05,
+    'twb': 0.02,
+    'rh': 0.30,
+    'w': 0.03,
+    'h': 0.08,
+    'tdp': 0.15,
+}
+
+# 湿球温度在冰点附近时冰面/水面两支解并存，CoolProp 的取舍依赖迭代路径，此带宽内不做比对 (°C)
+WET_BULB_FREEZING_BAND = 1.0
+
+# 关联式适用范围 (K)
+T_MIN = 173.15
+T_MAX = 473.15
+T_TRIPLE = 273.15
+
+# 物理常数
+EPSILON = 0.621945      # 水与干空气摩尔质量比
+R_DA = 287.042          # 干空气气体常数 J/(kg·K)
+
+# Hyland-Wexler 饱和蒸汽压系数（冰面 / 水面）
+_C_ICE = (-5.6745359e3, 6.3925247, -9.677843e-3, 6.2215701e-7,
+          2.0747825e-9, -9.484024e-13, 4.1635019)
+_C_WATER = (-5.8002206e3, 1.3914993, -4.8640239e-2, 4.1764768e-5,
+            -1.4452093e-8, 6.5459673)
+
+# Greenspan 增强因子系数（水面 / 冰面）
+_F_ALPHA_WATER = (3.53624e-4, 2.93228e-5, 2.61474e-7, 8.57538e-9)
+_F_BETA_WATER = (-1.07588e1, 6.32529e-2, -2.53591e-4, 6.33784e-7)
+_F_ALPHA_ICE = (3.64449e-4, 2.93631e-5, 4.88635e-7, 4.36543e-9)
+_F_BETA_ICE = (-1.07271e1, 7.61989e-2, -1.74771e-4, 2.46721e-6)
+_F_OFFSET = 2.5e-4
+
+# 焓值多项式系数 (kJ/kg，自变量为 °C，升幂排列)，由 CoolProp 在 -60~100 °C 拟合
+_H_DRY = (9.09390153e-06, 1.0056597, 7.56496774e-06, 1.33640191e-07)
+_H_VAPOR = (2500.282, 1.87083985, -4.49696151e-05, 1.21504628e-06)
+_H_PRESSURE = 0.2017
+# 水蒸气-空气非理想混合修正 ln(k) 的多项式系数
+_H_MIX = (4.779214, -0.02652162, 9.340628e-05, -1.968953e-07)
+# 干空气焓、水蒸气焓多项式对温度的导数
+_H_DRY_SLOPE = tuple(i * c for i, c in enumerate(_H_DRY))[1:]
+_H_VAPOR_SLOPE = tuple(i * c for i, c in enumerate(_H_VAPOR))[1:]
+
+_SOLVER_ITERATIONS = 40
+
+# 温启动牛顿法：每隔 ANCHOR_STRIDE 个点取一个锚点用试位法求解，其余点以前一个锚点的解为初值
+ANCHOR_STRIDE = 16
+_NEWTON_ITERATIONS = 8
+_NEWTON_XTOL = 1e-6
+
+
+# --- 基础关联式 ---
+
+def _poly(coeffs, t):
+    result = coeffs[-1]
+    for c in reversed(coeffs[:-1]):
+        result = result * t + c
+    return result
+
+
+def _ln_pws(T: np.ndarray) -> np.ndarray:
+    """饱和水蒸气压的自然对数 (Pa)，0 °C 以下按冰面计算"""
+    T2 = T * T
+    T3 = T2 * T
+    ln_T = np.log(T)
+    c = _C_ICE
+    ice = c[0] / T + c[1] + c[2] * T + c[3] * T2 + c[4] * T3 + c[5] * T2 * T2 + c[6] * ln_T
+    c = _C_WATER
+    water = c[0] / T + c[1] + c[2] * T + c[3] * T2 + c[4] * T3 + c[5] * ln_T
+    return np.where(T < T_TRIPLE, ice, water)
+
+
+def _dln_pws_dT(T: np.ndarray) -> np.ndarray:
+    """ln(pws) 对温度的导数，用于牛顿迭代"""
+    T2 = T * T
+    c = _C_ICE
+    ice = -c[0] / T2 + c[2] + 2 * c[3] * T + 3 * c[4] * T2 + 4 * c[5] * T2 * T + c[6] / T
+    c = _C_WATER
+    water = -c[0] / T2 + c[2] + 2 * c[3] * T + 3 * c[4] * T2 + c[5] / T
+    return np.where(T < T_TRIPLE, ice, water)
+
+
+def saturation_pressure(T) -> np.ndarray:
+    """饱和水蒸气压 (Pa)"""
+    return np.exp(_ln_pws(np.asarray(T, dtype=float)))
+
+
+def enhancement_factor(T, P, pws=None) -> np.ndarray:
+    """
+    增强因子，修正湿空气中水蒸气的非理想性
+
+    采用 Greenspan (1976) 关联式，并加常数偏置与 CoolProp 的维里方程模型对齐。
+    pws 为已算出的饱和水蒸气压，可省去重复计算。
+    """
+    T = np.asarray(T, dtype=float)
+    P = np.asarray(P, dtype=float)
+    # 关联式适用于 -100~100 °C，超出部分取端点值
+    t = np.clip(T - 273.15, -100.0, 100.0)
+    ice = T < T_TRIPLE
+    a = np.where(ice, _poly(_F_ALPHA_ICE, t), _poly(_F_ALPHA_WATER, t))
+    b = np.exp(np.where(ice, _poly(_F_BETA_ICE, t), _poly(_F_BETA_WATER, t)))
+    if pws is None:
+        pws = saturation_pressure(T)
+    return np.exp(a * (1.0 - pws / P) + b * (P / pws - 1.0)) + _F_OFFSET
+
+
+def _saturation_pw(T, P) -> np.ndarray:
+    """湿空气中的饱和水蒸气分压 f·pws (Pa)"""
+    pws = saturation_pressure(T)
+    return enhancement_factor(T, P, pws) * pws
+
+
+def saturation_temperature(pw, P) -> np.ndarray:
+    """
+    饱和温度反算：求 T 使 f(T, P) * pws(T) = pw（即露点/霜点温度）
+
+    以 Magnus 公式给出初值，再做牛顿迭代。
+    """
+    pw = np.asarray(pw, dtype=float)
+    P = np.asarray(P, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Magnus 初值
+        g = np.log(np.maximum(pw, 1e-12) / 611.2)
+        T = 273.15 + 243.12 * g / (17.62 - g)
+        T = np.clip(T, T_MIN, T_MAX)
+        target = np.log(pw)
+        for _ in range(4):
+            ln_pws = _ln_pws(T)
+            f = enhancement_factor(T, P, np.exp(ln_pws))
+            residual = ln_pws + np.log(f) - target
+            T = np.clip(T - residual / _dln_pws_dT(T), T_MIN, T_MAX)
+    return np.where(pw > 0, T, np.nan)
+
+
+def vapor_pressure(W, P) -> np.ndarray:
+    """由含湿量求水蒸气分压 (Pa)"""
+    W = np.asarray(W, dtype=float)
+    return W * np.asarray(P, dtype=float) / (EPSILON + W)
+
+
+def humidity_ratio_from_pw(pw, P) -> np.ndarray:
+    """由水蒸气分压求含湿量 (kg/kg)"""
+    pw = np.asarray(pw, dtype=float)
+    return EPSILON * pw / (np.asarray(P, dtype=float) - pw)
+
+
+def saturation_humidity_ratio(T, P) -> np.ndarray:
+    """饱和含湿量 (kg/kg)"""
+    return humidity_ratio_from_pw(_saturation_pw(T, P), P)
+
+
+def humidity_ratio_from_rh(T, R, P) -> np.ndarray:
+    """由干球温度与相对湿度 (0-1) 求含湿量"""
+    return humidity_ratio_from_pw(np.asarray(R, dtype=float) * _saturation_pw(T, P), P)
+
+
+def relative_humidity(T, W, P) -> np.ndarray:
+    """由干球温度与含湿量求相对湿度 (0-1)"""
+    return vapor_pressure(W, P) / _saturation_pw(T, P)
+
+
+def _pressure_correction(T, P) -> np.ndarray:
+    """干空气焓的压力修正 (kJ/kg)，对应维里方程的非理想项"""
+    return -_H_PRESSURE * (np.asarray(P, dtype=float) - 101325.0) / np.asarray(T, dtype=float) ** 2
+
+
+def _mixing_coefficient(T, P) -> np.ndarray:
+    """焓值中 W² 项的系数 (kJ/kg)，与压力成正比"""
+    t = np.asarray(T, dtype=float) - 273.15
+    return np.exp(_poly(_H_MIX, t)) * np.asarray(P, dtype=float) / 101325.0
+
+
+def _solve_humidity_ratio(c, b, k) -> np.ndarray:
+    """求 k·W² - b·W + c = 0 的物理根（数值稳定形式）"""
+    return 2.0 * c / (b + np.sqrt(np.maximum(b * b - 4.0 * k * c, 0.0)))
+
+
+def enthalpy(T, W, P) -> np.ndarray:
+    """比焓 (J/kg 干空气)"""
+    T = np.asarray(T, dtype=float)
+    t = T - 273.15
+    W = np.asarray(W, dtype=float)
+    vapor = _poly(_H_VAPOR, t) - W * _mixing_coefficient(T, P)
+    return (_poly(_H_DRY, t) + W * vapor + _pressure_correction(T, P)) * 1000.0
+
+
+def humidity_ratio_from_enthalpy(T, H, P) -> np.ndarray:
+    """由干球温度与比焓求含湿量"""
+    T = np.asarray(T, dtype=float)
+    t = T - 273.15
+    c = np.asarray(H, dtype=float) / 1000.0 - _poly(_H_DRY, t) - _pressure_correction(T, P)
+    return _solve_humidity_ratio(c, _poly(_H_VAPOR, t), _mixing_coefficient(T, P))
+
+
+def temperature_from_enthalpy(H, W, P) -> np.ndarray:
+    """由比焓与含湿量求干球温度 (K)，以 ASHRAE 显式公式为初值做牛顿迭代"""
+    W = np.asarray(W, dtype=float)
+    h = np.asarray(H, dtype=float) / 1000.0
+    t = (h - 2501.0 * W) / (1.006 + 1.86 * W)
+    dry_slope = tuple(i * c for i, c in enumerate(_H_DRY))[1:]
+    vapor_slope = tuple(i * c for i, c in enumerate(_H_VAPOR))[1:]
+    for _ in range(3):
+        residual = enthalpy(t + 273.15, W, P) / 1000.0 - h
+        t = t - residual / (_poly(dry_slope, t) + W * _poly(vapor_slope, t))
+    return t + 273.15
+
+
+def _condensate_enthalpy(B) -> np.ndarray:
+    """湿球处凝结水（0 °C 以下为冰）的比焓 (kJ/kg)"""
+    tw = np.asarray(B, dtype=float) - 273.15
+    return np.where(tw >= 0, 4.186 * tw, -333.4 + 2.1 * tw)
+
+
+def specific_volume(T, W, P) -> np.ndarray:
+    """比容 (m³/kg 干空气)"""
+    W = np.asarray(W, dtype=float)
+    return R_DA * np.asarray(T, dtype=float) * (1.0 + 1.607858 * W) / np.asarray(P, dtype=float)
+
+
+def humidity_ratio_from_volume(T, V, P) -> np.ndarray:
+    """由干球温度与比容求含湿量"""
+    T = np.asarray(T, dtype=float)
+    return (np.asarray(V, dtype=float) * np.asarray(P, dtype=float) / (R_DA * T) - 1.0) / 1.607858
+
+
+def humidity_ratio_from_wet_bulb(T, B, P) -> np.ndarray:
+    """绝热饱和能量平衡：由干球、湿球温度求含湿量"""
+    T = np.asarray(T, dtype=float)
+    B = np.asarray(B, dtype=float)
+    ws = saturation_humidity_ratio(B, P)
+    hl = _condensate_enthalpy(B)
+    t = T - 273.15
+    c = enthalpy(B, ws, P) / 1000.0 - _poly(_H_DRY, t) - _pressure_correction(T, P) - ws * hl
+    return _solve_humidity_ratio(c, _poly(_H_VAPOR, t) - hl, _mixing_coefficient(T, P))
+
+
+def temperature_from_wet_bulb(B, W, P) -> np.ndarray:
+    """绝热饱和能量平衡：由湿球温度与含湿量求干球温度 (K)"""
+    B = np.asarray(B, dtype=float)
+    W = np.asarray(W, dtype=float)
+    ws = saturation_humidity_ratio(B, P)
+    h = enthalpy(B, ws, P) - (ws - W) * _condensate_enthalpy(B) * 1000.0
+    return temperature_from_enthalpy(h, W, P)
+
+
+def _solve_bracketed(func, lo, hi, iterations: int = _SOLVER_ITERATIONS, xtol: float = 1e-6) -> np.ndarray:
+    """
+    向量化 Illinois 试位法，逐行求 func(x) = 0 在 [lo, hi] 内的根
+
+    func 在区间内单调即可（方向逐行自动判断），端点不变号的行返回 NaN。
+    """
+    lo = np.array(lo, dtype=float)
+    hi = np.array(hi, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        f_lo = func(lo)
+        f_hi = func(hi)
+        bracketed = np.sign(f_lo) * np.sign(f_hi) <= 0
+        x = 0.5 * (lo + hi)
+        side = np.zeros(lo.shape, dtype=np.int8)
+        for _ in range(iterations):
+            x_prev = x
+            x = (lo * f_hi - hi * f_lo) / (f_hi - f_lo)
+            x = np.where(np.isfinite(x) & (x >= np.minimum(lo, hi)) & (x <= np.maximum(lo, hi)),
+                         x, 0.5 * (lo + hi))
+            f_x = func(x)
+            keep_hi = np.sign(f_x) == np.sign(f_lo)
+            lo = np.where(keep_hi, x, lo)
+            f_lo = np.where(keep_hi, f_x, f_lo)
+            hi = np.where(keep_hi, hi, x)
+            f_hi = np.where(keep_hi, f_hi, f_x)
+            # 同一端点连续保留两次时将其函数值减半，避免试位法单侧收敛过慢
+            f_hi = np.where(keep_hi & (side == 1), 0.5 * f_hi, f_hi)
+            f_lo = np.where(~keep_hi & (side == -1), 0.5 * f_lo, f_lo)
+            side = np.where(keep_hi, 1, -1).astype(np.int8)
+            if not np.any(bracketed & (np.abs(x - x_prev) > xtol)):
+                break
+    return np.where(bracketed, x, np.nan)
+
+
+def wet_bulb_temperature(T, W, P) -> np.ndarray:
+    """由干球温度与含湿量求湿球温度 (K)"""
+    T = np.asarray(T, dtype=float)
+    W = np.asarray(W, dtype=float)
+    P = np.broadcast_to(np.asarray(P, dtype=float), T.shape)
+    lo = np.maximum(saturation_temperature(vapor_pressure(W, P), P) - 1.0, T_MIN)
+    lo = np.where(np.isnan(lo), T_MIN, lo)
+    # 冰点附近冰面/水面两支可能各有一个根，优先取水面解，无解的行再按冰面求解
+    twb = _solve_bracketed(lambda b: humidity_ratio_from_wet_bulb(T, b, P) - W,
+                           np.maximum(lo, T_TRIPLE), np.maximum(T, T_TRIPLE))
+    ice = np.isnan(twb) & (lo < T_TRIPLE)
+    if np.any(ice):
+        Ti, Wi, Pi = T[ice], W[ice], P[ice]
+        twb[ice] = _solve_bracketed(lambda b: humidity_ratio_from_wet_bulb(Ti, b, Pi) - Wi,
+                                    lo[ice], np.minimum(Ti, T_TRIPLE - 1e-9))
+    # 饱和状态下湿球温度等于干球温度
+    return np.where(np.isnan(twb) & np.isclose(relative_humidity(T, W, P), 1.0, atol=1e-6), T, twb)
+
+
+# --- 逆向求解：(H, R)、(B, R) ---
+
+def _enthalpy_slopes(T, W, P) -> Tuple[np.ndarray, np.ndarray]:
+    """比焓 (kJ/kg) 对温度与含湿量的偏导数（忽略压力修正项与混合系数随温度的变化）"""
+    t = T - 273.15
+    dry_slope = tuple(i * c for i, c in enumerate(_H_DRY))[1:]
+    vapor_slope = tuple(i * c for i, c in enumerate(_H_VAPOR))[1:]
+    dh_dT = _poly(dry_slope, t) + W * _poly(vapor_slope, t)
+    dh_dW = _poly(_H_VAPOR, t) - 2.0 * W * _mixing_coefficient(T, P)
+    return dh_dT, dh_dW
+
+
+def _rh_humidity_ratio(T, R, P) -> Tuple[np.ndarray, np.ndarray]:
+    """给定相对湿度时的含湿量及其对温度的导数"""
+    pw = R * _saturation_pw(T, P)
+    W = humidity_ratio_from_pw(pw, P)
+    # 增强因子随温度变化很小，导数中忽略
+    dW_dT = EPSILON * P / (P - pw) ** 2 * pw * _dln_pws_dT(T)
+    return W, dW_dT
+
+
+def _inverse_residual(values: Dict[str, np.ndarray], P: np.ndarray):
+    """
+    返回 residual(T, rows) -> (残差, 导数)，rows 为参与计算的行（None 表示全部）
+
+    (H, R): h(T, W_R(T)) - H，单位 kJ/kg，随 T 单调递增
+    (B, R): W_B(T) - W_R(T)，湿球线上的含湿量减去等相对湿度线上的含湿量，随 T 单调递减
+    """
+    R = values['R']
+    if 'H' in values:
+        H = values['H'] / 1000.0
+
+        def residual(T, rows=None):
+            R_, H_, P_ = (R, H, P) if rows is None else (R[rows], H[rows], P[rows])
+            W, dW_dT = _rh_humidity_ratio(T, R_, P_)
+            dh_dT, dh_dW = _enthalpy_slopes(T, W, P_)
+            return enthalpy(T, W, P_) / 1000.0 - H_, dh_dT + dh_dW * dW_dT
+    else:
+        B = values['B']
+
+        def residual(T, rows=None):
+            R_, B_, P_ = (R, B, P) if rows is None else (R[rows], B[rows], P[rows])
+            W_B = humidity_ratio_from_wet_bulb(T, B_, P_)
+            W_R, dWR_dT = _rh_humidity_ratio(T, R_, P_)
+            # 绝热饱和能量平衡对 T 隐式求导
+            dh_dT, dh_dW = _enthalpy_slopes(T, W_B, P_)
+            dWB_dT = -dh_dT / (dh_dW - _condensate_enthalpy(B_))
+            return W_B - W_R, dWB_dT - dWR_dT
+    return residual
+
+
+def solve_temperature(values: Dict[str, np.ndarray], P: np.ndarray,
+                      stride: int = ANCHOR_STRIDE) -> Tuple[np.ndarray, Dict[str, int]]:
+    """
+    (H, R) 或 (B, R) 输入下求干球温度 (K)
+
+    传感器数据在时间上连续，相邻点的解非常接近：每隔 stride 个点取一个锚点，用试位法在完整区间内求解，
+    其余点以前一个锚点的解为初值做牛顿迭代（解析导数），通常 2~3 次即收敛；
+    不收敛、越出求根区间的点改用试位法，仍无解的为 NaN（由 compute_batch 回退到 CoolProp）。
+
+    Returns:
+        (T, 统计)：统计含 points、anchors、newton（牛顿法收敛的点数）、iterations（牛顿迭代总次数）、
+        bracketed（改用试位法的点数）、failed（无解的点数）
+    """
+    pair = 'HR' if 'H' in values else 'BR'
+    values = {key: np.ravel(a).astype(float) for key, a in values.items()}
+    P = np.ravel(P).astype(float)
+    n = P.size
+    residual = _inverse_residual(values, P)
+    lo = values['B'] if pair == 'BR' else np.full(n, T_MIN)
+    hi = _temperature_upper_bound(values['R'], P)
+
+    def bracketed(rows):
+        return _solve_bracketed(lambda t: residual(t, rows)[0], lo[rows], hi[rows])
+
+    stride = max(1, stride)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        T = np.full(n, np.nan)
+        anchors = np.arange(0, n, stride)
+        T[anchors] = bracketed(anchors)
+        stats = {'points': n, 'anchors': anchors.size, 'newton': 0, 'iterations': 0, 'bracketed': 0, 'failed': 0}
+
+        # 非锚点以前一个锚点的解为初值
+        rows = np.flatnonzero(np.arange(n) % stride != 0)
+        guess = T[rows - rows % stride]
+        rows, x = rows[np.isfinite(guess)], guess[np.isfinite(guess)]
+        for _ in range(_NEWTON_ITERATIONS):
+            if rows.size == 0:
+                break
+            stats['iterations'] += rows.size
+            f, df = residual(x, rows)
+            step = f / df
+            x = np.clip(x - step, lo[rows], hi[rows])
+            done = np.abs(step) < _NEWTON_XTOL
+            T[rows[done]] = x[done]
+            stats['newton'] += int(done.sum())
+            keep = ~done & np.isfinite(x)
+            rows, x = rows[keep], x[keep]
+
+        rest = np.flatnonzero(np.isnan(T) & (np.arange(n) % stride != 0))
+        if rest.size:
+            T[rest] = bracketed(rest)
+            stats['bracketed'] = int(rest.size)
+    stats['failed'] = int(np.isnan(T).sum())
+    if record_solver is not None:
+        record_solver(pair, stats)
+    return T, stats
+
+
+# --- 状态求解 ---
+
+def _broadcast_inputs(inputs: Dict[str, Any], pressure) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    arrays = {key: np.atleast_1d(np.asarray(value, dtype=float)) for key, value in inputs.items()}
+    arrays['P'] = np.atleast_1d(np.asarray(pressure, dtype=float))
+    shape = np.broadcast_shapes(*(a.shape for a in arrays.values()))
+    arrays = {key: np.broadcast_to(a, shape) for key, a in arrays.items()}
+    return arrays, arrays.pop('P')
+
+
+def _temperature_upper_bound(R: np.ndarray, P: np.ndarray) -> np.ndarray:
+    """给定相对湿度时求根区间的干球温度上限：水蒸气分压取总压的一半（含湿量约 0.62 kg/kg）"""
+    with np.errstate(divide='ignore'):
+        limit = saturation_temperature(0.5 * P / np.maximum(R, 1e-9), P)
+    return np.where(np.isnan(limit), T_MAX, np.minimum(limit, T_MAX))
+
+
+def resolve_state(inputs: Dict[str, Any], pressure) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    把任意一对输入参数解析为标准状态 (T, W, P)
+
+    Args:
+        inputs: 恰好两个输入参数，键为 CoolProp 代码 (T/B/R/W/H/D)，值为标量或数组 (SI 单位)
+        pressure: 压力 (Pa)，标量或数组
+
+    Returns:
+        (T, W, P) 三个等长数组；无法求解的行为 NaN
+    """
+    codes = tuple(sorted(inputs))
+    if len(codes) != 2 or any(code not in SUPPORTED_INPUTS for code in codes):
+        raise ValueError(f"不支持的输入组合: {codes}")
+
+    values, P = _broadcast_inputs(inputs, pressure)
+    pair = set(codes)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # 含湿量可直接确定的组合
+        if 'D' in pair:
+            W_known = humidity_ratio_from_pw(_saturation_pw(values['D'], P), P)
+        elif 'W' in pair:
+            W_known = values['W']
+        else:
+            W_known = None
+
+        if 'T' in pair:
+            T = values['T']
+            other = (pair - {'T'}).pop()
+            if other in ('W', 'D'):
+                W = W_known
+            elif other == 'R':
+                W = humidity_ratio_from_rh(T, values['R'], P)
+            elif other == 'H':
+                W = humidity_ratio_from_enthalpy(T, values['H'], P)
+            else:  # 'B'
+                W = humidity_ratio_from_wet_bulb(T, values['B'], P)
+        elif W_known is not None:
+            if pair == {'W', 'D'}:
+                raise ValueError("含湿量(W)与露点温度(D)不是独立参数")
+            W = W_known
+            other = (pair - {'W', 'D'}).pop()
+            if other == 'H':
+                T = temperature_from_enthalpy(values['H'], W, P)
+            elif other == 'B':
+                T = temperature_from_wet_bulb(values['B'], W, P)
+            else:  # 'R'
+                T = saturation_temperature(vapor_pressure(W, P) / values['R'], P)
+        else:
+            # (B, R)、(H, R)：对干球温度做温启动牛顿迭代
+            if pair == {'B', 'H'}:
+                # 等湿球温度线与等焓线近似平行，关联式误差会被严重放大
+                raise ValueError("湿球温度(B)与焓值(H)组合需由 CoolProp 求解")
+            T = solve_temperature(values, P)[0].reshape(P.shape)
+            if pair == {'H', 'R'}:
+                W = humidity_ratio_from_rh(T, values['R'], P)
+            else:
+                W = humidity_ratio_from_wet_bulb(T, values['B'], P)
+
+        T = np.asarray(T, dtype=float)
+        W = np.asarray(W, dtype=float)
+        valid = (T >= T_MIN) & (T <= T_MAX) & (W >= 0) & np.isfinite(W)
+        valid &= relative_humidity(T, W, P) <= 1.0 + 1e-6
+        T = np.where(valid, T, np.nan)
+        W = np.where(valid, W, np.nan)
+    return T, W, np.array(P, dtype=float)
+
+
+def derive_properties(T, W, P) -> Dict[str, np.ndarray]:
+    """由标准状态 (T, W, P) 推导全部输出列（输出单位同 calculate_properties）"""
+    T = np.asarray(T, dtype=float)
+    W = np.asarray(W, dtype=float)
+    P = np.broadcast_to(np.asarray(P, dtype=float), T.shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rh = np.minimum(relative_humidity(T, W, P), 1.0)
+        tdp = np.minimum(saturation_temperature(vapor_pressure(W, P), P), T)
+        twb = wet_bulb_temperature(T, W, P)
+        return {
+            'tdb': T - 273.15,
+            'twb': twb - 273.15,
+            'rh': rh * 100.0,
+            'w': W * 1000.0,
+            'h': enthalpy(T, W, P) / 1000.0,
+            'tdp': tdp - 273.15,
+        }
+
+
+# --- CoolProp 回退 ---
+
+def _haprops(output: str, *args) -> float:
+    """调用 HAPropsSI，并按输出代码记录调用次数与耗时"""
+    import CoolProp.HumidAirProp as HA
+
+    if record_haprops is None:
+        return HA.HAPropsSI(output, *args)
+    started = time.perf_counter()
+    try:
+        return HA.HAPropsSI(output, *args)
+    finally:
+        record_haprops(output, time.perf_counter() - started)
+
+
+def coolprop_state(props: Dict[str, float]) -> Tuple[float, float, float]:
+    """
+    使用 CoolProp 把任意输入组合解析为标准状态 (T, W, P)，失败时抛出异常
+
+    对非 (T, W) 输入最多做两次迭代求解，后续属性均由该状态显式推导。
+    """
+    args = []
+    for key, value in props.items():
+        args.extend([key, value])
+
+    T = props['T'] if 'T' in props else _haprops('T', *args)
+    W = props['W'] if 'W' in props else _haprops('W', *args)
+    return float(T), float(W), float(props['P'])
+
+
+def coolprop_derive(T: float, W: float, P: float) -> Dict[str, float]:
+    """使用 CoolProp 由标准状态 (T, W, P) 推导全部输出（输出单位同 calculate_properties）"""
+    args = ('T', T, 'W', W, 'P', P)
+    return {
+        'tdb': T - 273.15,
+        'twb': _haprops('B', *args) - 273.15,
+        'rh': _haprops('R', *args) * 100,
+        'w': W * 1000,
+        'h': _haprops('H', *args) / 1000,
+        'tdp': _haprops('D', *args) - 273.15,
+    }
+
+
+def coolprop_point(props: Dict[str, float]) -> Dict[str, float]:
+    """使用 CoolProp 计算单个点：先解析标准状态，再推导全部输出"""
+    T, W, P = coolprop_state(props)
+    point = coolprop_derive(T, W, P)
+    point.update({'T': T, 'W': W, 'P': P})
+    return point
+
+
+# --- 单点标量路径 ---
+# 单个状态点（如 /calculate 未命中缓存）按与上面相同的关联式逐个标量计算：
+# 对长度为 1 的数组，每次 NumPy 运算的固定开销远大于计算本身，试位法的数十次迭代尤为明显。
+# 标量路径求解失败（无解、越界、数值异常）时返回 None，由向量化路径按原逻辑处理（含 CoolProp 回退）。
+
+def _s_ln_pws(T: float) -> float:
+    T2 = T * T
+    if T < T_TRIPLE:
+        c = _C_ICE
+        return c[0] / T + c[1] + c[2] * T + c[3] * T2 + c[4] * T2 * T + c[5] * T2 * T2 + c[6] * math.log(T)
+    c = _C_WATER
+    return c[0] / T + c[1] + c[2] * T + c[3] * T2 + c[4] * T2 * T + c[5] * math.log(T)
+
+
+def _s_dln_pws_dT(T: float) -> float:
+    T2 = T * T
+    if T < T_TRIPLE:
+        c = _C_ICE
+        return -c[0] / T2 + c[2] + 2 * c[3] * T + 3 * c[4] * T2 + 4 * c[5] * T2 * T + c[6] / T
+    c = _C_WATER
+    return -c[0] / T2 + c[2] + 2 * c[3] * T + 3 * c[4] * T2 + c[5] / T
+
+
+def _s_enhancement_factor(T: float, P: float, pws: float) -> float:
+    t = min(max(T - 273.15, -100.0), 100.0)
+    if T < T_TRIPLE:
+        a, b = _poly(_F_ALPHA_ICE, t), math.exp(_poly(_F_BETA_ICE, t))
+    else:
+        a, b = _poly(_F_ALPHA_WATER, t), math.exp(_poly(_F_BETA_WATER, t))
+    return math.exp(a * (1.0 - pws / P) + b * (P / pws - 1.0)) + _F_OFFSET
+
+
+def _s_saturation_pw(T: float, P: float) -> float:
+    pws = math.exp(_s_ln_pws(T))
+    return _s_enhancement_factor(T, P, pws) * pws
+
+
+def _s_saturation_temperature(pw: float, P: float) -> float:
+    if not pw > 0:
+        return math.nan
+    g = math.log(max(pw, 1e-12) / 611.2)
+    T = min(max(273.15 + 243.12 * g / (17.62 - g), T_MIN), T_MAX)
+    target = math.log(pw)
+    for _ in range(4):
+        ln_pws = _s_ln_pws(T)
+        f = _s_enhancement_factor(T, P, math.exp(ln_pws))
+        T = min(max(T - (ln_pws + math.log(f) - target) / _s_dln_pws_dT(T), T_MIN), T_MAX)
+    return T
+
+
+def _s_vapor_pressure(W: float, P: float) -> float:
+    return W * P / (EPSILON + W)
+
+
+def _s_humidity_ratio_from_pw(pw: float, P: float) -> float:
+    return EPSILON * pw / (P - pw)
+
+
+def _s_relative_humidity(T: float, W: float, P: float) -> float:
+    return _s_vapor_pressure(W, P) / _s_saturation_pw(T, P)
+
+
+def _s_pressure_correction(T: float, P: float) -> float:
+    return -_H_PRESSURE * (P - 101325.0) / (T * T)
+
+
+def _s_mixing_coefficient(T: float, P: float) -> float:
+    return math.exp(_poly(_H_MIX, T - 273.15)) * P / 101325.0
+
+
+def _s_solve_humidity_ratio(c: float, b: float, k: float) -> float:
+    return 2.0 * c / (b + math.sqrt(max(b * b - 4.0 * k * c, 0.0)))
+
+
+def _s_enthalpy(T: float, W: float, P: float) -> float:
+    t = T - 273.15
+    vapor = _poly(_H_VAPOR, t) - W * _s_mixing_coefficient(T, P)
+    return (_poly(_H_DRY, t) + W * vapor + _s_pressure_correction(T, P)) * 1000.0
+
+
+def _s_humidity_ratio_from_enthalpy(T: float, H: float, P: float) -> float:
+    t = T - 273.15
+    c = H / 1000.0 - _poly(_H_DRY, t) - _s_pressure_correction(T, P)
+    return _s_solve_humidity_ratio(c, _poly(_H_VAPOR, t), _s_mixing_coefficient(T, P))
+
+
+def _s_temperature_from_enthalpy(H: float, W: float, P: float) -> float:
+    h = H / 1000.0
+    t = (h - 2501.0 * W) / (1.006 + 1.86 * W)
+    for _ in range(3):
+        residual = _s_enthalpy(t + 273.15, W, P) / 1000.0 - h
+        t = t - residual / (_poly(_H_DRY_SLOPE, t) + W * _poly(_H_VAPOR_SLOPE, t))
+    return t + 273.15
+
+
+def _s_condensate_enthalpy(B: float) -> float:
+    tw = B - 273.15
+    return 4.186 * tw if tw >= 0 else -333.4 + 2.1 * tw
+
+
+def _s_humidity_ratio_from_wet_bulb(T: float, B: float, P: float) -> float:
+    ws = _s_humidity_ratio_from_pw(_s_saturation_pw(B, P), P)
+    hl = _s_condensate_enthalpy(B)
+    t = T - 273.15
+    c = _s_enthalpy(B, ws, P) / 1000.0 - _poly(_H_DRY, t) - _s_pressure_correction(T, P) - ws * hl
+    return _s_solve_humidity_ratio(c, _poly(_H_VAPOR, t) - hl, _s_mixing_coefficient(T, P))
+
+
+def _s_temperature_from_wet_bulb(B: float, W: float, P: float) -> float:
+    ws = _s_humidity_ratio_from_pw(_s_saturation_pw(B, P), P)
+    h = _s_enthalpy(B, ws, P) - (ws - W) * _s_condensate_enthalpy(B) * 1000.0
+    return _s_temperature_from_enthalpy(h, W, P)
+
+
+def _s_newton(func, x: float, lo: float, hi: float, iterations: int = _NEWTON_ITERATIONS,
+              xtol: float = _NEWTON_XTOL) -> float:
+    """
+    在 [lo, hi] 内以 x 为初值做牛顿迭代，func(x) 返回 (残差, 导数)；
+    不收敛或导数为零时返回 NaN，由调用方改用试位法
+    """
+    for _ in range(iterations):
+        f, df = func(x)
+        step = f / df
+        x = min(max(x - step, lo), hi)
+        if abs(step) < xtol:
+            return x
+    return math.nan
+
+
+def _s_solve_bracketed(func, lo: float, hi: float, iterations: int = _SOLVER_ITERATIONS,
+                       xtol: float = 1e-6) -> float:
+    """标量 Illinois 试位法，逻辑同 _solve_bracketed"""
+    f_lo, f_hi = func(lo), func(hi)
+    if not f_lo * f_hi <= 0:
+        return math.nan
+    x = 0.5 * (lo + hi)
+    side = 0
+    for _ in range(iterations):
+        x_prev = x
+        x = (lo * f_hi - hi * f_lo) / (f_hi - f_lo) if f_hi != f_lo else math.nan
+        if not (math.isfinite(x) and min(lo, hi) <= x <= max(lo, hi)):
+            x = 0.5 * (lo + hi)
+        f_x = func(x)
+        if (f_x > 0) == (f_lo > 0) and (f_x < 0) == (f_lo < 0):
+            lo, f_lo = x, f_x
+            if side == 1:
+                f_hi *= 0.5
+            side = 1
+        else:
+            hi, f_hi = x, f_x
+            if side == -1:
+                f_lo *= 0.5
+            side = -1
+        if not abs(x - x_prev) > xtol:
+            break
+    return x
+
+
+def _s_wet_bulb_slope(T: float, B: float, P: float) -> Tuple[float, float]:
+    """湿球线上含湿量 W_B(T, B) 及其对 B 的导数（对绝热饱和能量平衡隐式求导）"""
+    pw = _s_saturation_pw(B, P)
+    ws = _s_humidity_ratio_from_pw(pw, P)
+    W = _s_humidity_ratio_from_wet_bulb(T, B, P)
+    hl = _s_condensate_enthalpy(B)
+    tb, t = B - 273.15, T - 273.15
+    # d/dB [h(B, ws) - ws·hl] 与 d/dW [h(T, W) - W·hl]
+    dws_dB = EPSILON * P / (P - pw) ** 2 * pw * _s_dln_pws_dT(B)
+    dhl_dB = 4.186 if tb >= 0 else 2.1
+    dh_dT_B = _poly(_H_DRY_SLOPE, tb) + ws * _poly(_H_VAPOR_SLOPE, tb)
+    dh_dW_B = _poly(_H_VAPOR, tb) - 2.0 * ws * _s_mixing_coefficient(B, P)
+    dh_dW_T = _poly(_H_VAPOR, t) - 2.0 * W * _s_mixing_coefficient(T, P)
+    numerator = dh_dT_B + (dh_dW_B - hl) * dws_dB - (ws - W) * dhl_dB
+    return W, numerator / (dh_dW_T - hl)
+
+
+def _s_wet_bulb_temperature(T: float, W: float, P: float) -> float:
+    """
+    湿球温度：以露点为初值做牛顿迭代（解析导数，通常 3~4 次收敛）；
+    落在冰点附近 ±1 K 或不收敛时按 wet_bulb_temperature 的区间与分支规则改用试位法
+    """
+    dew = _s_saturation_temperature(_s_vapor_pressure(W, P), P)
+    lo = T_MIN if math.isnan(dew) else max(dew - 1.0, T_MIN)
+    twb = math.nan
+    if lo >= T_TRIPLE + WET_BULB_FREEZING_BAND:
+        def residual(b):
+            W_B, dW_dB = _s_wet_bulb_slope(T, b, P)
+            return W_B - W, dW_dB
+        twb = _s_newton(residual, min(max(dew, lo), T), lo, max(T, lo))
+    if math.isnan(twb):
+        twb = _s_solve_bracketed(lambda b: _s_humidity_ratio_from_wet_bulb(T, b, P) - W,
+                                 max(lo, T_TRIPLE), max(T, T_TRIPLE))
+    if math.isnan(twb) and lo < T_TRIPLE:
+        twb = _s_solve_bracketed(lambda b: _s_humidity_ratio_from_wet_bulb(T, b, P) - W,
+                                 lo, min(T, T_TRIPLE - 1e-9))
+    if math.isnan(twb) and abs(_s_relative_humidity(T, W, P) - 1.0) <= 1e-6 + 1e-5:
+        return T
+    return twb
+
+
+def _s_inverse_residual(pair: str, values: Dict[str, float], P: float):
+    """_inverse_residual 的标量版本"""
+    R = values['R']
+
+    def rh_humidity_ratio(T):
+        pw = R * _s_saturation_pw(T, P)
+        return _s_humidity_ratio_from_pw(pw, P), EPSILON * P / (P - pw) ** 2 * pw * _s_dln_pws_dT(T)
+
+    def slopes(T, W):
+        t = T - 273.15
+        return (_poly(_H_DRY_SLOPE, t) + W * _poly(_H_VAPOR_SLOPE, t),
+                _poly(_H_VAPOR, t) - 2.0 * W * _s_mixing_coefficient(T, P))
+
+    if pair == 'HR':
+        H = values['H'] / 1000.0
+
+        def residual(T):
+            W, dW_dT = rh_humidity_ratio(T)
+            dh_dT, dh_dW = slopes(T, W)
+            return _s_enthalpy(T, W, P) / 1000.0 - H, dh_dT + dh_dW * dW_dT
+    else:
+        B = values['B']
+
+        def residual(T):
+            W_B = _s_humidity_ratio_from_wet_bulb(T, B, P)
+            W_R, dWR_dT = rh_humidity_ratio(T)
+            dh_dT, dh_dW = slopes(T, W_B)
+            return W_B - W_R, -dh_dT / (dh_dW - _s_condensate_enthalpy(B)) - dWR_dT
+    return residual
+
+
+def _s_resolve_state(values: Dict[str, float], P: float) -> Tuple[float, float]:
+    """resolve_state 的标量版本，返回 (T, W)；无解时为 NaN"""
+    pair = set(values)
+    if 'D' in pair:
+        W_known = _s_humidity_ratio_from_pw(_s_saturation_pw(values['D'], P), P)
+    elif 'W' in pair:
+        W_known = values['W']
+    else:
+        W_known = None
+
+    if 'T' in pair:
+        T = values['T']
+        other = (pair - {'T'}).pop()
+        if other in ('W', 'D'):
+            W = W_known
+        elif other == 'R':
+            W = _s_humidity_ratio_from_pw(values['R'] * _s_saturation_pw(T, P), P)
+        elif other == 'H':
+            W = _s_humidity_ratio_from_enthalpy(T, values['H'], P)
+        else:
+            W = _s_humidity_ratio_from_wet_bulb(T, values['B'], P)
+    elif W_known is not None:
+        W = W_known
+        other = (pair - {'W', 'D'}).pop()
+        if other == 'H':
+            T = _s_temperature_from_enthalpy(values['H'], W, P)
+        elif other == 'B':
+            T = _s_temperature_from_wet_bulb(values['B'], W, P)
+        else:
+            T = _s_saturation_temperature(_s_vapor_pressure(W, P) / values['R'], P)
+    else:
+        # (H, R)、(B, R)：与 solve_temperature 的锚点相同，在完整区间内用试位法求解
+        code = 'HR' if 'H' in pair else 'BR'
+        lo = values['B'] if code == 'BR' else T_MIN
+        limit = _s_saturation_temperature(0.5 * P / max(values['R'], 1e-9), P)
+        hi = T_MAX if math.isnan(limit) else min(limit, T_MAX)
+        residual = _s_inverse_residual(code, values, P)
+        T = _s_solve_bracketed(lambda t: residual(t)[0], lo, hi)
+        if record_solver is not None:
+            record_solver(code, {'points': 1, 'anchors': 1, 'newton': 0, 'iterations': 0, 'bracketed': 0,
+                                 'failed': int(math.isnan(T))})
+        if code == 'HR':
+            W = _s_humidity_ratio_from_pw(values['R'] * _s_saturation_pw(T, P), P)
+        else:
+            W = _s_humidity_ratio_from_wet_bulb(T, values['B'], P)
+
+    if not (T_MIN <= T <= T_MAX and W >= 0 and math.isfinite(W)):
+        return math.nan, math.nan
+    if not _s_relative_humidity(T, W, P) <= 1.0 + 1e-6:
+        return math.nan, math.nan
+    return T, W
+
+
+def _scalar_values(inputs: Dict[str, Any], pressure) -> Optional[Tuple[Dict[str, float], float]]:
+    """单个状态点（标量或长度为 1 的列表）时返回 (输入, 压力) 的 float 值，否则返回 None"""
+    def scalar(value):
+        if isinstance(value, (float, int)):
+            return float(value)
+        if isinstance(value, (list, tuple)) and len(value) == 1 and isinstance(value[0], (float, int)):
+            return float(value[0])
+        return None
+
+    values = {key: scalar(value) for key, value in inputs.items()}
+    P = scalar(pressure)
+    if P is None or any(value is None for value in values.values()):
+        return None
+    return values, P
+
+
+def compute_point(inputs: Dict[str, float], pressure: float) -> Optional[Dict[str, float]]:
+    """
+    单点标量计算，输出列同 compute_batch（tdb/twb/rh/w/h/tdp 与 T/W/P）
+
+    不支持的组合、(B, H) 以及任何求解失败的情况返回 None，调用方改用向量化路径。
+    """
+    codes = set(inputs)
+    if len(codes) != 2 or not codes <= set(SUPPORTED_INPUTS) or codes in ({'B', 'H'}, {'W', 'D'}):
+        return None
+    try:
+        T, W = _s_resolve_state(inputs, pressure)
+        if math.isnan(T):
+            return None
+        P = pressure
+        rh = min(_s_relative_humidity(T, W, P), 1.0)
+        tdp = min(_s_saturation_temperature(_s_vapor_pressure(W, P), P), T)
+        twb = _s_wet_bulb_temperature(T, W, P)
+        point = {
+            'tdb': T - 273.15,
+            'twb': twb - 273.15,
+            'rh': rh * 100.0,
+            'w': W * 1000.0,
+            'h': _s_enthalpy(T, W, P) / 1000.0,
+            'tdp': tdp - 273.15,
+            'T': T, 'W': W, 'P': P,
+        }
+    except (ArithmeticError, ValueError):
+        return None
+    if not all(math.isfinite(value) for value in point.values()):
+        return None
+    return point
+
+
+def compute_batch(inputs: Dict[str, Any], pressure, fallback: bool = True) -> Dict[str, Any]:
+    """
+    批量计算湿空气参数
+
+    Args:
+        inputs: 两个输入参数的数组，如 {'T': [...], 'R': [...]} (SI 单位)；
+            单个状态点先走 compute_point 标量路径
+        pressure: 压力 (Pa)，标量或数组
+        fallback: 向量化求解失败的行是否回退到 CoolProp 逐点计算
+
+    Returns:
+        列式结果字典：tdb/twb/rh/w/h/tdp 为 float 数组，T/W/P 为标准状态 (SI 单位)，
+        success 为 bool 数组，error 为每行的错误信息 (成功为 None)
+    """
+    single = _scalar_values(inputs, pressure)
+    point = compute_point(*single) if single is not None else None
+    if point is not None:
+        columns = {name: np.array([point[name]]) for name in OUTPUT_COLUMNS + STATE_COLUMNS}
+        columns['success'] = np.ones(1, dtype=bool)
+        columns['error'] = [None]
+        return columns
+
+    values, P = _broadcast_inputs(inputs, pressure)
+    n = P.size
+    columns = {name: np.full(n, np.nan) for name in OUTPUT_COLUMNS + STATE_COLUMNS}
+    errors: List[Optional[str]] = [None] * n
+
+    try:
+        T, W, P_state = resolve_state(values, P)
+        derived = derive_properties(T, W, P_state)
+        derived.update({'T': T, 'W': W, 'P': P_state})
+        for name in OUTPUT_COLUMNS + STATE_COLUMNS:
+            columns[name] = np.ravel(derived[name]).astype(float)
+    except ValueError as e:
+        # 不支持的组合：整批回退
+        if not fallback:
+            errors = [str(e)] * n
+
+    success = np.ones(n, dtype=bool)
+    for name in OUTPUT_COLUMNS:
+        success &= np.isfinite(columns[name])
+
+    failed = np.flatnonzero(~success)
+    if failed.size and fallback:
+        flat = {key: np.ravel(a) for key, a in values.items()}
+        flat_p = np.ravel(P)
+        for i in failed:
+            props = {'P': float(flat_p[i])}
+            props.update({key: float(a[i]) for key, a in flat.items()})
+            try:
+                point = coolprop_point(props)
+                for name in OUTPUT_COLUMNS + STATE_COLUMNS:
+                    columns[name][i] = point[name]
+                success[i] = True
+            except Exception as e:
+                errors[i] = str(e)
+    else:
+        for i in failed:
+            errors[i] = errors[i] or "超出向量化关联式的适用范围"
+
+    columns['success'] = success
+    columns['error'] = errors
+    return columns
+
+
+def _isoline_values(start: float, stop: float, step: float) -> np.ndarray:
+    """start~stop（含端点）按 step 取等值线的取值，去除浮点误差"""
+    count = int(np.floor((stop - start) / step + 1e-9)) + 1
+    return np.round(start + step * np.arange(max(count, 0)), 6)
+
+
+def isoline_table(pressure: float, t_min: float = -10.0, t_max: float = 50.0, t_step: float = 0.5,
+                  rh_step: float = 10.0, h_min: float = 0.0, h_max: float = 120.0, h_step: float = 10.0,
+                  twb_min: float = -10.0, twb_max: float = 35.0, twb_step: float = 5.0,
+                  v_min: float = 0.75, v_max: float = 0.95, v_step: float = 0.01,
+                  w_max: float = 30.0) -> Dict[str, Any]:
+    """
+    按列计算焓湿图背景等值线
+
+    所有曲线共用同一条干球温度轴 ``tdb`` (°C)，每条曲线给出与之逐一对应的含湿量 (g/kg)；
+    超出饱和线、小于 0 或大于 w_max 的位置为 NaN，客户端按 null 断开绘制即可。
+
+    Args:
+        pressure: 大气压力 (Pa)
+        t_min, t_max, t_step: 干球温度轴范围与步长 (°C)
+        rh_step: 等相对湿度线间隔 (%)，不含 100%（即饱和线）
+        h_min, h_max, h_step: 等焓线范围与间隔 (kJ/kg)
+        twb_min, twb_max, twb_step: 等湿球温度线范围与间隔 (°C)
+        v_min, v_max, v_step: 等比容线范围与间隔 (m³/kg)
+        w_max: 含湿量上限 (g/kg)
+
+    Returns:
+        {'tdb': ndarray, 'saturation': ndarray, 'rh': {值: ndarray}, 'enthalpy': {...},
+         'wet_bulb': {...}, 'volume': {...}}
+    """
+    if t_step <= 0 or t_max <= t_min:
+        raise ValueError("温度范围无效")
+    tdb = _isoline_values(t_min, t_max, t_step)
+    T = tdb + 273.15
+    w_sat = saturation_humidity_ratio(T, pressure)
+    w_cap = np.minimum(w_sat, w_max / 1000.0)
+
+    def clip(w):
+        w = np.where((w >= 0.0) & (w <= w_cap * (1.0 + 1e-9)), w, np.nan)
+        return w * 1000.0
+
+    table = {
+        'tdb': tdb,
+        'saturation': np.where(w_sat <= w_max / 1000.0, w_sat * 1000.0, np.nan),
+        'rh': {}, 'enthalpy': {}, 'wet_bulb': {}, 'volume': {},
+    }
+    if rh_step > 0:
+        for rh in _isoline_values(rh_step, 100.0 - 1e-6, rh_step):
+            table['rh'][rh] = clip(humidity_ratio_from_rh(T, rh / 100.0, pressure))
+    if h_step > 0:
+        for h in _isoline_values(h_min, h_max, h_step):
+            table['enthalpy'][h] = clip(humidity_ratio_from_enthalpy(T, h * 1000.0, pressure))
+    if twb_step > 0:
+        for twb in _isoline_values(twb_min, twb_max, twb_step):
+            w = humidity_ratio_from_wet_bulb(T, twb + 273.15, pressure)
+            table['wet_bulb'][twb] = clip(np.where(tdb >= twb, w, np.nan))
+    if v_step > 0:
+        for v in _isoline_values(v_min, v_max, v_step):
+            table['volume'][v] = clip(humidity_ratio_from_volume(T, v, pressure))
+    return table
+
+
+def validate_against_coolprop(samples: int = 2000, seed: int = 0) -> Dict[str, float]:
+    """
+    随机抽样与 CoolProp 对比，返回各输出列的最大绝对偏差
+
+    覆盖 (T,R) (T,W) (T,B) (T,H) (T,D) (H,R) (B,R) (W,R) (H,W) 等输入组合；
+    湿球温度落在 WET_BULB_FREEZING_BAND 内的样本不计入 twb 偏差。
+    """
+    import CoolProp.HumidAirProp as HA
+
+    rng = np.random.default_rng(seed)
+    T = rng.uniform(273.15 - 30, 273.15 + 50, samples)
+    R = rng.uniform(0.05, 1.0, samples)
+    P = rng.uniform(70000, 110000, samples)
+
+    ref = {code: np.array([HA.HAPropsSI(code, 'T', t, 'P', p, 'R', r) for t, r, p in zip(T, R, P)])
+           for code in ('W', 'H', 'B', 'D')}
+    ref['T'], ref['R'] = T, R
+    expected = {
+        'tdb': T - 273.15, 'twb': ref['B'] - 273.15, 'rh': R * 100.0,
+        'w': ref['W'] * 1000.0, 'h': ref['H'] / 1000.0, 'tdp': ref['D'] - 273.15,
+    }
+
+    comparable = {name: np.ones(samples, dtype=bool) for name in OUTPUT_COLUMNS}
+    comparable['twb'] = np.abs(expected['twb']) > WET_BULB_FREEZING_BAND
+
+    max_error = {name: 0.0 for name in OUTPUT_COLUMNS}
+    pairs = [('T', 'R'), ('T', 'W'), ('T', 'B'), ('T', 'H'), ('T', 'D'),
+             ('H', 'R'), ('B', 'R'), ('R', 'W'), ('H', 'W'), ('B', 'W'), ('D', 'R'), ('D', 'H')]
+    for a, b in pairs:
+        result = compute_batch({a: ref[a], b: ref[b]}, P, fallback=False)
+        for name in OUTPUT_COLUMNS:
+            mask = comparable[name]
+            error = np.nanmax(np.abs(result[name][mask] - expected[name][mask]))
+            max_error[name] = max(max_error[name], float(error))
+    return max_error
+
+
+if __name__ == "__main__":
+    report = validate_against_coolprop()
+    for column, error in report.items():
+        status = "OK" if error <= COOLPROP_TOLERANCE[column] else "超差"
+        print(f"{column:>4}: 最大偏差 {error:.4f} (允许 {COOLPROP_TOLERANCE[column]}) {status}")
@@ -0,0 +1,396 @@
+# benchmark.py - 热点路径基准测试
+"""
+离线、可复现的基准测试，覆盖计算核心、缓存与全部 HTTP 接口：
+
+- calculator/<输入组合>:       calculate_properties 各输入参数组合（绕过结果缓存）
+- multiple/<点数>:             calculate_multiple_points，1 / 100 / 10k / 100k 个点
+- inverse/<组合>-<点数>:       (H,R)、(B,R) 输入的整批求解（连续变化的传感器序列，温启动牛顿法）
+- chart/cold|overlay|warm:     create_psych_chart 冷启动、复用背景只绘叠加层、命中图片缓存
+- cache/hit|miss:              cache_result 装饰器的命中与未命中路径
+- weather/epw-8760:            全年逐时气象文件的解析与焓湿分析
+- http/<方法 路径>:            经 FastAPI TestClient 在进程内请求每个接口（需要 httpx）
+
+用法::
+
+    python benchmark.py --output result.json                # 运行并保存结果
+    python benchmark.py --baseline baseline.json            # 与基线比较，超过阈值时退出码为 1
+    python benchmark.py --filter '^multiple/' --quick       # 只跑部分用例、缩短测量时间
+
+每个用例先自动确定单次测量的调用次数（总耗时不少于 min_time），再重复测量 repeat 次，
+记录每次调用耗时的中位数与最小值；回归判定使用中位数。随机输入使用固定种子。
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# 默认回归阈值：中位数比基线慢 25% 以上视为回归
+DEFAULT_THRESHOLD = 0.25
+
+# 参考状态：25 °C、50% RH、标准大气压
+_REFERENCE = {'T': 298.15, 'R': 0.5}
+_PRESSURE = 101325.0
+
+INPUT_PAIRS = (('T', 'R'), ('T', 'W'), ('T', 'B'), ('T', 'H'), ('T', 'D'),
+               ('H', 'R'), ('B', 'R'), ('R', 'W'), ('H', 'W'), ('B', 'W'),
+               ('D', 'R'), ('D', 'H'))
+
+POINT_COUNTS = (1, 100, 10000, 100000)
+
+
+def _reference_inputs() -> Dict[str, float]:
+    """参考状态下全部输入参数的值 (SI 单位)"""
+    import batch_engine
+
+    state = batch_engine.compute_batch(dict(_REFERENCE), _PRESSURE)
+    return {
+        'T': _REFERENCE['T'], 'R': _REFERENCE['R'],
+        'W': float(state['W'][0]),
+        'B': float(state['twb'][0]) + 273.15,
+        'H': float(state['h'][0]) * 1000.0,
+        'D': float(state['tdp'][0]) + 273.15,
+    }
+
+
+def _random_points(count: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    T = rng.uniform(273.15 - 10, 273.15 + 40, count)
+    R = rng.uniform(0.1, 0.95, count)
+    return [{'name': f'P{i}', 'inputs': {'T': float(t), 'R': float(r)}} for i, (t, r) in enumerate(zip(T, R))]
+
+
+# --- 用例 ---
+# 每个用例生成 (名称, 无参函数)，函数每调用一次即完成一次被测操作
+
+def calculator_cases() -> Iterator[Tuple[str, Callable[[], Any]]]:
+    from calculator import calculate_properties
+
+    compute = getattr(calculate_properties, '__wrapped__', calculate_properties)
+    values = _reference_inputs()
+    for a, b in INPUT_PAIRS:
+        props = {'P': _PRESSURE, a: values[a], b: values[b]}
+
+        # 失败时抛出，避免把错误路径的耗时当作计算耗时
+        def call(props=props):
+            result = compute(props)
+            if not result['success']:
+                raise RuntimeError(f"{sorted(props)} 计算失败: {result['error']}")
+            return result
+        yield f'calculator/{a}-{b}', call
+
+
+def multiple_cases() -> Iterator[Tuple[str, Callable[[], Any]]]:
+    from calculator import calculate_multiple_points
+
+    for count in POINT_COUNTS:
+        points = _random_points(count)
+        yield f'multiple/{count}', lambda points=points: calculate_multiple_points(points, _PRESSURE)
+
+
+def inverse_cases() -> Iterator[Tuple[str, Callable[[], Any]]]:
+    import batch_engine
+
+    # 平滑变化的温湿度序列，模拟按时间排序的传感器数据
+    n = 100000
+    phase = np.linspace(0.0, 1.0, n)
+    T = 293.15 + 8.0 * np.sin(2 * np.pi * 20 * phase)
+    R = 0.5 + 0.2 * np.cos(2 * np.pi * 13 * phase)
+    W = batch_engine.humidity_ratio_from_rh(T, R, _PRESSURE)
+    inputs = {'HR': {'H': batch_engine.enthalpy(T, W, _PRESSURE), 'R': R},
+              'BR': {'B': batch_engine.wet_bulb_temperature(T, W, _PRESSURE), 'R': R}}
+    for name, values in inputs.items():
+        yield f'inverse/{name}-{n}', lambda values=values: batch_engine.resolve_state(values, _PRESSURE)
+
+
+def chart_cases() -> Iterator[Tuple[str, Callable[[], Any]]]:
+    import calculator
+
+    points = [{'name': 'A', 'tdb': 25.0, 'w': 10.0, 'color': 'blue'},
+              {'name': 'B', 'tdb': 15.0, 'w': 6.0, 'color': 'red'}]
+    lines = [{'from': 'A', 'to': 'B', 'label': '冷却', 'color': 'green'}]
+    counter = iter(range(10 ** 9))
+
+    def cold():
+        calculator._chart_backgrounds.clear()
+        calculator._chart_images.clear()
+        return calculator.create_psych_chart(_PRESSURE, points, lines)
+
+    def overlay():
+        # 背景已缓存，点的位置每次不同，必须重新绘制叠加层
+        moved = [dict(points[0], tdb=20.0 + next(counter) % 1000 / 100.0), points[1]]
+        return calculator.create_psych_chart(_PRESSURE, moved, lines)
+
+    yield 'chart/cold', cold
+    yield 'chart/overlay', overlay
+    yield 'chart/warm', lambda: calculator.create_psych_chart(_PRESSURE, points, lines)
+
+
+def cache_cases() -> Iterator[Tuple[str, Callable[[], Any]]]:
+    from performance import ServerlessOptimizer
+
+    optimizer = ServerlessOptimizer(cache_capacity=4096)
+
+    @optimizer.cache_function_result(expire_time=600, key_func=lambda x: x)
+    def identity(x):
+        return x
+
+    counter = iter(range(10 ** 12))
+    identity(0)
+    yield 'cache/hit', lambda: identity(0)
+    yield 'cache/miss', lambda: identity(next(counter) + 1)
+
+
+def http_cases() -> Iterator[Tuple[str, Callable[[], Any]]]:
+    try:
+        from fastapi.testclient import TestClient
+    except (ImportError, RuntimeError) as e:
+        print(f"跳过 HTTP 用例（TestClient 不可用: {e}）")
+        return
+    import main_app
+
+    client = TestClient(main_app.app)
+    points = [{'name': p['name'], 'inputs': p['inputs']} for p in _random_points(20)]
+    chart = {'pressure': _PRESSURE, 'points': points[:3],
+             'process_lines': [{'from_point': 'P0', 'to_point': 'P1'}]}
+    stream_body = ''.join(json.dumps(p['inputs']) + '\n' for p in _random_points(1000))
+    comfort = {'name': 'bench-comfort', 'tdb_min': 20, 'tdb_max': 26, 'rh_min': 30, 'rh_max': 60}
+    unit = {'name': 'bench-unit', 'polygon': [[10, 2], [40, 4], [35, 20], [12, 15]]}
+    rng = np.random.default_rng(0)
+    classify = {'tdb': rng.uniform(-15.0, 45.0, 10000).round(2).tolist(),
+                'w': rng.uniform(0.5, 25.0, 10000).round(3).tolist(),
+                'hours': 0.25, 'zones': [comfort, unit]}
+    requests = (
+        ('GET', '/', None, None),
+        ('GET', '/health', None, None),
+        ('GET', '/cache-stats', None, None),
+        ('POST', '/calculate', {'P': _PRESSURE, **_REFERENCE}, None),
+        ('POST', '/calculate?mode=fast', {'P': _PRESSURE, **_REFERENCE}, None),
+        ('POST', '/calculate-multiple', {'pressure': _PRESSURE, 'points': points}, None),
+        ('POST', '/calculate-multiple?format=columnar', {'pressure': _PRESSURE, 'points': points}, None),
+        ('POST', '/calculate-multiple?format=f32', {'pressure': _PRESSURE, 'points': points}, None),
+        ('POST', '/calculate-stream', None, stream_body),
+        ('POST', '/generate-chart', chart, None),
+        ('POST', '/render-chart', chart, None),
+        ('GET', '/chart-background?pressure=101325', None, None),
+        ('POST', '/mixing', {'pressure': _PRESSURE, 'point1': {'tdb': 25, 'w': 10},
+                             'point2': {'tdb': 15, 'w': 5}, 'ratio': 0.6}, None),
+        ('POST', '/mixing-sweep', {'pressure': _PRESSURE, 'streams': [p['inputs'] for p in points[:3]],
+                                   'ratios': [[i / 100, 1 - i / 100, 0.2] for i in range(101)]}, None),
+        ('POST', '/process-chain', {'pressure': _PRESSURE, 'start': {'T': 303.15, 'R': 0.6}, 'steps': [
+            {'op': 'mix', 'stream': {'T': 297.15, 'R': 0.5}, 'ratio': 0.3},
+            {'op': 'coil', 'adp': 283.15, 'bypass_factor': 0.1}, {'op': 'heat', 'T': 295.15},
+            {'op': 'humidify', 'method': 'steam', 'R': 0.5},
+        ]}, None),
+        ('POST', '/weather-analysis', None, _synthetic_epw()),
+        ('GET', '/metrics', None, None),
+        ('GET', '/memory-profile', None, None),
+        ('POST', '/zones', {'pressure': _PRESSURE, 'zones': [comfort, unit]}, None),
+        ('GET', '/zones', None, None),
+        ('POST', '/zones/classify', classify, None),
+    )
+    for method, url, body, content in requests:
+        def call(method=method, url=url, body=body, content=content):
+            response = client.request(method, url, json=body, content=content,
+                                      headers={'content-type': 'application/x-ndjson'} if content else None)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{method} {url} 返回 {response.status_code}: {response.text[:200]}")
+            return response
+        yield f'http/{method} {url}', call
+
+    # 删除后重新注册（直接调用注册表，不计入 HTTP 往返），每次调用都删除一个存在的区域
+    def delete_zone():
+        main_app.zone_registry.register(unit, _PRESSURE)
+        response = client.delete('/zones/bench-unit')
+        if response.status_code >= 400:
+            raise RuntimeError(f"DELETE /zones/bench-unit 返回 {response.status_code}: {response.text[:200]}")
+        return response
+    yield 'http/DELETE /zones/{name}', delete_zone
+
+    # WebSocket 往返：连接、推送一帧、等待下一个 tick 的结果（耗时含 tick 间隔 PSYCHRO_LIVE_TICK）
+    frame = json.dumps([{'sensor_id': p['name'], 'inputs': p['inputs']} for p in points])
+
+    def live_round_trip():
+        with client.websocket_connect('/live') as websocket:
+            websocket.send_text(frame)
+            message = json.loads(websocket.receive_text())
+        if len(message.get('results', [])) != len(points) or not all(r.get('success') for r in message['results']):
+            raise RuntimeError(f"WS /live 结果异常: {str(message)[:200]}")
+        return message
+    yield 'http/WS /live', live_round_trip
+
+
+def _synthetic_epw(seed: int = 0) -> bytes:
+    """8760 小时的合成 EPW 文件内容（日、年周期的干球温度与露点）"""
+    rng = np.random.default_rng(seed)
+    hours = np.arange(8760)
+    tdb = 15 - 12 * np.cos(2 * np.pi * (hours / 24 - 15) / 365) + 5 * np.sin(2 * np.pi * (hours % 24 - 9) / 24)
+    tdb += rng.normal(0, 2, hours.size)
+    tdp = tdb - rng.uniform(1, 10, hours.size)
+    lines = ['LOCATION,Synthetic,,CHN,BENCH,000000,31.2,121.4,8.0,10.0'] + ['HEADER'] * 7
+    lines += [f'2020,{h // 732 + 1},{h // 24 % 28 + 1},{h % 24 + 1},60,?,{t:.1f},{d:.1f},70,101000' + ',0' * 25
+              for h, t, d in zip(hours, tdb, tdp)]
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def weather_cases() -> Iterator[Tuple[str, Callable[[], Any]]]:
+    from weather import analyze_weather
+
+    content = _synthetic_epw()
+    yield 'weather/epw-8760', lambda: analyze_weather(content, 'epw')
+
+
+def zone_cases() -> Iterator[Tuple[str, Callable[[], Any]]]:
+    import batch_engine
+    from weather import DEFAULT_ZONES
+    from zones import ZoneIndex, resolve_zone
+
+    zones = [resolve_zone(zone) for zone in DEFAULT_ZONES]
+    zones.append({'name': 'unit', 'polygon': [[10, 2], [40, 4], [35, 20], [12, 15]]})
+    index = ZoneIndex(zones)
+    rng = np.random.default_rng(0)
+    n = 1000000
+    tdb = rng.uniform(-15.0, 45.0, n)
+    w = batch_engine.humidity_ratio_from_rh(tdb + 273.15, rng.uniform(0.05, 1.0, n), _PRESSURE) * 1000.0
+    yield 'zones/index-build', lambda: ZoneIndex(zones)
+    yield f'zones/classify-{n}', lambda: index.classify(tdb, w, 0.25)
+
+
+SUITES = (calculator_cases, multiple_cases, inverse_cases, chart_cases, cache_cases, weather_cases, zone_cases,
+          http_cases)
+
+
+# --- 测量 ---
+
+def measure(func: Callable[[], Any], min_time: float = 0.2, repeat: int = 5) -> Dict[str, Any]:
+    """
+    测量 func 的单次调用耗时
+
+    先按 1, 2, 5, 10, ... 递增调用次数，直到一次测量的总耗时不少于 min_time，
+    再以该次数重复测量 repeat 次。
+    """
+    func()  # 预热：导入、缓存填充、首次编译
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 10 ** 6:
+            break
+        # 1, 2, 5, 10, 20, 50, ...
+        number = number * 5 // 2 if str(number)[0] == '2' else number * 2
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) / number)
+    return {
+        'median_s': statistics.median(samples),
+        'min_s': min(samples),
+        'number': number,
+        'repeat': repeat,
+    }
+
+
+def run(filter_pattern: Optional[str] = None, min_time: float = 0.2, repeat: int = 5) -> Dict[str, Any]:
+    """运行全部（或匹配 filter_pattern 的）用例，返回可序列化为 JSON 的结果"""
+    pattern = re.compile(filter_pattern) if filter_pattern else None
+    results = {}
+    for suite in SUITES:
+        for name, func in suite():
+            if pattern and not pattern.search(name):
+                continue
+            results[name] = measure(func, min_time, repeat)
+            print(f"{name:<40} {_format_seconds(results[name]['median_s']):>10}  (×{results[name]['number']})")
+    return {'meta': _environment(), 'results': results}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            threshold: float = DEFAULT_THRESHOLD) -> Dict[str, Dict[str, Any]]:
+    """
+    按中位数与基线比较
+
+    Returns:
+        {用例: {'baseline_s', 'current_s', 'ratio', 'regressed'}}，只包含两边都有的用例
+    """
+    report = {}
+    for name, result in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        ratio = result['median_s'] / base['median_s'] if base['median_s'] > 0 else float('inf')
+        report[name] = {
+            'baseline_s': base['median_s'],
+            'current_s': result['median_s'],
+            'ratio': round(ratio, 4),
+            'regressed': ratio > 1.0 + threshold,
+        }
+    return report
+
+
+def _environment() -> Dict[str, Any]:
+    import parallel
+
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pool_workers': parallel.POOL_WORKERS,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def _format_seconds(seconds: float) -> str:
+    for unit, scale in (('s', 1.0), ('ms', 1e-3), ('µs', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.2f} {unit}'
+    return f'{seconds / 1e-9:.0f} ns'
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="热点路径基准测试")
+    parser.add_argument('--output', help="把结果写入 JSON 文件")
+    parser.add_argument('--baseline', help="与基线 JSON 比较，出现回归时退出码为 1")
+    parser.add_argument('--threshold', type=float,
+                        default=float(os.environ.get('PSYCHRO_BENCH_THRESHOLD', DEFAULT_THRESHOLD)),
+                        help="回归阈值（相对基线变慢的比例）")
+    parser.add_argument('--filter', help="只运行名称匹配该正则的用例")
+    parser.add_argument('--quick', action='store_true', help="缩短测量时间（结果波动更大）")
+    args = parser.parse_args(argv)
+
+    current = run(args.filter, min_time=0.05 if args.quick else 0.2, repeat=3 if args.quick else 5)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    report = compare(current, baseline, args.threshold)
+    regressions = [name for name, item in report.items() if item['regressed']]
+    print(f"\n与基线比较（阈值 +{args.threshold:.0%}）:")
+    for name, item in report.items():
+        flag = '回归' if item['regressed'] else 'OK'
+        print(f"{name:<40} {item['ratio']:>6.2f}x  {flag}")
+    if regressions:
+        print(f"\n{len(regressions)} 个用例出现回归")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
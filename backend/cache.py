@@ -0,0 +1,181 @@
+# cache.py - 有界并发 LRU + TTL 缓存
+"""
+进程内结果缓存：
+
+- 分段锁 (lock striping)：按键哈希分到多个段，每段独立加锁，互不阻塞
+- O(1) LRU：每段使用 OrderedDict，命中时移到末尾，超出容量时淘汰最久未用项
+- 逐项 TTL：写入时记录各自的过期时间，读取时惰性清理，不做全表扫描
+- 单飞 (single-flight)：同一个键的并发未命中只执行一次计算，其余调用等待其结果
+- 统计：命中/未命中/淘汰/过期/合并次数
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Flight:
+    """一次进行中的计算，供同键的并发调用等待"""
+
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class _Stripe:
+    """缓存的一个分段：独立的锁、LRU 表、进行中的计算与计数器"""
+
+    __slots__ = ('lock', 'entries', 'inflight', 'capacity',
+                 'hits', 'misses', 'evictions', 'expirations', 'coalesced')
+
+    def __init__(self, capacity: int):
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self.inflight: Dict[Hashable, _Flight] = {}
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def lookup(self, key: Hashable, now: float) -> Tuple[bool, Any]:
+        """在持有锁的前提下查找键，过期项直接删除"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        value, expires_at = entry
+        if expires_at <= now:
+            del self.entries[key]
+            self.expirations += 1
+            return False, None
+        self.entries.move_to_end(key)
+        return True, value
+
+    def store(self, key: Hashable, value: Any, expires_at: float):
+        """在持有锁的前提下写入键，超出容量时淘汰最久未用项"""
+        self.entries[key] = (value, expires_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+
+class LRUTTLCache:
+    """有界、线程安全、带逐项 TTL 与单飞去重的 LRU 缓存"""
+
+    def __init__(self, capacity: int = 4096, default_ttl: float = 300.0, stripes: int = 16):
+        """
+        Args:
+            capacity: 缓存总容量（条目数），平均分配到各段
+            default_ttl: 未指定 ttl 时的默认过期时间（秒）
+            stripes: 分段数量，越多并发冲突越少
+        """
+        stripes = max(1, min(stripes, capacity))
+        per_stripe = -(-capacity // stripes)  # 向上取整
+        self.capacity = per_stripe * stripes
+        self.default_ttl = default_ttl
+        self._stripes = tuple(_Stripe(per_stripe) for _ in range(stripes))
+
+    def _stripe(self, key: Hashable) -> _Stripe:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取缓存，未命中或已过期时返回 default"""
+        stripe = self._stripe(key)
+        with stripe.lock:
+            hit, value = stripe.lookup(key, time.monotonic())
+            if hit:
+                stripe.hits += 1
+                return value
+            stripe.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """写入缓存，ttl 为该条目的过期时间（秒）"""
+        expires_at = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.store(key, value, expires_at)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """
+        读取缓存；未命中时调用 compute() 计算并写入
+
+        计算在锁外执行，同一个键的并发未命中只有第一个调用会执行 compute()，
+        其余调用等待并共享其结果（或异常）。
+        """
+        return self.lookup_or_compute(key, compute, ttl)[0]
+
+    def lookup_or_compute(self, key: Hashable, compute: Callable[[], Any],
+                          ttl: Optional[float] = None) -> Tuple[Any, str]:
+        """同 get_or_compute，额外返回本次查找的结果类型：'hit'、'miss' 或 'coalesced'"""
+        stripe = self._stripe(key)
+        with stripe.lock:
+            hit, value = stripe.lookup(key, time.monotonic())
+            if hit:
+                stripe.hits += 1
+                return value, 'hit'
+            flight = stripe.inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                stripe.inflight[key] = flight
+                stripe.misses += 1
+            else:
+                stripe.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, 'coalesced'
+
+        try:
+            value = compute()
+            flight.value = value
+            expires_at = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+            with stripe.lock:
+                stripe.store(key, value, expires_at)
+            return value, 'miss'
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with stripe.lock:
+                stripe.inflight.pop(key, None)
+            flight.event.set()
+
+    def invalidate(self, key: Hashable):
+        """删除单个键"""
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.entries.pop(key, None)
+
+    def clear(self):
+        """清空全部条目（保留统计）"""
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.entries.clear()
+
+    def __len__(self) -> int:
+        return sum(len(stripe.entries) for stripe in self._stripes)
+
+    def stats(self) -> Dict[str, Any]:
+        """汇总各段的统计信息"""
+        totals = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'coalesced': 0, 'size': 0}
+        for stripe in self._stripes:
+            with stripe.lock:
+                totals['hits'] += stripe.hits
+                totals['misses'] += stripe.misses
+                totals['evictions'] += stripe.evictions
+                totals['expirations'] += stripe.expirations
+                totals['coalesced'] += stripe.coalesced
+                totals['size'] += len(stripe.entries)
+        lookups = totals['hits'] + totals['misses'] + totals['coalesced']
+        totals['capacity'] = self.capacity
+        totals['hit_ratio'] = round(totals['hits'] / lookups, 4) if lookups else 0.0
+        return totals
@@ -1,38 +1,84 @@
 # calculator.py - Serverless 优化版本
-import CoolProp.HumidAirProp as HA
+# CoolProp 与 matplotlib 导入耗时较长，只在回退计算与图表渲染路径上按需导入
 import numpy as np
 import os
 import io
 import base64
 import json
+import hashlib
+import shutil
+import tempfile
+import threading
+
+import batch_engine
+from batch_engine import compute_batch
+from cache import LRUTTLCache
+from render_pool import RenderPool, Canvas, RENDER_FORMATS, DEFAULT_DPI
+
+# 大批量计算的多进程后端，不可用时在当前进程计算
+try:
+    from parallel import compute_batch as compute_batch_parallel
+except ImportError:
+    compute_batch_parallel = compute_batch
+
+# fast 模式的预计算插值表，不可用时按精确路径计算
+try:
+    from fast_table import compute_batch_fast
+except ImportError:
+    compute_batch_fast = compute_batch
+
+# 计算模式：exact 为精确计算，fast 优先查预计算插值表（误差见 fast_table 表头 max_error）
+CALCULATION_MODES = ('exact', 'fast')
+
+def _check_mode(mode: str):
+    if mode not in CALCULATION_MODES:
+        raise ValueError(f"不支持的计算模式: {mode}")
 
 # 导入性能优化模块
 try:
     from performance import cache_result, get_psychrometric_constants
 except ImportError:
     # 如果性能模块不可用，使用空装饰器
-    def cache_result(expire_time=300):
+    def cache_result(expire_time=300, key_func=None, persist=False):
         def decorator(func):
             return func
         return decorator
     
-    def get_psychrometric_constants(pressure):
+    def get_psychrometric_constants(pressure, **options):
         return {'pressure': pressure}
 
-# Serverless 环境 matplotlib 配置
-import matplotlib
-matplotlib.use('Agg')  # 使用非交互式后端
-import matplotlib.pyplot as plt
+# 部署时预生成的 matplotlib 字体缓存（python coldstart.py --build-font-cache）
+FONT_CACHE_DIR = os.environ.get(
+    'PSYCHRO_FONT_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.mplconfig')
+)
 
-# 配置matplotlib以适应serverless环境
-plt.ioff()  # 关闭交互模式
+_matplotlib_ready = False
+_matplotlib_lock = threading.Lock()
+
+def _prepare_matplotlib():
+    """首次渲染前调用：启用预生成的字体缓存并配置字体（只执行一次）"""
+    global _matplotlib_ready
+    with _matplotlib_lock:
+        if _matplotlib_ready:
+            return
+        if 'MPLCONFIGDIR' not in os.environ and os.path.isdir(FONT_CACHE_DIR):
+            # matplotlib 只使用可写的配置目录，而部署目录只读，复制到临时目录后使用
+            target = os.path.join(tempfile.gettempdir(), 'psychro-mplconfig')
+            try:
+                shutil.copytree(FONT_CACHE_DIR, target, dirs_exist_ok=True)
+                os.environ['MPLCONFIGDIR'] = target
+            except OSError as e:
+                print(f"字体缓存复制警告: {e}")
+        configure_matplotlib_fonts()
+        _matplotlib_ready = True
 
 def configure_matplotlib_fonts():
     """配置matplotlib字体以适应serverless环境"""
     try:
+        import matplotlib
         # 为serverless环境配置字体
-        plt.rcParams['font.sans-serif'] = ['DejaVu Sans', 'Arial', 'Liberation Sans']
-        plt.rcParams['axes.unicode_minus'] = False
+        matplotlib.rcParams['font.sans-serif'] = ['DejaVu Sans', 'Arial', 'Liberation Sans']
+        matplotlib.rcParams['axes.unicode_minus'] = False
         
         # 如果可能，尝试设置中文字体
         try:
@@ -43,7 +89,7 @@ def configure_matplotlib_fonts():
             
             for font in chinese_fonts:
                 if font in available_fonts:
-                    plt.rcParams['font.sans-serif'].insert(0, font)
+                    matplotlib.rcParams['font.sans-serif'].insert(0, font)
                     break
         except Exception:
             pass  # 忽略字体配置错误
@@ -51,13 +97,197 @@ def configure_matplotlib_fonts():
     except Exception as e:
         print(f"字体配置警告 (Serverless): {e}")
 
-# 初始化字体配置
-configure_matplotlib_fonts()
+# 焓湿图渲染池：按压力复用已绘好背景的画布，多个请求可并发渲染，各自只叠加状态点和过程线
+_chart_backgrounds = RenderPool()
+# 渲染结果缓存：按请求内容哈希 (ETag，含格式与 DPI) 缓存图片
+_chart_images = LRUTTLCache(capacity=64, default_ttl=600)
+
+# 画布尺寸（英寸）
+CHART_FIGSIZE = (10, 7)
+
+# 背景图使用的等值线范围：-5~45 °C，20/40/60/80% 相对湿度，30~90 kJ/kg 等焓线
+_CHART_ISOLINE_OPTIONS = {
+    't_min': -5.0, 't_max': 45.0, 't_step': 1.0,
+    'rh_step': 20.0,
+    'h_min': 30.0, 'h_max': 90.0, 'h_step': 20.0,
+    'twb_step': 0.0, 'v_step': 0.0,
+    'w_max': 100.0,
+}
+
+def _chart_isolines(pressure_pa):
+    """取 get_psychrometric_constants 的背景等值线 (g/kg)，转为数组"""
+    constants = get_psychrometric_constants(pressure_pa, **_CHART_ISOLINE_OPTIONS)
+    if 'temp_range' not in constants:
+        table = batch_engine.isoline_table(pressure_pa, **_CHART_ISOLINE_OPTIONS)
+        return {'temps': table['tdb'], 'saturation': table['saturation'],
+                'rh': {f'{k:g}': v for k, v in table['rh'].items()},
+                'enthalpy': {f'{k:g}': v for k, v in table['enthalpy'].items()}}
+
+    def column(values):
+        return np.array(values, dtype=float)
+
+    return {
+        'temps': column(constants['temp_range']),
+        'saturation': column(constants['saturation_line']),
+        'rh': {label: column(values) for label, values in constants['rh_lines'].items()},
+        'enthalpy': {label: column(values) for label, values in constants['enthalpy_lines'].items()},
+    }
+
+def _build_chart_background(pressure_pa):
+    """绘制静态背景层：饱和线、等相对湿度线、等焓线、坐标轴与标题"""
+    _prepare_matplotlib()
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=CHART_FIGSIZE)  # 稍微减小图片尺寸以节省内存
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    lines = _chart_isolines(pressure_pa)
+    temps = lines['temps']
+
+    # 绘制饱和线
+    ax.plot(temps, lines['saturation'], 'k-', linewidth=2, label='RH = 100%')
+
+    # 绘制相对湿度曲线
+    for rh_val, hum_ratios_rh in lines['rh'].items():
+        valid = np.isfinite(hum_ratios_rh)
+        valid_temps_rh = temps[valid]
+        hum_ratios_rh = hum_ratios_rh[valid]
+        if valid_temps_rh.size:
+            ax.plot(valid_temps_rh, hum_ratios_rh, 'b--', linewidth=0.5, alpha=0.7)
+            # 简化标注
+            if len(valid_temps_rh) > 10:
+                ax.annotate(f'{rh_val}%', xy=(valid_temps_rh[-10], hum_ratios_rh[-10]),
+                            xytext=(3, -3), textcoords='offset points',
+                            fontsize=8, color='blue', alpha=0.7)
+
+    # 绘制等焓线
+    for h_val, hum_ratios_h in lines['enthalpy'].items():
+        valid = np.isfinite(hum_ratios_h) & (hum_ratios_h >= 0) & (hum_ratios_h <= 25)  # 限制在合理范围内
+        valid_temps_h = temps[valid]
+        hum_ratios_h = hum_ratios_h[valid]
+        if len(valid_temps_h) > 1:
+            ax.plot(valid_temps_h, hum_ratios_h, 'g:', linewidth=0.5, alpha=0.5)
+            ax.annotate(f'{h_val}kJ/kg', xy=(valid_temps_h[0], hum_ratios_h[0]),
+                        xytext=(-3, 3), textcoords='offset points',
+                        fontsize=8, color='green', alpha=0.7)
+
+    # 设置图表样式
+    ax.set_xlabel('干球温度 (°C)', fontsize=11)
+    ax.set_ylabel('含湿量 (g/kg)', fontsize=11)
+    ax.set_title(f'焓湿图 (压力: {pressure_pa/1000:.1f} kPa)', fontsize=12, fontweight='bold')
+    ax.grid(True, linestyle=':', linewidth=0.5, alpha=0.7)
+    ax.set_xlim(-5, 45)
+    ax.set_ylim(0, 25)
+    fig.tight_layout()
+    return Canvas(fig, ax)
+
+def _draw_chart_overlay(ax, points=None, process_lines=None):
+    """在背景层上绘制状态点与过程线，返回新增的 artist 列表以便渲染后移除"""
+    added = []
+
+    # 绘制状态点
+    point_data = {}
+    if points:
+        for i, point in enumerate(points):
+            color = point.get('color', f'C{i}')
+            marker = point.get('marker', 'o')
+            size = max(6, min(point.get('size', 8), 12))  # 限制标记大小
+
+            added.extend(ax.plot(point['tdb'], point['w'], marker, color=color,
+                                 markersize=size, markeredgecolor='black', markeredgewidth=1,
+                                 label=point['name']))
+
+            # 添加点的标注
+            added.append(ax.annotate(point['name'],
+                                     xy=(point['tdb'], point['w']),
+                                     xytext=(5, 5), textcoords='offset points',
+                                     fontsize=9, fontweight='bold',
+                                     bbox=dict(boxstyle='round,pad=0.2', facecolor='white', alpha=0.8)))
+
+            point_data[point['name']] = {
+                'tdb': point['tdb'],
+                'w': point['w'],
+                'properties': point.get('properties', {})
+            }
+
+    # 绘制过程线
+    if process_lines:
+        for line in process_lines:
+            from_point = line['from']
+            to_point = line['to']
+            color = line.get('color', 'red')
+            style = line.get('style', '-')
+            width = max(1, min(line.get('width', 2), 4))  # 限制线宽
+
+            if from_point in point_data and to_point in point_data:
+                from_coords = (point_data[from_point]['tdb'], point_data[from_point]['w'])
+                to_coords = (point_data[to_point]['tdb'], point_data[to_point]['w'])
+
+                added.extend(ax.plot([from_coords[0], to_coords[0]],
+                                     [from_coords[1], to_coords[1]],
+                                     color=color, linestyle=style, linewidth=width,
+                                     label=line.get('label') or f'{from_point}→{to_point}'))
+
+                # 添加箭头（简化）
+                mid_x = (from_coords[0] + to_coords[0]) / 2
+                mid_y = (from_coords[1] + to_coords[1]) / 2
+
+                added.append(ax.annotate('', xy=(to_coords[0], to_coords[1]),
+                                         xytext=(mid_x, mid_y),
+                                         arrowprops=dict(arrowstyle='->', color=color, lw=width)))
+
+    # 添加图例（简化）
+    if points or process_lines:
+        added.append(ax.legend(loc='upper left', bbox_to_anchor=(1, 1), fontsize=9))
+
+    return added
+
+def chart_etag(pressure_pa, points=None, process_lines=None, fmt='png', dpi=DEFAULT_DPI) -> str:
+    """按图表内容、输出格式与 DPI 计算哈希，内容相同的请求得到相同的 ETag"""
+    payload = json.dumps(
+        {'pressure': round(float(pressure_pa), 3), 'points': points or [], 'process_lines': process_lines or [],
+         'format': fmt, 'dpi': dpi},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+def render_psych_chart(pressure_pa, points=None, process_lines=None, etag=None,
+                       fmt='png', dpi=DEFAULT_DPI) -> bytes:
+    """
+    渲染焓湿图图片。画布按压力在渲染池中复用，结果按内容哈希缓存。
+
+    Args:
+        pressure_pa: 压力 (Pa)
+        points: 状态点列表，格式同 create_psych_chart
+        process_lines: 过程线列表，格式同 create_psych_chart
+        etag: 已算好的 chart_etag，可省去重复计算
+        fmt: 输出格式，'png' / 'svg' / 'webp'（见 render_pool.RENDER_FORMATS）
+        dpi: 输出分辨率；栅格缓冲区超过渲染池内存上限时抛出 render_pool.RenderLimitExceeded
+
+    Returns:
+        图片字节串
+    """
+    # 先校验格式与尺寸，超限的请求不占用渲染名额
+    _chart_backgrounds.check_limits(CHART_FIGSIZE, fmt, dpi)
+    if etag is None:
+        etag = chart_etag(pressure_pa, points, process_lines, fmt, dpi)
+
+    def render():
+        return _chart_backgrounds.render(
+            round(float(pressure_pa)),
+            lambda: _build_chart_background(pressure_pa),
+            lambda ax: _draw_chart_overlay(ax, points, process_lines),
+            CHART_FIGSIZE, fmt=fmt, dpi=dpi,
+            bbox_inches='tight', facecolor='white', edgecolor='none',
+        )
+
+    return _chart_images.get_or_compute(etag, render)
 
 def create_psych_chart(pressure_pa, points=None, process_lines=None):
     """
     创建一个焓湿图并标记多个点和过程线。
-    Serverless 优化版本 - 减少内存使用和提高性能
+    Serverless 优化版本 - 背景等值线按压力缓存复用，每次只绘制状态点与过程线
     
     Args:
         pressure_pa: 压力 (Pa)
@@ -67,179 +297,119 @@ def create_psych_chart(pressure_pa, points=None, process_lines=None):
     Returns:
         base64编码的图片字符串
     """
-    # 确保清理之前的图形
-    plt.clf()
-    plt.close('all')
-    
     try:
-        fig, ax = plt.subplots(figsize=(10, 7))  # 稍微减小图片尺寸以节省内存
-        
-        # 减少温度范围以提高性能
-        temps = np.linspace(-5, 45, 51)  # 减少点数
-        
-        # 绘制饱和线
-        try:
-            hum_ratios_sat = [HA.HAPropsSI('W', 'T', T+273.15, 'P', pressure_pa, 'R', 1.0) * 1000 for T in temps]
-            ax.plot(temps, hum_ratios_sat, 'k-', linewidth=2, label='RH = 100%')
-        except Exception as e:
-            print(f"饱和线绘制警告: {e}")
-
-        # 绘制相对湿度曲线（减少曲线数量）
-        for rh_val in [80, 60, 40, 20]:  # 减少曲线数量
-            hum_ratios_rh = []
-            valid_temps_rh = []
-            for T in temps:
-                try:
-                    w = HA.HAPropsSI('W', 'T', T + 273.15, 'P', pressure_pa, 'R', rh_val / 100.0) * 1000
-                    hum_ratios_rh.append(w)
-                    valid_temps_rh.append(T)
-                except ValueError:
-                    pass
-            
-            if valid_temps_rh:
-                ax.plot(valid_temps_rh, hum_ratios_rh, 'b--', linewidth=0.5, alpha=0.7)
-                # 简化标注
-                if len(valid_temps_rh) > 10:
-                    ax.annotate(f'{rh_val}%', xy=(valid_temps_rh[-10], hum_ratios_rh[-10]), 
-                               xytext=(3, -3), textcoords='offset points', 
-                               fontsize=8, color='blue', alpha=0.7)
-
-        # 绘制等焓线（减少线数）
-        for h_val in [30, 50, 70, 90]:  # 减少等焓线数量
-            hum_ratios_h = []
-            valid_temps_h = []
-            for T in temps:
-                try:
-                    w = HA.HAPropsSI('W', 'T', T + 273.15, 'P', pressure_pa, 'H', h_val * 1000) * 1000
-                    if 0 <= w <= 25:  # 限制在合理范围内
-                        hum_ratios_h.append(w)
-                        valid_temps_h.append(T)
-                except ValueError:
-                    pass
-            
-            if len(valid_temps_h) > 1:
-                ax.plot(valid_temps_h, hum_ratios_h, 'g:', linewidth=0.5, alpha=0.5)
-                if valid_temps_h:
-                    ax.annotate(f'{h_val}kJ/kg', xy=(valid_temps_h[0], hum_ratios_h[0]), 
-                               xytext=(-3, 3), textcoords='offset points', 
-                               fontsize=8, color='green', alpha=0.7)
-
-        # 绘制状态点
-        point_data = {}
-        if points:
-            for i, point in enumerate(points):
-                color = point.get('color', f'C{i}')
-                marker = point.get('marker', 'o')
-                size = max(6, min(point.get('size', 8), 12))  # 限制标记大小
-                
-                ax.plot(point['tdb'], point['w'], marker, color=color, 
-                       markersize=size, markeredgecolor='black', markeredgewidth=1,
-                       label=point['name'])
-                
-                # 添加点的标注
-                ax.annotate(point['name'], 
-                           xy=(point['tdb'], point['w']), 
-                           xytext=(5, 5), textcoords='offset points',
-                           fontsize=9, fontweight='bold',
-                           bbox=dict(boxstyle='round,pad=0.2', facecolor='white', alpha=0.8))
-                
-                point_data[point['name']] = {
-                    'tdb': point['tdb'],
-                    'w': point['w'],
-                    'properties': point.get('properties', {})
-                }
-
-        # 绘制过程线
-        if process_lines:
-            for line in process_lines:
-                from_point = line['from']
-                to_point = line['to']
-                color = line.get('color', 'red')
-                style = line.get('style', '-')
-                width = max(1, min(line.get('width', 2), 4))  # 限制线宽
-                
-                if from_point in point_data and to_point in point_data:
-                    from_coords = (point_data[from_point]['tdb'], point_data[from_point]['w'])
-                    to_coords = (point_data[to_point]['tdb'], point_data[to_point]['w'])
-                    
-                    ax.plot([from_coords[0], to_coords[0]], 
-                           [from_coords[1], to_coords[1]], 
-                           color=color, linestyle=style, linewidth=width,
-                           label=line.get('label', f'{from_point}→{to_point}'))
-                    
-                    # 添加箭头（简化）
-                    mid_x = (from_coords[0] + to_coords[0]) / 2
-                    mid_y = (from_coords[1] + to_coords[1]) / 2
-                    
-                    ax.annotate('', xy=(to_coords[0], to_coords[1]), 
-                               xytext=(mid_x, mid_y),
-                               arrowprops=dict(arrowstyle='->', color=color, lw=width))
-
-        # 设置图表样式
-        ax.set_xlabel('干球温度 (°C)', fontsize=11)
-        ax.set_ylabel('含湿量 (g/kg)', fontsize=11)
-        ax.set_title(f'焓湿图 (压力: {pressure_pa/1000:.1f} kPa)', fontsize=12, fontweight='bold')
-        ax.grid(True, linestyle=':', linewidth=0.5, alpha=0.7)
-        ax.set_xlim(-5, 45)
-        ax.set_ylim(0, 25)
-        
-        # 添加图例（简化）
-        if points or process_lines:
-            ax.legend(loc='upper left', bbox_to_anchor=(1, 1), fontsize=9)
-        
-        plt.tight_layout()
-        
-        # 转换为base64字符串（优化内存使用）
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', dpi=100, bbox_inches='tight', 
-                   facecolor='white', edgecolor='none')  # 降低DPI以节省内存
-        buffer.seek(0)
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
-        
-        # 清理资源
-        buffer.close()
-        plt.close(fig)
-        
-        return image_base64
-        
+        return base64.b64encode(render_psych_chart(pressure_pa, points, process_lines)).decode()
     except Exception as e:
-        # 确保清理资源
-        plt.close('all')
         print(f"图表生成错误: {e}")
         # 返回一个简单的占位图片
         return "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
 
-@cache_result(expire_time=600)  # 缓存10分钟
-def calculate_properties(props_to_send: dict):
+# CoolProp 输入参数别名 → 标准代码
+INPUT_ALIASES = {
+    'Tdb': 'T', 'T_db': 'T',
+    'Twb': 'B', 'T_wb': 'B', 'WetBulb': 'B',
+    'Tdp': 'D', 'T_dp': 'D', 'DewPoint': 'D',
+    'RH': 'R', 'RelHum': 'R',
+    'Omega': 'W', 'HumRat': 'W',
+    'Hda': 'H',
+}
+
+# 缓存键量化步长（SI 单位）：温度 K、相对湿度 0-1、含湿量 kg/kg、焓 J/kg、压力 Pa
+# 可通过环境变量覆盖，如 PSYCHRO_CACHE_QUANTA="T=0.01,W=1e-5"
+DEFAULT_CACHE_QUANTA = {
+    'T': 0.01, 'B': 0.01, 'D': 0.01,
+    'R': 1e-4,
+    'W': 1e-5,
+    'H': 1.0,
+    'P': 1.0,
+}
+
+def _load_cache_quanta() -> dict:
+    """读取缓存键量化配置"""
+    quanta = dict(DEFAULT_CACHE_QUANTA)
+    for item in os.environ.get('PSYCHRO_CACHE_QUANTA', '').split(','):
+        if '=' in item:
+            code, step = item.split('=', 1)
+            try:
+                quanta[INPUT_ALIASES.get(code.strip(), code.strip())] = float(step)
+            except ValueError:
+                print(f"缓存量化配置警告: 忽略无效项 {item}")
+    return quanta
+
+CACHE_QUANTA = _load_cache_quanta()
+
+def normalize_inputs(props_to_send: dict) -> dict:
+    """把输入参数的别名统一为标准代码，数值转换为 float"""
+    normalized = {}
+    for key, value in props_to_send.items():
+        code = INPUT_ALIASES.get(key, key)
+        if code in normalized:
+            raise ValueError(f"输入参数重复: {key}")
+        normalized[code] = float(value)
+    return normalized
+
+def psychro_cache_key(props_to_send: dict, return_state: bool = False, mode: str = 'exact'):
+    """
+    calculate_properties 的规范化缓存键
+
+    输入代码排序、别名统一，数值按 CACHE_QUANTA 量化，
+    因此参数顺序不同或只有微小浮点差异的请求共享同一条缓存。
+    键中保存量化后的物理值（而非格点序号），键也会写入第二级缓存，
+    不同部署的 PSYCHRO_CACHE_QUANTA 不同时同一个键仍对应同一个输入。
     """
-    根据输入的字典，使用 CoolProp 计算所有湿空气属性。
+    try:
+        props = normalize_inputs(props_to_send)
+    except (TypeError, ValueError, AttributeError):
+        # 无法规范化的输入交给计算函数报错，键退化为原始字符串
+        return ('raw', str(props_to_send), return_state, mode)
+    return (
+        tuple(
+            (code, round(value / CACHE_QUANTA[code]) * CACHE_QUANTA[code] if code in CACHE_QUANTA else value)
+            for code, value in sorted(props.items())
+        ),
+        return_state,
+        mode,
+    )
+
+def _format_result(columns: dict, index: int) -> dict:
+    """把批量计算结果中的一行整理成 calculate_properties 的返回格式"""
+    return {
+        "tdb": round(float(columns['tdb'][index]), 2),
+        "twb": round(float(columns['twb'][index]), 2),
+        "rh": round(float(columns['rh'][index]), 2),
+        "w": round(float(columns['w'][index]), 3),
+        "h": round(float(columns['h'][index]), 2),
+        "tdp": round(float(columns['tdp'][index]), 2),
+        "success": True
+    }
+
+@cache_result(expire_time=600, key_func=psychro_cache_key, persist=True)  # 缓存10分钟
+def calculate_properties(props_to_send: dict, return_state: bool = False, mode: str = 'exact'):
+    """
+    根据输入的字典计算所有湿空气属性。
     返回一个包含所有计算结果的字典。
-    Serverless 优化版本
+    Serverless 优化版本 - 先把输入解析为标准状态 (T, W, P)，再由该状态推导其余参数；
+    无法向量化求解时回退到 CoolProp
+
+    Args:
+        props_to_send: CoolProp 输入参数，如 {'P': 101325, 'T': 298.15, 'R': 0.6}
+        return_state: 为 True 时在结果中附带未取整的标准状态
+            'state': {'T': K, 'W': kg/kg, 'P': Pa}，供混风等后续计算复用
+        mode: 'exact' 或 'fast'（查预计算插值表，表外的输入按精确路径计算）
     """
     try:
-        # CoolProp 需要位置参数，我们在这里构建它们
-        args = []
-        for key, value in props_to_send.items():
-            args.extend([key, value])
-
-        # 调用 CoolProp 计算所有属性
-        final_tdb = HA.HAPropsSI('T', *args) - 273.15
-        final_twb = HA.HAPropsSI('B', *args) - 273.15
-        final_rh = HA.HAPropsSI('R', *args) * 100
-        final_w = HA.HAPropsSI('W', *args) * 1000
-        final_h = HA.HAPropsSI('H', *args) / 1000
-        final_tdp = HA.HAPropsSI('D', *args) - 273.15
-        
-        # 将结果打包成字典返回
-        results = {
-            "tdb": round(final_tdb, 2),
-            "twb": round(final_twb, 2),
-            "rh": round(final_rh, 2),
-            "w": round(final_w, 3),
-            "h": round(final_h, 2),
-            "tdp": round(final_tdp, 2),
-            "success": True
-        }
+        _check_mode(mode)
+        inputs = normalize_inputs(props_to_send)
+        if 'P' not in inputs:
+            raise ValueError("缺少压力参数 P")
+        pressure = inputs.pop('P')
+
+        columns = (compute_batch_fast if mode == 'fast' else compute_batch)(inputs, pressure)
+        if not columns['success'][0]:
+            raise ValueError(columns['error'][0])
+        results = _format_result(columns, 0)
+        if return_state:
+            results['state'] = {key: float(columns[key][0]) for key in ('T', 'W', 'P')}
         return results
     except Exception as e:
         return {
@@ -247,50 +417,146 @@ def calculate_properties(props_to_send: dict):
             "error": str(e)
         }
 
-def calculate_multiple_points(points_data: list, pressure_pa: float):
+def compute_rows(rows: list, pressure_pa: float, mode: str = 'exact') -> list:
+    """
+    批量计算多组输入，按输入参数组合分组，每组一次向量化批量计算；
+    超过 parallel.POOL_THRESHOLD 行的组切块后在进程池中并行计算
+
+    Args:
+        rows: 输入参数字典列表，如 [{'T': 298.15, 'R': 0.6}, ...]，可单独指定 'P'
+        pressure_pa: 未指定 'P' 时使用的压力 (Pa)
+        mode: 计算模式，同 calculate_properties
+
+    Returns:
+        与 rows 一一对应的结果字典，格式同 calculate_properties
+    """
+    _check_mode(mode)
+    compute = compute_batch_fast if mode == 'fast' else compute_batch_parallel
+    results = [None] * len(rows)
+
+    # 按输入参数组合分组
+    groups = {}
+    for index, row in enumerate(rows):
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("缺少输入参数")
+            inputs = normalize_inputs(row)
+            pressure = inputs.pop('P', pressure_pa)
+            if len(inputs) != 2:
+                raise ValueError("除压力 P 外需要恰好两个输入参数")
+            group = groups.setdefault(tuple(sorted(inputs)), {'index': [], 'P': [], 'inputs': []})
+            group['index'].append(index)
+            group['P'].append(pressure)
+            group['inputs'].append(inputs)
+        except Exception as e:
+            results[index] = {'success': False, 'error': str(e)}
+
+    for codes, group in groups.items():
+        try:
+            columns = compute(
+                {code: [inputs[code] for inputs in group['inputs']] for code in codes},
+                group['P']
+            )
+        except Exception as e:
+            columns = {'success': [False] * len(group['index']), 'error': [str(e)] * len(group['index'])}
+
+        for row, index in enumerate(group['index']):
+            if columns['success'][row]:
+                results[index] = _format_result(columns, row)
+            else:
+                results[index] = {'success': False, 'error': columns['error'][row] or '计算失败'}
+
+    return results
+
+def calculate_multiple_points(points_data: list, pressure_pa: float, mode: str = 'exact'):
     """
     计算多个状态点的属性
-    Serverless 优化版本
+    Serverless 优化版本 - 按输入参数组合分组，每组一次向量化批量计算
     
     Args:
         points_data: 包含多个点输入数据的列表
         pressure_pa: 压力 (Pa)
+        mode: 计算模式，同 calculate_properties
     
     Returns:
         包含所有点计算结果的列表
     """
+    computed = compute_rows([point.get('inputs') for point in points_data], pressure_pa, mode)
+
     results = []
-    for point in points_data:
-        try:
-            # 添加压力参数
-            props = {'P': pressure_pa}
-            props.update(point['inputs'])
-            
-            # 计算属性
-            calc_result = calculate_properties(props)
-            if calc_result['success']:
-                # 添加点的基本信息
-                calc_result['name'] = point['name']
-                calc_result['color'] = point.get('color', 'blue')
-                calc_result['marker'] = point.get('marker', 'o')
-                calc_result['size'] = point.get('size', 8)
-                
-                # 添加图表坐标
-                calc_result['tdb'] = calc_result['tdb']
-                calc_result['w'] = calc_result['w']
-                
-                results.append(calc_result)
-            else:
-                results.append({
-                    'name': point['name'],
-                    'success': False,
-                    'error': calc_result.get('error', '计算失败')
-                })
-        except Exception as e:
-            results.append({
-                'name': point.get('name', f'Point_{len(results)}'),
-                'success': False,
-                'error': str(e)
-            })
+    for index, (point, calc_result) in enumerate(zip(points_data, computed)):
+        name = point.get('name', f'Point_{index}')
+        if calc_result['success']:
+            # 添加点的基本信息
+            calc_result['name'] = name
+            calc_result['color'] = point.get('color', 'blue')
+            calc_result['marker'] = point.get('marker', 'o')
+            calc_result['size'] = point.get('size', 8)
+            results.append(calc_result)
+        else:
+            results.append({'name': name, 'success': False, 'error': calc_result['error']})
     
-    return results
\ No newline at end of file
+    return results
+
+# 单次混风计算最多的混合比例组数
+MAX_MIXING_RATIOS = 100000
+
+def mix_streams(streams: list, ratios, pressure_pa: float, mode: str = 'exact') -> dict:
+    """
+    多股气流按干空气质量与焓值混合，一次向量化计算全部混合比例
+
+    每股气流只解析一次标准状态；混合后的含湿量与焓值按干空气质量加权平均，
+    再由 (H, W) 整批求解混合点的其余参数。
+
+    Args:
+        streams: 各股气流的输入参数字典，如 [{'T': 297.15, 'R': 0.5}, ...]（不含压力，使用 pressure_pa）
+        ratios: 形如 (M, N) 的混合比例，第 j 列对应 streams[j] 的干空气质量（或质量流量），
+            每行按行和归一化，如 [[0.7, 0.3], [0.6, 0.4]]
+        pressure_pa: 压力 (Pa)
+        mode: 计算模式，同 calculate_properties
+
+    Returns:
+        {'success', 'streams': 各气流的计算结果, 'mixtures': 每组比例的混合结果（附归一化后的 'ratios'）}
+    """
+    _check_mode(mode)
+    if len(streams) < 2:
+        raise ValueError("至少需要两股气流")
+    fractions = np.asarray(ratios, dtype=float)
+    if fractions.ndim != 2 or fractions.shape[1] != len(streams):
+        raise ValueError(f"混合比例应为每行 {len(streams)} 个数值的二维数组")
+    if not 1 <= fractions.shape[0] <= MAX_MIXING_RATIOS:
+        raise ValueError(f"混合比例组数超出范围 (1~{MAX_MIXING_RATIOS})")
+    if not np.all(np.isfinite(fractions)) or np.any(fractions < 0):
+        raise ValueError("混合比例必须为非负有限数值")
+    totals = fractions.sum(axis=1, keepdims=True)
+    if np.any(totals <= 0):
+        raise ValueError("每组混合比例之和必须大于 0")
+    fractions = fractions / totals
+
+    # 各气流的标准状态与焓值 (J/kg 干空气)
+    stream_results, states = [], []
+    for index, stream in enumerate(streams):
+        props = {'P': pressure_pa}
+        props.update(stream)
+        result = calculate_properties(props, return_state=True, mode=mode)
+        if not result.get('success'):
+            raise ValueError(f"气流 {index + 1} 计算失败: {result.get('error')}")
+        # 结果来自缓存，复制后再去掉 state
+        states.append(result['state'])
+        stream_results.append({key: value for key, value in result.items() if key != 'state'})
+    W = np.array([state['W'] for state in states])
+    H = batch_engine.enthalpy(np.array([state['T'] for state in states]), W, pressure_pa)
+
+    # 干空气质量守恒、水分守恒、能量守恒
+    columns = (compute_batch_fast if mode == 'fast' else compute_batch)(
+        {'H': fractions @ H, 'W': fractions @ W}, pressure_pa
+    )
+    mixtures = []
+    for row in range(fractions.shape[0]):
+        if columns['success'][row]:
+            mixture = _format_result(columns, row)
+        else:
+            mixture = {'success': False, 'error': columns['error'][row] or '计算失败'}
+        mixture['ratios'] = [round(float(value), 6) for value in fractions[row]]
+        mixtures.append(mixture)
+    return {'success': True, 'streams': stream_results, 'mixtures': mixtures}
@@ -0,0 +1,170 @@
+# coldstart.py - 冷启动分析与部署前检查
+"""
+冷启动相关的工具：
+
+- 导入耗时报告：以 ``python -X importtime`` 导入 main_app，按顶层包汇总各模块的自身耗时
+- 字体缓存预生成：部署时构建 matplotlib 字体列表，运行时首次渲染直接复用，不再扫描系统字体
+- 依赖检查：依次请求各计算类接口，若进程中出现 matplotlib（或其它绘图依赖）即失败退出
+
+用法::
+
+    python coldstart.py                      # 导入耗时报告
+    python coldstart.py --build-font-cache   # 生成 .mplconfig 字体缓存
+    python coldstart.py --check              # 计算类接口不得加载绘图依赖，失败时退出码为 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 计算类接口：(方法, 路径, 查询串, 请求体)
+COMPUTE_ROUTES = (
+    ('GET', '/health', '', None),
+    ('POST', '/calculate', '', {'P': 101325.0, 'T': 298.15, 'R': 0.6}),
+    ('POST', '/calculate', 'mode=fast', {'P': 101325.0, 'T': 298.15, 'R': 0.6}),
+    ('POST', '/calculate-multiple', '', {'pressure': 101325.0, 'points': [
+        {'name': 'A', 'inputs': {'T': 298.15, 'R': 0.6}},
+        {'name': 'B', 'inputs': {'T': 308.15, 'W': 0.012}},
+    ]}),
+    ('POST', '/generate-chart', '', {'pressure': 101325.0, 'points': [
+        {'name': 'A', 'inputs': {'T': 298.15, 'R': 0.6}},
+    ]}),
+    ('GET', '/chart-background', 'pressure=101325', None),
+    ('POST', '/mixing', '', {'pressure': 101325.0, 'point1': {'tdb': 25, 'w': 10},
+                             'point2': {'tdb': 15, 'w': 5}, 'ratio': 0.6}),
+    ('POST', '/mixing-sweep', '', {'pressure': 101325.0, 'streams': [{'T': 297.15, 'R': 0.5}, {'T': 308.15, 'R': 0.4}],
+                                   'ratios': [[0.8, 0.2], [0.5, 0.5]]}),
+    ('POST', '/process-chain', '', {'pressure': 101325.0, 'start': {'T': 303.15, 'R': 0.6}, 'steps': [
+        {'op': 'coil', 'adp': 283.15, 'bypass_factor': 0.1}, {'op': 'heat', 'T': 295.15},
+        {'op': 'humidify', 'R': 0.65},
+    ]}),
+)
+
+# 计算类接口不应加载的模块（顶层包名）
+PLOTTING_MODULES = ('matplotlib', 'PIL', 'kiwisolver')
+
+
+def import_profile(module: str = 'main_app') -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    在新进程中以 -X importtime 导入 module
+
+    Returns:
+        (总耗时秒数, [(顶层包, 自身耗时秒数之和), ...] 按耗时降序)
+    """
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=BACKEND_DIR, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    totals: Dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        # 格式: "import time: self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        package = name.split('.')[0]
+        totals[package] = totals.get(package, 0.0) + int(self_us) / 1e6
+    return elapsed, sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def build_font_cache(directory: Optional[str] = None) -> str:
+    """在 directory（默认 calculator.FONT_CACHE_DIR）中生成 matplotlib 字体缓存"""
+    if directory is None:
+        directory = os.environ.get('PSYCHRO_FONT_CACHE_DIR', os.path.join(BACKEND_DIR, '.mplconfig'))
+    os.makedirs(directory, exist_ok=True)
+    env = dict(os.environ, MPLCONFIGDIR=directory)
+    subprocess.run([sys.executable, '-c', 'import matplotlib.font_manager'], env=env, check=True)
+    return directory
+
+
+async def _asgi_request(app, method: str, path: str, query: str = '', body=None) -> int:
+    """直接调用 ASGI 应用，返回响应状态码"""
+    payload = b'' if body is None else json.dumps(body).encode('utf-8')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'content-type', b'application/json'),
+                    (b'content-length', str(len(payload)).encode())],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    messages = [{'type': 'http.request', 'body': payload, 'more_body': False}]
+    status = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        # 请求体已读完，客户端保持连接直到响应结束
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+def check_compute_routes() -> List[str]:
+    """
+    在当前进程中导入 main_app 并请求 COMPUTE_ROUTES，返回问题列表（为空表示通过）
+
+    需在新进程中调用，否则此前导入的模块会造成误判。
+    """
+    problems = []
+    loaded = [name for name in PLOTTING_MODULES if name in sys.modules]
+    if loaded:
+        return [f"检查前已加载: {', '.join(loaded)}"]
+
+    sys.path.insert(0, BACKEND_DIR)
+    import main_app
+
+    for method, path, query, body in COMPUTE_ROUTES:
+        route = f"{method} {path}{'?' + query if query else ''}"
+        status = asyncio.run(_asgi_request(main_app.app, method, path, query, body))
+        if status != 200:
+            problems.append(f"{route} 返回 {status}")
+        loaded = [name for name in PLOTTING_MODULES if name in sys.modules]
+        if loaded:
+            problems.append(f"{route} 加载了 {', '.join(loaded)}")
+            break
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="冷启动分析与部署前检查")
+    parser.add_argument('--check', action='store_true', help="检查计算类接口不加载绘图依赖")
+    parser.add_argument('--build-font-cache', action='store_true', help="预生成 matplotlib 字体缓存")
+    parser.add_argument('--module', default='main_app', help="导入耗时报告的目标模块")
+    parser.add_argument('--top', type=int, default=15, help="报告显示的包数量")
+    args = parser.parse_args(argv)
+
+    if args.build_font_cache:
+        print(f"字体缓存已生成: {build_font_cache()}")
+        return 0
+
+    if args.check:
+        problems = check_compute_routes()
+        for problem in problems:
+            print(f"失败: {problem}")
+        if not problems:
+            print(f"通过: {len(COMPUTE_ROUTES)} 个计算类接口均未加载 {', '.join(PLOTTING_MODULES)}")
+        return 1 if problems else 0
+
+    elapsed, packages = import_profile(args.module)
+    print(f"导入 {args.module} 总耗时 {elapsed:.2f}s（含解释器启动）")
+    for package, seconds in packages[:args.top]:
+        print(f"  {package:<24} {seconds * 1000:8.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+# executor.py - 有界计算执行器（准入队列、背压、请求合并）
+"""
+异步接口把 CPU 密集的计算交给专用的有界线程池：
+
+- 每个执行器有固定数量的工作线程，工作线程全忙时请求在准入队列中等待
+- 队列已满时立即拒绝 (429)，排队超过 queue_timeout 秒仍未开始时放弃 (503)，
+  两者都带根据队列长度与平均耗时估算的 Retry-After
+- 相同键的并发请求只计算一次，其余请求等待同一结果
+- 计算开始后即使客户端断开也会执行完毕，结果仍交给合并进来的其他请求
+
+交互请求与批量请求使用不同的执行器，长时间的批量计算不会占满交互请求的工作线程。
+"""
+import asyncio
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# 请求分段计时（metrics 模块不可用时不记录）
+try:
+    from metrics import record_stage, record_queue_wait
+except ImportError:
+    def record_stage(stage: str, seconds: float):
+        pass
+
+    def record_queue_wait(executor: str, seconds: float):
+        pass
+
+
+class Overloaded(Exception):
+    """执行器过载：队列已满 (429) 或排队超时 (503)"""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def request_key(*parts: Any) -> str:
+    """把接口名与请求内容序列化为合并用的键，字段顺序不影响结果"""
+    return json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        print(f"{name} 配置无效，使用默认值: {default}")
+        return default
+
+
+def _consume_exception(future: asyncio.Future):
+    """合并用的 Future 可能没有等待者，提前取出异常以免记录 "never retrieved" 警告"""
+    if not future.cancelled():
+        future.exception()
+
+
+def _copy_outcome(source: asyncio.Future, target: asyncio.Future):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def _timed_call(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """在工作线程中执行 func，耗时计入当前请求的 compute 阶段"""
+    started = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        record_stage('compute', time.perf_counter() - started)
+
+
+class ComputeExecutor:
+    """有界线程池 + 准入队列 + 同键请求合并"""
+
+    def __init__(self, name: str, workers: int = 4, queue_size: int = 64, queue_timeout: float = 5.0):
+        """
+        Args:
+            name: 执行器名称，环境变量 PSYCHRO_<NAME>_WORKERS / _QUEUE / _QUEUE_TIMEOUT 可覆盖下列参数
+            workers: 工作线程数
+            queue_size: 等待中的请求上限，超出时返回 429
+            queue_timeout: 排队等待上限（秒），超出时返回 503
+        """
+        prefix = f'PSYCHRO_{name.upper()}_'
+        self.name = name
+        self.workers = max(1, _env_number(prefix + 'WORKERS', workers, int))
+        self.queue_size = max(0, _env_number(prefix + 'QUEUE', queue_size, int))
+        self.queue_timeout = _env_number(prefix + 'QUEUE_TIMEOUT', queue_timeout, float)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'psychro-{name}')
+        self._lock = threading.Lock()
+        self._loop = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._waiting = 0
+        self._running = 0
+        self._avg_seconds = 0.05  # 单次计算耗时的指数移动平均
+        self._counters = {'completed': 0, 'coalesced': 0, 'rejected': 0, 'timed_out': 0}
+
+    def _bind(self):
+        """信号量与进行中的请求属于当前事件循环，循环更换（如 Serverless 每次调用新建）时重建"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.workers)
+            self._inflight = {}
+            self._waiting = 0
+        return loop
+
+    def retry_after(self) -> int:
+        """估算队列排空所需的秒数"""
+        backlog = self._waiting + self._running
+        return max(1, math.ceil(backlog * self._avg_seconds / self.workers))
+
+    def _finish(self, slots: asyncio.Semaphore, started: float):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._running -= 1
+            self._counters['completed'] += 1
+            self._avg_seconds += 0.2 * (elapsed - self._avg_seconds)
+        slots.release()
+
+    def check_admission(self):
+        """队列已满时抛出 Overloaded (429)；流式接口在开始输出前调用，过载时直接拒绝"""
+        if self._waiting + self._running >= self.workers + self.queue_size:
+            self._counters['rejected'] += 1
+            raise Overloaded(f"服务繁忙 ({self.name})，请稍后重试", 429, self.retry_after())
+
+    async def _admit(self):
+        """等待空闲工作线程；队列已满或等待超时时抛出 Overloaded"""
+        self.check_admission()
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._counters['timed_out'] += 1
+            raise Overloaded(f"排队超时 ({self.name})，请稍后重试", 503, self.retry_after())
+        finally:
+            self._waiting -= 1
+
+    async def run(self, key: Optional[Hashable], func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在工作线程中执行 func(*args, **kwargs) 并等待结果
+
+        Args:
+            key: 合并键，键相同的并发请求（包括仍在排队的）共享一次计算；为 None 时不合并
+        """
+        loop = self._bind()
+        shared = None
+        if key is not None:
+            shared = self._inflight.get(key)
+            if shared is not None:
+                self._counters['coalesced'] += 1
+                return await asyncio.shield(shared)
+            # 排队前就登记，排队期间到达的相同请求也能合并
+            shared = loop.create_future()
+            shared.add_done_callback(_consume_exception)
+            inflight = self._inflight
+            inflight[key] = shared
+            shared.add_done_callback(lambda _: inflight.pop(key, None))
+
+        queued = time.perf_counter()
+        try:
+            await self._admit()
+        except BaseException as e:
+            if shared is not None and not shared.done():
+                if isinstance(e, Exception):
+                    shared.set_exception(e)
+                else:
+                    shared.cancel()
+            raise
+
+        with self._lock:
+            self._running += 1
+        started = time.perf_counter()
+        record_stage('queue', started - queued)
+        record_queue_wait(self.name, started - queued)
+        # 把缓存统计范围、请求计时等上下文变量带入工作线程
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(self._pool, lambda: context.run(_timed_call, func, *args, **kwargs))
+        slots = self._slots
+        future.add_done_callback(lambda _: self._finish(slots, started))
+        if shared is not None:
+            future.add_done_callback(lambda done: _copy_outcome(done, shared))
+        # shield：调用方被取消时计算继续，结果仍交给合并进来的请求
+        return await asyncio.shield(future if shared is None else shared)
+
+    def active(self) -> int:
+        """排队中与执行中的请求数（可在工作线程中读取）"""
+        return self._waiting + self._running
+
+    def stats(self) -> Dict[str, Any]:
+        """返回工作线程、队列与合并/拒绝计数"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update({
+                'workers': self.workers,
+                'running': self._running,
+                'waiting': self._waiting,
+                'queue_size': self.queue_size,
+                'avg_seconds': round(self._avg_seconds, 4),
+            })
+        return stats
+
+
+# 交互请求（单点计算、混风、图表数据）与批量请求（多点计算、图片渲染）分开排队
+interactive = ComputeExecutor('interactive', workers=4, queue_size=64, queue_timeout=2.0)
+bulk = ComputeExecutor('bulk', workers=2, queue_size=16, queue_timeout=10.0)
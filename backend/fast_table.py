@@ -0,0 +1,312 @@
+# fast_table.py - 预计算插值表（fast 模式）
+"""
+常用压力下 (T, W) 网格上的预计算属性表，供 ``mode=fast`` 的计算接口按双线性插值直接查表。
+
+- 表文件由本模块的命令行工具生成，随部署包发布，运行时以内存映射方式只读加载
+- 构建时在每个网格单元的中心、各边中点以及随机点上与精确计算比对，
+  误差超过容差的单元（以及湿球温度在冰点附近、两支解可能跳变的单元）标记为不可用；
+  文件头记录各输出列在全部校验点上的最大误差
+- 不在表内的输入（压力不匹配、超出网格、靠近饱和线或被标记的单元）回退到精确计算
+  （向量化关联式，必要时 CoolProp）
+
+用法::
+
+    python fast_table.py build [--output psychro_table.bin] [--pressures 101325,89876]
+    python fast_table.py info [psychro_table.bin]
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+import batch_engine
+
+# 默认表文件位置，可通过 PSYCHRO_FAST_TABLE 覆盖
+DEFAULT_TABLE_PATH = os.environ.get(
+    'PSYCHRO_FAST_TABLE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'psychro_table.bin')
+)
+
+# 查表得到的输出列；tdb 与 w 由标准状态直接给出
+TABLE_COLUMNS = ('twb', 'rh', 'h', 'tdp')
+
+# 各列允许的最大插值误差（°C, %, kJ/kg, °C），超出的单元不参与查表
+DEFAULT_TOLERANCE = {'twb': 0.02, 'rh': 0.05, 'h': 0.02, 'tdp': 0.02}
+
+# 默认网格：干球温度 -30~50 °C，含湿量 0~30 g/kg
+DEFAULT_GRID = {'t_min': -30.0, 't_max': 50.0, 't_step': 0.5, 'w_max': 0.030, 'w_step': 0.0002}
+
+# 查表时压力的匹配容差 (Pa)
+PRESSURE_TOLERANCE = 1.0
+
+_MAGIC = b'PSYTBL01'
+# 文件头（魔数 + 长度 + JSON）固定占用的字节数，数据区从此处开始
+_HEADER_BYTES = 4096
+
+
+def _bilinear(corner, i, j, fx, fy):
+    """以单元 (i, j) 的四个角点 corner(i, j) 按单元内偏移 (fx, fy) 双线性插值"""
+    return (corner(i, j) * (1 - fx) * (1 - fy) + corner(i + 1, j) * fx * (1 - fy)
+            + corner(i, j + 1) * (1 - fx) * fy + corner(i + 1, j + 1) * fx * fy)
+
+
+def _exact(T: np.ndarray, W: np.ndarray, P: float) -> Dict[str, np.ndarray]:
+    """精确计算表列；饱和线以上的状态为 NaN"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        derived = batch_engine.derive_properties(T, W, P)
+        supersaturated = batch_engine.relative_humidity(T, W, P) > 1.0 + 1e-9
+    return {name: np.where(supersaturated, np.nan, derived[name]) for name in TABLE_COLUMNS}
+
+
+class LookupTable:
+    """内存映射的插值表"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"不是有效的插值表文件: {path}")
+            (header_size,) = struct.unpack('<I', f.read(4))
+            self.header = json.loads(f.read(header_size).decode('utf-8'))
+        grid = self.header['grid']
+        self.path = path
+        self.pressures = np.array(self.header['pressures'], dtype=float)
+        self.columns = tuple(self.header['columns'])
+        self.max_error = self.header['max_error']
+        self.t0, self.dt = grid['t_min'] + 273.15, grid['t_step']
+        self.w0, self.dw = 0.0, grid['w_step']
+        self.nt, self.nw = grid['nt'], grid['nw']
+        shape = (len(self.pressures), len(self.columns), self.nt, self.nw)
+        self.values = np.memmap(path, dtype=self.header['dtype'], mode='r',
+                                offset=self.header['values_offset'], shape=shape)
+        self.usable = np.memmap(path, dtype=np.uint8, mode='r', offset=self.header['mask_offset'],
+                                shape=(len(self.pressures), self.nt - 1, self.nw - 1))
+
+    def lookup(self, T, W, P) -> Dict[str, np.ndarray]:
+        """
+        按 (T, W, P) 插值
+
+        Returns:
+            {'hit': bool 数组, 各表列: 数组（未命中的行为 NaN）}
+        """
+        T = np.atleast_1d(np.asarray(T, dtype=float))
+        W = np.broadcast_to(np.asarray(W, dtype=float), T.shape)
+        P = np.broadcast_to(np.asarray(P, dtype=float), T.shape)
+
+        distance = np.abs(P[:, None] - self.pressures[None, :])
+        k = distance.argmin(axis=1)
+        x = (T - self.t0) / self.dt
+        y = (W - self.w0) / self.dw
+        with np.errstate(invalid='ignore'):
+            hit = (distance[np.arange(T.size), k] <= PRESSURE_TOLERANCE) \
+                & (x >= 0) & (x <= self.nt - 1) & (y >= 0) & (y <= self.nw - 1)
+        i = np.clip(np.floor(np.where(hit, x, 0)).astype(np.intp), 0, self.nt - 2)
+        j = np.clip(np.floor(np.where(hit, y, 0)).astype(np.intp), 0, self.nw - 2)
+        hit &= self.usable[k, i, j].astype(bool)
+
+        result = {'hit': hit}
+        rows = np.flatnonzero(hit)
+        k, i, j = k[rows], i[rows], j[rows]
+        fx, fy = x[rows] - i, y[rows] - j
+        for n, name in enumerate(self.columns):
+            column = np.full(T.shape, np.nan)
+            column[rows] = _bilinear(lambda a, b: self.values[k, n, a, b], i, j, fx, fy)
+            result[name] = column
+        return result
+
+    def info(self) -> Dict[str, Any]:
+        return {'path': self.path, **{k: v for k, v in self.header.items() if not k.endswith('_offset')}}
+
+
+_table: Optional[LookupTable] = None
+_table_loaded = False
+_table_lock = threading.Lock()
+
+
+def get_table() -> Optional[LookupTable]:
+    """加载默认表文件（只加载一次）；文件不存在或损坏时返回 None"""
+    global _table, _table_loaded
+    if not _table_loaded:
+        with _table_lock:
+            if not _table_loaded:
+                if os.path.exists(DEFAULT_TABLE_PATH):
+                    try:
+                        _table = LookupTable(DEFAULT_TABLE_PATH)
+                    except Exception as e:
+                        print(f"插值表加载警告: {e}")
+                _table_loaded = True
+    return _table
+
+
+def compute_batch_fast(inputs: Dict[str, Any], pressure) -> Dict[str, Any]:
+    """
+    与 batch_engine.compute_batch 相同的接口：先解析标准状态 (T, W, P)，表内的行查表插值，
+    其余行按精确路径计算
+    """
+    table = get_table()
+    if table is None:
+        return batch_engine.compute_batch(inputs, pressure)
+    try:
+        T, W, P = batch_engine.resolve_state(inputs, pressure)
+    except ValueError:
+        return batch_engine.compute_batch(inputs, pressure)
+    # 复制为可写数组，未命中的行稍后用精确结果覆盖
+    T, W, P = (np.array(np.broadcast_to(a, np.shape(T)), dtype=float).ravel() for a in (T, W, P))
+
+    found = table.lookup(T, W, P)
+    hit = found['hit']
+    columns = {
+        'tdb': T - 273.15, 'w': W * 1000.0,
+        'T': T, 'W': W, 'P': P,
+        'success': hit.copy(), 'error': [None] * T.size,
+    }
+    for name in TABLE_COLUMNS:
+        columns[name] = found[name]
+
+    missed = np.flatnonzero(~hit)
+    if missed.size:
+        values, _ = batch_engine._broadcast_inputs(inputs, pressure)
+        exact = batch_engine.compute_batch({code: np.ravel(a)[missed] for code, a in values.items()}, P[missed])
+        for name in batch_engine.OUTPUT_COLUMNS + batch_engine.STATE_COLUMNS + ('success',):
+            columns[name][missed] = exact[name]
+        for row, error in zip(missed, exact['error']):
+            columns['error'][row] = error
+    return columns
+
+
+# --- 构建 ---
+
+def build_table(path: str, pressures: Sequence[float], t_min: float = DEFAULT_GRID['t_min'],
+                t_max: float = DEFAULT_GRID['t_max'], t_step: float = DEFAULT_GRID['t_step'],
+                w_max: float = DEFAULT_GRID['w_max'], w_step: float = DEFAULT_GRID['w_step'],
+                tolerance: Optional[Dict[str, float]] = None, samples: int = 20000,
+                seed: int = 0) -> Dict[str, Any]:
+    """
+    计算并写入插值表
+
+    Args:
+        path: 输出文件
+        pressures: 压力列表 (Pa)
+        t_min, t_max, t_step: 干球温度网格 (°C)
+        w_max, w_step: 含湿量网格 (kg/kg)
+        tolerance: 各列容差，默认 DEFAULT_TOLERANCE
+        samples: 每个压力额外抽查的随机点数
+
+    Returns:
+        写入的文件头
+    """
+    tolerance = dict(DEFAULT_TOLERANCE, **(tolerance or {}))
+    nt = int(round((t_max - t_min) / t_step)) + 1
+    nw = int(round(w_max / w_step)) + 1
+    T_axis = t_min + 273.15 + t_step * np.arange(nt)
+    W_axis = w_step * np.arange(nw)
+    rng = np.random.default_rng(seed)
+
+    values = np.empty((len(pressures), len(TABLE_COLUMNS), nt, nw), dtype=np.float32)
+    usable = np.empty((len(pressures), nt - 1, nw - 1), dtype=np.uint8)
+    max_error = {name: 0.0 for name in TABLE_COLUMNS}
+
+    # 校验点：每个单元的中心与两条边的中点，以及随机点
+    ci, cj = (a.ravel() for a in np.meshgrid(np.arange(nt - 1), np.arange(nw - 1), indexing='ij'))
+    checks = [(ci, cj, 0.5, 0.5), (ci, cj, 0.5, 0.0), (ci, cj, 0.0, 0.5)]
+
+    for k, P in enumerate(pressures):
+        T, W = np.meshgrid(T_axis, W_axis, indexing='ij')
+        exact = _exact(T, W, P)
+        for n, name in enumerate(TABLE_COLUMNS):
+            values[k, n] = exact[name]
+        # 按写入文件的精度 (float32) 校验
+        grid = values[k].astype(float)
+        ok = np.isfinite(_bilinear(lambda a, b: grid[:, a, b], ci, cj, 0.5, 0.5)).all(axis=0)
+        # 湿球温度在 0 °C 附近有冰面/水面两支解，单元内可能跳变，不做插值
+        twb = grid[TABLE_COLUMNS.index('twb')]
+        for a, b in ((ci, cj), (ci + 1, cj), (ci, cj + 1), (ci + 1, cj + 1)):
+            ok &= ~(np.abs(twb[a, b]) < batch_engine.WET_BULB_FREEZING_BAND)
+
+        random = (rng.integers(0, nt - 1, samples), rng.integers(0, nw - 1, samples),
+                  rng.random(samples), rng.random(samples))
+        errors = []
+        for i, j, fx, fy in checks + [random]:
+            reference = _exact(T_axis[i] + fx * t_step, W_axis[j] + fy * w_step, P)
+            for n, name in enumerate(TABLE_COLUMNS):
+                error = np.abs(_bilinear(lambda a, b: grid[n, a, b], i, j, fx, fy) - reference[name])
+                errors.append((name, i, j, error))
+
+        # 任一校验点超差（或为 NaN）的单元不参与查表
+        ok = ok.reshape(nt - 1, nw - 1)
+        for name, i, j, error in errors:
+            with np.errstate(invalid='ignore'):
+                bad = ~(error <= tolerance[name])
+            ok[i[bad], j[bad]] = False
+        usable[k] = ok
+        for name, i, j, error in errors:
+            kept = error[ok[i, j]]
+            if kept.size:
+                max_error[name] = max(max_error[name], float(kept.max()))
+
+    header = {
+        'version': 1,
+        'dtype': 'float32',
+        'pressures': [float(p) for p in pressures],
+        'columns': list(TABLE_COLUMNS),
+        'grid': {'t_min': t_min, 't_max': t_max, 't_step': t_step, 'w_max': w_max, 'w_step': w_step,
+                 'nt': nt, 'nw': nw},
+        'tolerance': tolerance,
+        'max_error': {name: round(value, 6) for name, value in max_error.items()},
+        'usable_cells': round(float(usable.mean()), 4),
+        'values_offset': _HEADER_BYTES,
+        'mask_offset': _HEADER_BYTES + values.nbytes,
+    }
+    head = json.dumps(header).encode('utf-8')
+    if len(_MAGIC) + 4 + len(head) > _HEADER_BYTES:
+        raise ValueError("文件头过长，请减少压力数量")
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(struct.pack('<I', len(head)))
+        f.write(head.ljust(_HEADER_BYTES - len(_MAGIC) - 4))
+        f.write(values.tobytes())
+        f.write(usable.tobytes())
+    os.replace(tmp, path)
+    return header
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="构建或查看 fast 模式插值表")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="构建插值表")
+    build.add_argument('--output', default=DEFAULT_TABLE_PATH)
+    build.add_argument('--pressures', help="逗号分隔的压力 (Pa)，默认为 performance.STANDARD_PRESSURES")
+    build.add_argument('--t-min', type=float, default=DEFAULT_GRID['t_min'])
+    build.add_argument('--t-max', type=float, default=DEFAULT_GRID['t_max'])
+    build.add_argument('--t-step', type=float, default=DEFAULT_GRID['t_step'])
+    build.add_argument('--w-max', type=float, default=DEFAULT_GRID['w_max'], help="kg/kg")
+    build.add_argument('--w-step', type=float, default=DEFAULT_GRID['w_step'], help="kg/kg")
+
+    info = commands.add_parser('info', help="查看插值表信息")
+    info.add_argument('path', nargs='?', default=DEFAULT_TABLE_PATH)
+
+    args = parser.parse_args(argv)
+    if args.command == 'info':
+        print(json.dumps(LookupTable(args.path).info(), ensure_ascii=False, indent=2))
+        return 0
+
+    if args.pressures:
+        pressures = [float(p) for p in args.pressures.split(',') if p.strip()]
+    else:
+        from performance import STANDARD_PRESSURES
+        pressures = list(STANDARD_PRESSURES)
+    header = build_table(args.output, pressures, args.t_min, args.t_max, args.t_step, args.w_max, args.w_step)
+    print(f"已写入 {args.output}（{os.path.getsize(args.output) / 1e6:.1f} MB，可用单元 {header['usable_cells']:.1%}）")
+    for name, error in header['max_error'].items():
+        print(f"{name:>4}: 最大误差 {error:.4f} (容差 {header['tolerance'][name]})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
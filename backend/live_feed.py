@@ -0,0 +1,276 @@
+# live_feed.py - WebSocket 实时传感器数据流
+"""
+BMS 传感器按约 1 Hz 推送温湿度，服务端计算全部状态参数后推回，用于看板与报警。
+
+- 多路复用：一个连接可以承载上千个传感器，每帧为一个 {sensor_id, inputs} 或其数组
+- 微批：每个 tick（默认 100 ms）把期间收到的数据按输入组合合并为一次向量化计算
+  （calculator.compute_rows，与 /calculate-multiple 相同）；同一传感器在一个 tick 内只保留最新的一帧
+- 去重：计算结果与该传感器上次推送的结果相同时不再推送
+- 背压：每个连接的发送队列有上限，客户端来不及接收时丢弃最旧的结果，并在消息中给出累计丢弃数；
+  计算执行器过载时本 tick 的数据留到下一个 tick
+
+协议（JSON 文本帧）::
+
+    客户端 → 服务端  {"sensor_id": "AHU-1/SA", "inputs": {"T": 296.15, "R": 0.55}}  或其数组
+                     inputs 同 /calculate（可单独带 P，默认使用连接的 pressure 参数）
+    服务端 → 客户端  {"tick": 12, "results": [{"sensor_id": "AHU-1/SA", "tdb": 23.0, ..., "success": true}],
+                      "dropped": 0}
+                     计算失败的项为 {"sensor_id", "success": false, "error"}，无效帧为 {"error": "..."}
+
+配置：PSYCHRO_LIVE_TICK（秒，默认 0.1）、PSYCHRO_LIVE_QUEUE（每个连接的发送队列长度，默认 10000）、
+PSYCHRO_LIVE_MAX_SENSORS（每个连接的传感器数上限，默认 20000）。
+
+负载测试（需要 websockets 包，服务端以 uvicorn 运行）::
+
+    python live_feed.py --url ws://127.0.0.1:7000/live --sensors 2000 --rate 1 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Set
+
+from starlette.websockets import WebSocketDisconnect
+
+# 连接数与推送计数（metrics 模块不可用时不记录）
+try:
+    from metrics import record_live, record_live_connection
+except ImportError:
+    def record_live(kind: str, count: int = 1):
+        pass
+
+    def record_live_connection(delta: int):
+        pass
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        print(f"{name} 配置无效，使用默认值: {default}")
+        return default
+
+
+TICK_SECONDS = _env_number('PSYCHRO_LIVE_TICK', 0.1, float)
+QUEUE_SIZE = _env_number('PSYCHRO_LIVE_QUEUE', 10000, int)
+MAX_SENSORS = _env_number('PSYCHRO_LIVE_MAX_SENSORS', 20000, int)
+# 单条消息最多携带的结果数
+SEND_BATCH = 2000
+
+# 与上次推送比较的字段
+_COMPARED_FIELDS = ('tdb', 'twb', 'rh', 'w', 'h', 'tdp', 'success', 'error')
+
+
+class FeedSession:
+    """一个 WebSocket 连接的状态：待计算的最新输入、各传感器上次推送的结果与有界发送队列"""
+
+    def __init__(self, compute: Callable[[List[Dict[str, Any]]], Awaitable[List[Dict[str, Any]]]],
+                 queue_size: int = QUEUE_SIZE, max_sensors: int = MAX_SENSORS):
+        """
+        Args:
+            compute: compute(rows) 异步计算一批输入，返回与 rows 一一对应的结果（格式同 calculate_properties）
+        """
+        self._compute = compute
+        self.max_sensors = max_sensors
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._last: Dict[str, tuple] = {}
+        # 已接纳的传感器（含尚未算出首个结果的），用于限制传感器数
+        self._sensors: Set[str] = set()
+        self._outbox: deque = deque(maxlen=max(1, queue_size))
+        self.ready = asyncio.Event()
+        self.ticks = 0
+        self.stats = {'received': 0, 'computed': 0, 'pushed': 0, 'suppressed': 0, 'dropped': 0, 'invalid': 0}
+
+    def _enqueue(self, item: Dict[str, Any]):
+        if len(self._outbox) == self._outbox.maxlen:
+            # deque 满时 append 会挤掉最旧的一项
+            self.stats['dropped'] += 1
+            record_live('dropped')
+        self._outbox.append(item)
+        self.ready.set()
+
+    def reject(self, message: str):
+        """向客户端报告无效的帧"""
+        self.stats['invalid'] += 1
+        self._enqueue({'error': message})
+
+    def submit(self, frame: Any):
+        """接收一帧（单个对象或数组），每个传感器只保留最新的输入"""
+        for item in frame if isinstance(frame, list) else [frame]:
+            if not isinstance(item, dict) or not isinstance(item.get('inputs'), dict):
+                self.reject("每项应为 {\"sensor_id\": ..., \"inputs\": {...}}")
+                continue
+            sensor_id = item.get('sensor_id')
+            if not isinstance(sensor_id, (str, int)) or isinstance(sensor_id, bool):
+                self.reject("sensor_id 应为字符串或整数")
+                continue
+            sensor_id = str(sensor_id)
+            if sensor_id not in self._sensors:
+                if len(self._sensors) >= self.max_sensors:
+                    self.reject(f"传感器数超过上限 {self.max_sensors}: {sensor_id}")
+                    continue
+                self._sensors.add(sensor_id)
+            self._pending[sensor_id] = item['inputs']
+            self.stats['received'] += 1
+
+    async def tick(self):
+        """计算本 tick 收到的输入，把变化了的结果放入发送队列"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        sensors = list(batch)
+        try:
+            results = await self._compute([batch[sensor_id] for sensor_id in sensors])
+        except Exception:
+            # 执行器过载等：留到下一个 tick，期间收到的更新的输入优先
+            for sensor_id in sensors:
+                self._pending.setdefault(sensor_id, batch[sensor_id])
+            raise
+        self.ticks += 1
+        self.stats['computed'] += len(sensors)
+        suppressed = 0
+        for sensor_id, result in zip(sensors, results):
+            signature = tuple(result.get(field) for field in _COMPARED_FIELDS)
+            if self._last.get(sensor_id) == signature:
+                suppressed += 1
+                continue
+            self._last[sensor_id] = signature
+            self._enqueue(dict(result, sensor_id=sensor_id))
+        self.stats['suppressed'] += suppressed
+        record_live('suppressed', suppressed)
+
+    def drain(self, limit: int = SEND_BATCH) -> List[Dict[str, Any]]:
+        """取出至多 limit 项待发送的结果"""
+        items = []
+        while self._outbox and len(items) < limit:
+            items.append(self._outbox.popleft())
+        if not self._outbox:
+            self.ready.clear()
+        return items
+
+
+async def serve(websocket, session: FeedSession, tick_seconds: float = TICK_SECONDS):
+    """
+    在已接受的 WebSocket 上运行数据流：接收、按 tick 计算、发送三个任务并行，任一结束（如断开）即全部结束
+
+    websocket 需提供 Starlette WebSocket 的 receive_text / send_text。
+    """
+    async def receive():
+        while True:
+            text = await websocket.receive_text()
+            try:
+                frame = json.loads(text)
+            except ValueError:
+                session.reject("帧不是有效的 JSON")
+                continue
+            session.submit(frame)
+
+    async def compute():
+        while True:
+            await asyncio.sleep(tick_seconds)
+            try:
+                await session.tick()
+            except Exception as e:
+                print(f"实时数据流计算警告: {e}")
+
+    async def send():
+        while True:
+            await session.ready.wait()
+            items = session.drain()
+            if items:
+                await websocket.send_text(json.dumps(
+                    {'tick': session.ticks, 'results': items, 'dropped': session.stats['dropped']},
+                    ensure_ascii=False, separators=(',', ':')
+                ))
+                session.stats['pushed'] += len(items)
+                record_live('pushed', len(items))
+
+    record_live_connection(1)
+    tasks = [asyncio.ensure_future(coro) for coro in (receive(), compute(), send())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            # 断开连接以外的异常继续抛出（被取消的子任务不算异常）
+            error = None if task.cancelled() else task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+        # 宿主任务被取消（如服务器关闭）时 finally 中的 await 会再次收到取消：
+        # shield 保证子任务仍被等待结束，清理期间的 CancelledError 在此吞掉，宿主原有的取消照常向外传播
+        try:
+            await asyncio.shield(asyncio.gather(*tasks, return_exceptions=True))
+        except asyncio.CancelledError:
+            pass
+        record_live_connection(-1)
+
+
+# --- 负载测试客户端 ---
+
+async def run_load(url: str, sensors: int, rate: float, duration: float, slices: int = 10,
+                   step: float = 0.05) -> Dict[str, Any]:
+    """
+    模拟 sensors 个传感器以 rate Hz 推送 (T, R)，每秒分 slices 帧发送；温度按 step K 随机游走，
+    约一半的传感器保持不变，用于检验去重
+
+    Returns:
+        发送与接收统计：frames、readings、messages、results、errors、max_dropped、results_per_second
+    """
+    import websockets
+
+    rng = random.Random(0)
+    state = {f'S{i:05d}': [rng.uniform(288.15, 303.15), rng.uniform(0.3, 0.7)] for i in range(sensors)}
+    ids = list(state)
+    stats = {'frames': 0, 'readings': 0, 'messages': 0, 'results': 0, 'errors': 0, 'max_dropped': 0}
+
+    async with websockets.connect(url, max_size=None) as ws:
+        async def receive():
+            async for message in ws:
+                payload = json.loads(message)
+                stats['messages'] += 1
+                stats['results'] += sum(1 for item in payload['results'] if 'sensor_id' in item)
+                stats['errors'] += sum(1 for item in payload['results'] if 'sensor_id' not in item)
+                stats['max_dropped'] = max(stats['max_dropped'], payload['dropped'])
+
+        receiver = asyncio.ensure_future(receive())
+        started = time.perf_counter()
+        interval = 1.0 / (rate * slices)
+        frame = 0
+        while time.perf_counter() - started < duration:
+            part = ids[frame % slices::slices]
+            readings = []
+            for sensor_id in part:
+                values = state[sensor_id]
+                if rng.random() < 0.5:
+                    values[0] += rng.choice((-step, step))
+                readings.append({'sensor_id': sensor_id, 'inputs': {'T': round(values[0], 2), 'R': values[1]}})
+            await ws.send(json.dumps(readings))
+            stats['frames'] += 1
+            stats['readings'] += len(readings)
+            frame += 1
+            await asyncio.sleep(max(0.0, started + frame * interval - time.perf_counter()))
+        # 等待最后一个 tick 的结果
+        await asyncio.sleep(1.0)
+        receiver.cancel()
+        await asyncio.gather(receiver, return_exceptions=True)
+    stats['results_per_second'] = round(stats['results'] / duration, 1)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='/live WebSocket 负载测试客户端')
+    parser.add_argument('--url', default='ws://127.0.0.1:7000/live')
+    parser.add_argument('--sensors', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=1.0, help='每个传感器每秒的读数')
+    parser.add_argument('--duration', type=float, default=10.0, help='秒')
+    args = parser.parse_args(argv)
+    stats = asyncio.run(run_load(args.url, args.sensors, args.rate, args.duration))
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,39 +1,35 @@
 # backend/main_app.py
-import uvicorn
 import os
-from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
+import json
+import hashlib
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from fastapi.responses import Response, JSONResponse, PlainTextResponse
+from fastapi.routing import APIRoute
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from typing import Optional, List, Dict, Any, Literal, Union
 
 # Serverless 环境优化
 import sys
 if '/var/task' not in sys.path:
     sys.path.append('/var/task')
 
-# matplotlib 配置 - Serverless 环境优化
-import matplotlib
-matplotlib.use('Agg')  # 使用非交互式后端
-import matplotlib.pyplot as plt
-plt.ioff()  # 关闭交互模式
-
-# 字体配置 - Serverless 环境
-import matplotlib.font_manager as fm
-try:
-    # 尝试设置中文字体
-    plt.rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans', 'Arial Unicode MS']
-    plt.rcParams['axes.unicode_minus'] = False
-except Exception as e:
-    print(f"字体配置警告: {e}")
+# matplotlib 只在 /render-chart 首次渲染时由 calculator 按需导入并配置字体，
+# 计算类接口不加载绘图依赖（python coldstart.py --check 校验）
 
 # 从我们的核心模块中导入计算函数
 try:
-    from calculator import calculate_properties, create_psych_chart, calculate_multiple_points
+    from calculator import (
+        calculate_properties, create_psych_chart, calculate_multiple_points,
+        render_psych_chart, chart_etag, mix_streams, compute_rows,
+    )
 except ImportError:
     # 如果calculator模块不存在，创建模拟函数
-    def calculate_properties(props_to_send: dict):
+    def calculate_properties(props_to_send: dict, return_state: bool = False, mode: str = 'exact'):
         """模拟计算函数，用于调试"""
         return {
             "tdb": 25.00,
@@ -49,9 +45,117 @@ except ImportError:
         """模拟图表生成函数"""
         return "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
     
-    def calculate_multiple_points(points_data, pressure_pa):
+    def calculate_multiple_points(points_data, pressure_pa, mode='exact'):
         """模拟多点计算函数"""
         return [calculate_properties({'P': pressure_pa, 'T': 298.15, 'R': 0.6})]
+    
+    def compute_rows(rows, pressure_pa, mode='exact'):
+        """模拟批量计算函数"""
+        return [calculate_properties({}) for _ in rows]
+    
+    def chart_etag(pressure_pa, points=None, process_lines=None, fmt='png', dpi=100):
+        """模拟图表内容哈希"""
+        return "mock"
+    
+    def render_psych_chart(pressure_pa, points=None, process_lines=None, etag=None, fmt='png', dpi=100):
+        """模拟图表渲染函数"""
+        import base64
+        return base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==")
+
+    def mix_streams(streams, ratios, pressure_pa, mode='exact'):
+        """模拟多股气流混风函数"""
+        return {"success": True, "streams": [], "mixtures": [calculate_properties({}) for _ in ratios]}
+
+# 渲染池的输出格式与内存上限（不加载 matplotlib）
+try:
+    from render_pool import RENDER_FORMATS, RenderLimitExceeded
+except ImportError:
+    RENDER_FORMATS = {'png': 'image/png'}
+
+    class RenderLimitExceeded(ValueError):
+        pass
+
+# 导入性能优化模块（缓存统计）
+try:
+    from performance import optimizer, chart_background, precompute_chart_backgrounds
+    precompute_chart_backgrounds()
+except ImportError:
+    optimizer = None
+    chart_background = None
+
+# 有界计算执行器：交互请求与批量请求分开排队，过载时快速拒绝
+from executor import interactive, bulk, request_key, Overloaded
+
+# 按成本分级调度：小请求走交互执行器，大批量分时间片执行并让出给交互请求，按客户端配额
+from scheduler import scheduler, estimate_cost, RequestTracker, tune_runtime
+
+# 请求分段计时 (Server-Timing) 与 Prometheus 指标
+import metrics
+
+# 导入流式计算模块
+try:
+    from streaming import stream_calculation, detect_format, BodyStreamingResponse, MEDIA_TYPES
+except ImportError:
+    stream_calculation = None
+
+class TimedRoute(APIRoute):
+    """记录接口函数的进入/返回时间与响应构建完成时间，用于区分 parse / serialize 阶段"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, metrics.timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request: Request) -> Response:
+            response = await handler(request)
+            metrics.mark('route_end')
+            return response
+
+        return timed_handler
+
+# 批量接口的紧凑响应格式（列式 JSON、MessagePack、二进制数组）与压缩
+try:
+    from response_format import negotiate, respond, encoded_json, OutputFormat, Table, FormatUnavailable
+except ImportError:
+    negotiate = None
+
+    def encoded_json(body: bytes, output) -> Response:
+        return Response(body, media_type="application/json")
+
+# 按接口与批量大小的内存峰值记录（PSYCHRO_MEMORY_PROFILE=1 时启用）
+try:
+    from memory_profile import profiler as memory_profiler, note_batch_size
+except ImportError:
+    memory_profiler = None
+
+    def note_batch_size(size: int):
+        pass
+
+# 导入实时传感器数据流模块
+try:
+    from live_feed import FeedSession, serve as serve_live_feed
+except ImportError:
+    FeedSession = None
+
+# 导入过程链模拟模块
+try:
+    from process_chain import simulate_chain, MAX_PROCESS_STEPS
+except ImportError:
+    simulate_chain = None
+    MAX_PROCESS_STEPS = 100
+
+# 导入气象数据分析模块
+try:
+    from weather import analyze_weather, detect_weather_format, MAX_WEATHER_BYTES
+except ImportError:
+    analyze_weather = None
+
+# 导入焓湿图区域归属统计模块
+try:
+    from zones import registry as zone_registry, classify_points, parse_points, MAX_CLASSIFY_BYTES
+except ImportError:
+    zone_registry = None
 
 # 初始化 FastAPI 应用
 app = FastAPI(
@@ -59,6 +163,7 @@ app = FastAPI(
     description="一个统一的服务，提供 API 计算并托管前端应用。",
     version="2.0.0",
 )
+app.router.route_class = TimedRoute
 
 # --- 配置 CORS (跨域资源共享) ---
 # Serverless 环境下的 CORS 配置
@@ -74,6 +179,63 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 统计处理中的请求，批量任务在时间片之间为其让出
+app.add_middleware(RequestTracker, scheduler=scheduler)
+
+# --- 按接口统计缓存命中率 ---
+@app.middleware("http")
+async def cache_scope_middleware(request, call_next):
+    """把请求处理期间的缓存查找计入当前接口路径"""
+    if optimizer is None:
+        return await call_next(request)
+    with optimizer.scope(request.url.path):
+        return await call_next(request)
+
+# --- 内存峰值记录（仅在启用时） ---
+@app.middleware("http")
+async def memory_profile_middleware(request, call_next):
+    """记录请求期间的 Python 分配峰值与进程 RSS 峰值，按路由模板与批量大小汇总"""
+    if memory_profiler is None or not memory_profiler.enabled:
+        return await call_next(request)
+    usage, token = memory_profiler.begin()
+    route_path = "unmatched"
+    try:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            route_path = route.path
+        return response
+    finally:
+        memory_profiler.end(usage, token, route_path)
+
+# --- 请求分段计时（最外层中间件，覆盖其余中间件与路由） ---
+@app.middleware("http")
+async def timing_middleware(request, call_next):
+    """记录各阶段耗时写入 Server-Timing 响应头，并按接口累计延迟直方图"""
+    timings, token = metrics.start_request()
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.end_request(token)
+    total = timings.finish()
+    response.headers["Server-Timing"] = timings.server_timing(total)
+    # 按路由模板而不是实际路径统计，避免标签基数失控
+    route = request.scope.get("route")
+    metrics.request_latency.observe(
+        total, request.method, route.path if route is not None else "unmatched", str(response.status_code)
+    )
+    return response
+
+# --- 过载保护 ---
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc: Overloaded):
+    """执行器队列已满或排队超时：快速返回 429/503，并告知客户端何时重试"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # --- API 数据模型 ---
 
 class PsychroInputs(BaseModel):
@@ -115,6 +277,36 @@ class MixingRequest(BaseModel):
     point2: Dict[str, float] = Field(..., description="状态点2的参数")
     ratio: float = Field(..., description="状态点1的混合比例 (0-1)", ge=0, le=1)
 
+class ProcessStep(BaseModel):
+    op: Literal['heat', 'cool', 'coil', 'humidify', 'mix'] = Field(..., description="过程类型")
+    name: Optional[str] = Field(None, description="出口状态名称，默认 S1、S2…")
+    T: Optional[float] = Field(None, description="heat/cool: 出口干球温度 (K)")
+    dT: Optional[float] = Field(None, description="heat/cool: 温升 (K)，冷却为负")
+    q: Optional[float] = Field(None, description="heat/cool: 单位干空气热量 (J/kg)，冷却为负")
+    adp: Optional[float] = Field(None, description="coil: 机器露点 (K)")
+    bypass_factor: Optional[float] = Field(None, description="coil: 旁通系数 (0-1)", ge=0, le=1)
+    method: Optional[Literal['steam', 'adiabatic']] = Field(None, description="humidify: 加湿方式，默认 steam")
+    R: Optional[float] = Field(None, description="humidify: 出口相对湿度 (0-1)")
+    W: Optional[float] = Field(None, description="humidify: 出口含湿量 (kg/kg)")
+    efficiency: Optional[float] = Field(None, description="humidify (adiabatic): 饱和效率 (0-1)", ge=0, le=1)
+    stream: Optional[Union[str, Dict[str, float]]] = Field(None, description="mix: 此前状态的名称或另一股气流的输入参数")
+    ratio: Optional[float] = Field(None, description="mix: 当前气流的干空气质量比例 (0-1)", ge=0, le=1)
+
+class ProcessChainRequest(BaseModel):
+    pressure: float = Field(..., description="压力 (Pa)")
+    start: Dict[str, float] = Field(..., description="初始状态的输入参数 (CoolProp 代码，SI 单位)")
+    start_name: str = Field("S0", description="初始状态名称")
+    steps: List[ProcessStep] = Field(..., description="按顺序执行的处理过程", min_length=1, max_length=MAX_PROCESS_STEPS)
+
+class MixingSweepRequest(BaseModel):
+    pressure: float = Field(..., description="压力 (Pa)")
+    streams: List[Dict[str, float]] = Field(..., description="各股气流的输入参数 (CoolProp 代码，SI 单位)", min_length=2)
+    ratios: List[List[float]] = Field(..., description="混合比例，每行按气流顺序给出干空气质量（按行和归一化）", min_length=1)
+
+class ZonesRequest(BaseModel):
+    pressure: float = Field(101325.0, description="解析上下限区域使用的压力 (Pa)")
+    zones: List[Dict[str, Any]] = Field(..., description="区域定义：name 加 polygon [[tdb, w], ...] 或 <字段>_min/_max 上下限", min_length=1)
+
 # --- API 端点 ---
 
 @app.get("/health")
@@ -122,43 +314,270 @@ def health_check():
     """健康检查接口"""
     return {"status": "healthy", "message": "服务运行正常", "environment": "serverless"}
 
-@app.post("/calculate", summary="计算湿空气参数")
-def api_calculate(inputs: PsychroInputs):
+@app.get("/cache-stats", summary="缓存统计")
+def cache_stats():
     """
-    根据输入的任意两个湿空气参数，计算所有其他参数。
-    - **注意**: 所有输入值都应为国际单位制 (SI)。
+    返回结果缓存的整体统计，以及各接口的缓存查找次数与有效命中率
+    """
+    if optimizer is None:
+        raise HTTPException(status_code=503, detail="性能优化模块不可用")
+    return {
+        "cache": optimizer.get_cache_stats(),
+        "endpoints": optimizer.get_scope_stats()
+    }
+
+@app.get("/memory-profile", summary="内存峰值记录")
+def memory_profile(reset: bool = False, top: int = 0):
     """
+    按接口与批量大小档位返回请求的分配峰值与 RSS 峰值（服务以 PSYCHRO_MEMORY_PROFILE=1 启动时记录）
+    - **top**: 额外给出当前存活分配最多的源文件数
+    - **reset**: 返回后清空记录，以当前 RSS 为新基线
+    - 保存的响应可用 `python memory_profile.py report` 估算所需的内存规格
+    """
+    if memory_profiler is None:
+        raise HTTPException(status_code=503, detail="内存记录模块不可用")
+    result = memory_profiler.snapshot(top)
+    if reset:
+        memory_profiler.reset()
+    return result
+
+@app.get("/metrics", summary="Prometheus 指标", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """
+    以 Prometheus 文本格式返回按接口的延迟直方图、HAPropsSI 调用次数与耗时、
+    结果缓存与计算执行器计数、冷启动与预热耗时
+    """
+    body = metrics.render(
+        cache_stats=optimizer.get_cache_stats() if optimizer is not None else None,
+        scope_stats=optimizer.get_scope_stats() if optimizer is not None else None,
+        executors=(interactive, bulk),
+    )
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _calculate(props_to_send: dict, mode: str):
     try:
-        props_to_send = inputs.dict(exclude_unset=True)
         if len(props_to_send) != 3: # P + 2 other params
             raise HTTPException(status_code=400, detail=f"输入错误：需要提供压力(P)和另外两个参数。")
-        results = calculate_properties(props_to_send)
+        results = calculate_properties(props_to_send, mode=mode)
         if not results.get("success"):
              raise ValueError("Calculation failed in core module.")
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"计算时发生内部错误: {e}")
 
-@app.post("/calculate-multiple", summary="计算多个状态点")
-def api_calculate_multiple(request: MultiplePointsRequest):
+@app.post("/calculate", summary="计算湿空气参数")
+async def api_calculate(inputs: PsychroInputs, http_request: Request, mode: Literal['exact', 'fast'] = 'exact'):
     """
-    计算多个状态点的所有参数
+    根据输入的任意两个湿空气参数，计算所有其他参数。
+    - **注意**: 所有输入值都应为国际单位制 (SI)。
+    - **mode=fast**: 查预计算插值表，误差不超过表头记录的 max_error，表外的输入按精确路径计算
     """
+    props_to_send = inputs.dict(exclude_unset=True)
+    return await scheduler.run(http_request, estimate_cost([props_to_send], mode),
+                               request_key('calculate', props_to_send, mode), _calculate, props_to_send, mode)
+
+# 批量接口可选的响应格式，见 response_format
+ResponseFormatName = Optional[Literal['json', 'columnar', 'msgpack', 'f32', 'f64']]
+
+# 紧凑格式中逐点数据的列（数值列在二进制格式中为原始数组）
+PROPERTY_COLUMNS = ('tdb', 'twb', 'rh', 'w', 'h', 'tdp')
+
+def _output_format(http_request: Request, fmt: Optional[str]):
+    """按查询参数 format、Accept 与 Accept-Encoding 协商响应格式"""
+    if negotiate is None:
+        if fmt not in (None, 'json'):
+            raise HTTPException(status_code=406, detail="紧凑响应格式不可用")
+        return None
     try:
-        results = calculate_multiple_points(request.points, request.pressure)
-        return {
+        return negotiate(http_request.headers.get("accept"), http_request.headers.get("accept-encoding"), fmt)
+    except FormatUnavailable as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _respond(payload: dict, output, table):
+    """响应格式模块不可用时原样返回，否则在工作线程中编码（带 Vary 头）"""
+    return payload if output is None else respond(payload, output, table)
+
+def _points_table(payload: dict):
+    return Table.from_rows(
+        payload["points"], ('name',) + PROPERTY_COLUMNS + ('color', 'marker', 'size'), PROPERTY_COLUMNS + ('size',),
+        meta={"success": True, "pressure": payload["pressure"]},
+    )
+
+# 超过该大小的 /calculate-multiple 请求体不在事件循环中解析，连同校验一起在 bulk 执行器中按时间片进行
+INLINE_BODY_BYTES = 64 * 1024
+
+# 与 JSONResponse 相同的编码选项，分段编码的结果与整体编码一致
+_JSON_OPTIONS = dict(ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"))
+
+_POINT_LIST = TypeAdapter(List[PointInput])
+
+def _validation_error(error: ValidationError, loc: tuple) -> RequestValidationError:
+    """把 pydantic 校验错误转换为与 FastAPI 请求体校验相同的 422 错误，loc 为错误位置前缀"""
+    return RequestValidationError([
+        {**item, "loc": loc + tuple(item["loc"])} for item in error.errors(include_url=False)
+    ])
+
+def _parse_body(model, body: bytes):
+    """按模型解析 JSON 请求体"""
+    try:
+        return model.model_validate_json(body)
+    except ValidationError as e:
+        raise _validation_error(e, ("body",))
+
+def _body_schema(model) -> dict:
+    """手动读取请求体的接口在 OpenAPI 中仍按模型描述请求体（引用的子模型由其他接口注册）"""
+    schema = model.model_json_schema(ref_template="#/components/schemas/{model}")
+    schema.pop("$defs", None)
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": schema}}}}
+
+def _points_json(points_data: list, pressure: float, mode: str, output) -> Response:
+    """
+    逐个时间片计算并编码为 JSON 片段，拼接结果与 JSONResponse 整体编码相同；
+    不经 jsonable_encoder，也不在事件循环或单次 json.dumps 中长时间占用 GIL
+    """
+    parts = []
+    for start, stop in scheduler.slices(len(points_data), "calculate-multiple"):
+        results = calculate_multiple_points(points_data[start:stop], pressure, mode)
+        parts.append(json.dumps(results, **_JSON_OPTIONS)[1:-1])
+    body = '{"success":true,"pressure":%s,"points":[%s]}' % (
+        json.dumps(pressure, **_JSON_OPTIONS), ",".join(part for part in parts if part))
+    return encoded_json(body.encode("utf-8"), output)
+
+def _calculate_multiple(points_data: list, pressure: float, mode: str, output):
+    try:
+        if output is None or output.format == "json":
+            return _points_json(points_data, pressure, mode, output)
+        results = []
+        for start, stop in scheduler.slices(len(points_data), "calculate-multiple"):
+            results.extend(calculate_multiple_points(points_data[start:stop], pressure, mode))
+        payload = {
             "success": True,
-            "pressure": request.pressure,
+            "pressure": pressure,
             "points": results
         }
+        return _respond(payload, output, _points_table)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"计算时发生内部错误: {e}")
 
-@app.post("/generate-chart", summary="生成焓湿图")
-def api_generate_chart(request: ChartRequest):
+def _calculate_multiple_body(body: bytes, mode: str, output):
+    """大请求体：解析后按时间片校验状态点，再按时间片计算"""
+    try:
+        data = json.loads(body)
+    except ValueError as e:
+        raise RequestValidationError([{
+            "type": "json_invalid", "loc": ("body", getattr(e, "pos", 0)), "msg": "JSON decode error",
+            "input": {}, "ctx": {"error": getattr(e, "msg", str(e))},
+        }])
+    try:
+        if not isinstance(data, dict) or not isinstance(data.get("points"), list):
+            MultiplePointsRequest.model_validate(data)  # 结构不对，按整体校验给出错误
+        pressure = MultiplePointsRequest.model_validate({**data, "points": []}).pressure
+    except ValidationError as e:
+        raise _validation_error(e, ("body",))
+    points = data["points"]
+    note_batch_size(len(points))
+
+    points_data = []
+    for start, stop in scheduler.slices(len(points), "validate-points"):
+        try:
+            points_data.extend(_POINT_LIST.dump_python(_POINT_LIST.validate_python(points[start:stop])))
+        except ValidationError as e:
+            raise RequestValidationError([
+                {**item, "loc": ("body", "points", start + item["loc"][0]) + tuple(item["loc"][1:])}
+                for item in e.errors(include_url=False)
+            ])
+    return _calculate_multiple(points_data, pressure, mode, output)
+
+@app.post("/calculate-multiple", summary="计算多个状态点", openapi_extra=_body_schema(MultiplePointsRequest))
+async def api_calculate_multiple(
+    http_request: Request,
+    mode: Literal['exact', 'fast'] = 'exact',
+    format: ResponseFormatName = None,
+):
     """
-    生成包含多个状态点和过程线的数据（不再返回图片）。
+    计算多个状态点的所有参数，请求体为 MultiplePointsRequest
+    - **mode=fast**: 同 /calculate
+    - **format**: 响应格式（也可用 Accept 头协商）：json（默认）、columnar、msgpack、f32、f64；
+      Accept-Encoding 为 gzip / br 时压缩响应
+    - 按点数与输入参数组合估算成本：小批量走交互执行器，大批量分时间片计算，不拖慢单点请求；
+      X-Client-Id 请求头（缺省为客户端 IP）区分客户端的批量任务并发数与计算配额
+    """
+    output = _output_format(http_request, format)
+    body = await http_request.body()
+    if len(body) > INLINE_BODY_BYTES:
+        # 按 "inputs" 出现次数估算点数，解析与校验也计入批量任务
+        return await scheduler.run(http_request, float(body.count(b'"inputs"')), None,
+                                   _calculate_multiple_body, body, mode, output)
+    request = _parse_body(MultiplePointsRequest, body)
+    note_batch_size(len(request.points))
+    points_data = [point.dict() for point in request.points]
+    cost = estimate_cost([point["inputs"] for point in points_data], mode)
+    return await scheduler.run(http_request, cost,
+                               request_key('calculate-multiple', request.pressure, points_data, mode, output),
+                               _calculate_multiple, points_data, request.pressure, mode, output)
+
+@app.post("/calculate-stream", summary="流式批量计算")
+async def api_calculate_stream(
+    request: Request,
+    pressure: float = 101325.0,
+    input_format: Optional[str] = None,
+    output_format: Optional[str] = None,
+    chunk_rows: Optional[int] = None,
+):
+    """
+    流式计算 NDJSON 或 CSV 格式的大批量数据（如 AHU 趋势日志）。
+    - 请求体可分块上传：NDJSON 每行一个对象，CSV 首行为表头
+    - 输入参数使用 CoolProp 代码 (T/B/R/W/H/D/P，SI 单位) 或其别名，其余字段原样带回
+    - 按固定大小分块向量化计算，结果边算边返回，内存占用与数据量无关
     """
+    if stream_calculation is None:
+        raise HTTPException(status_code=503, detail="流式计算模块不可用")
+    try:
+        input_format = detect_format(request.headers.get("content-type"), input_format)
+        output_format = detect_format(None, output_format or input_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if chunk_rows is not None and not 1 <= chunk_rows <= 100000:
+        raise HTTPException(status_code=400, detail="chunk_rows 超出范围 (1~100000)")
+
+    options = {} if chunk_rows is None else {'chunk_rows': chunk_rows}
+    # 分块在 bulk 执行器中计算；队列已满时在开始输出前返回 429
+    bulk.check_admission()
+    # 流式计算持续时间长，不计为需要让出的交互请求
+    scheduler.mark_bulk(request)
+    return BodyStreamingResponse(
+        stream_calculation(request.stream(), pressure, input_format, output_format, **options),
+        media_type=MEDIA_TYPES[output_format],
+    )
+
+@app.websocket("/live")
+async def live_sensor_feed(websocket: WebSocket, pressure: float = 101325.0,
+                           mode: Literal['exact', 'fast'] = 'exact'):
+    """
+    实时传感器数据流（WebSocket）：多个传感器的读数按 tick 合并为一次向量化计算，
+    只推送结果有变化的传感器；客户端接收过慢时丢弃最旧的结果。协议见 live_feed 模块说明
+    """
+    if FeedSession is None:
+        await websocket.close(code=1011)
+        return
+    await websocket.accept()
+
+    async def compute(rows: list) -> list:
+        # 与其它批量请求共用 bulk 执行器的排队与背压
+        return await bulk.run(None, compute_rows, rows, pressure, mode)
+
+    await serve_live_feed(websocket, FeedSession(compute))
+
+def _chart_points_table(payload: dict):
+    rows = [dict(point["properties"], **point) for point in payload["points"]]
+    return Table.from_rows(
+        rows, ('name',) + PROPERTY_COLUMNS + ('color', 'marker', 'size'), PROPERTY_COLUMNS + ('size',),
+        meta={"success": True, "process_lines": payload["process_lines"]},
+    )
+
+def _generate_chart(request: ChartRequest, output=None):
     try:
         # 转换数据格式
         points_data = []
@@ -194,22 +613,135 @@ def api_generate_chart(request: ChartRequest):
                     'width': line.width
                 })
 
-        return {
+        payload = {
             "success": True,
             "points": points_data,
             "process_lines": process_lines_data
         }
+        return _respond(payload, output, _chart_points_table)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成数据时发生内部错误: {e}")
 
-@app.post("/mixing", summary="混风处理")
-def api_mixing(request: MixingRequest):
+@app.post("/generate-chart", summary="生成焓湿图")
+async def api_generate_chart(request: ChartRequest, http_request: Request, format: ResponseFormatName = None):
     """
-    计算两个状态点的混风结果
-    - **point1**: 状态点1的参数 (tdb, w)
-    - **point2**: 状态点2的参数 (tdb, w)  
-    - **ratio**: 状态点1的混合比例 (0-1)
+    生成包含多个状态点和过程线的数据（不再返回图片）。
+    - **format**: 同 /calculate-multiple；紧凑格式中每个点的属性只出现一次（不再重复 properties）
     """
+    output = _output_format(http_request, format)
+    note_batch_size(len(request.points or []))
+    return await interactive.run(request_key('generate-chart', request.dict(), output),
+                                 _generate_chart, request, output)
+
+def _render_chart(request: ChartRequest, if_none_match: str, fmt: str, dpi: int):
+    try:
+        points_data = calculate_multiple_points(
+            [point.dict() for point in request.points or []], request.pressure
+        )
+        chart_points = [
+            {
+                'name': point['name'],
+                'tdb': point['tdb'],
+                'w': point['w'],
+                'color': point['color'],
+                'marker': point['marker'],
+                'size': point['size']
+            }
+            for point in points_data if point.get('success')
+        ]
+        chart_lines = [
+            {
+                'from': line.from_point,
+                'to': line.to_point,
+                'label': line.label,
+                'color': line.color,
+                'style': line.style,
+                'width': line.width
+            }
+            for line in request.process_lines or []
+        ]
+
+        etag = f'"{chart_etag(request.pressure, chart_points, chart_lines, fmt, dpi)}"'
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=600"}
+        if etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        image = render_psych_chart(request.pressure, chart_points, chart_lines, etag=etag.strip('"'),
+                                   fmt=fmt, dpi=dpi)
+        return Response(content=image, media_type=RENDER_FORMATS[fmt], headers=headers)
+    except RenderLimitExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"渲染图表时发生内部错误: {e}")
+
+@app.post("/render-chart", summary="渲染焓湿图图片")
+async def api_render_chart(
+    request: ChartRequest,
+    http_request: Request,
+    format: Literal['png', 'svg', 'webp'] = 'png',
+    dpi: int = 100,
+):
+    """
+    渲染包含状态点和过程线的焓湿图图片。
+    - **format**: png / svg / webp；**dpi**: 输出分辨率，超过渲染内存上限时返回 413
+    - 背景等值线按压力在渲染池中复用，只重绘状态点与过程线，多个请求可并发渲染
+    - 响应带内容哈希 ETag，客户端携带 If-None-Match 重复请求时返回 304
+    """
+    if_none_match = http_request.headers.get("if-none-match", "")
+    note_batch_size(len(request.points or []))
+    # 渲染耗时与点数关系不大，按批量任务处理并计入客户端的批量任务并发数
+    return await scheduler.run(http_request, None,
+                               request_key('render-chart', request.dict(), if_none_match, format, dpi),
+                               _render_chart, request, if_none_match, format, dpi)
+
+@app.get("/chart-background", summary="焓湿图背景等值线")
+async def api_chart_background(
+    http_request: Request,
+    pressure: float = 101325.0,
+    t_min: Optional[float] = None, t_max: Optional[float] = None, t_step: Optional[float] = None,
+    rh_step: Optional[float] = None,
+    h_min: Optional[float] = None, h_max: Optional[float] = None, h_step: Optional[float] = None,
+    twb_min: Optional[float] = None, twb_max: Optional[float] = None, twb_step: Optional[float] = None,
+    v_min: Optional[float] = None, v_max: Optional[float] = None, v_step: Optional[float] = None,
+    w_max: Optional[float] = None,
+):
+    """
+    返回指定压力下的饱和线、等相对湿度线、等焓线、等湿球温度线和等比容线（列式 JSON）。
+    - 所有曲线共用 temp_range (°C)，曲线值为含湿量 (g/kg)，超出范围处为 null
+    - 范围与分辨率可通过查询参数覆盖，步长为 0 表示不返回该类曲线
+    - 内容只取决于参数，带强缓存头与 ETag，客户端可直接绘制而无需服务端渲染
+    """
+    if chart_background is None:
+        raise HTTPException(status_code=503, detail="性能模块不可用")
+    options = {
+        't_min': t_min, 't_max': t_max, 't_step': t_step, 'rh_step': rh_step,
+        'h_min': h_min, 'h_max': h_max, 'h_step': h_step,
+        'twb_min': twb_min, 'twb_max': twb_max, 'twb_step': twb_step,
+        'v_min': v_min, 'v_max': v_max, 'v_step': v_step, 'w_max': w_max,
+    }
+    if not 10000 <= pressure <= 200000:
+        raise HTTPException(status_code=400, detail="压力超出范围 (10000~200000 Pa)")
+    options = {k: v for k, v in options.items() if v is not None}
+    try:
+        body, etag = await interactive.run(request_key('chart-background', pressure, options),
+                                           chart_background, pressure, **options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Overloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"计算背景等值线时发生内部错误: {e}")
+
+    etag = f'"{etag}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400, immutable"}
+    if_none_match = http_request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _mixing(request: MixingRequest):
     try:
         # 计算状态点1的属性
         props1 = {'P': request.pressure}
@@ -224,7 +756,7 @@ def api_mixing(request: MixingRequest):
         if 'W' in request.point1:
             props1['W'] = request.point1['W']
             
-        result1 = calculate_properties(props1)
+        result1 = calculate_properties(props1, return_state=True)
         
         if not result1.get("success"):
             raise HTTPException(status_code=400, detail="状态点1计算失败")
@@ -242,23 +774,26 @@ def api_mixing(request: MixingRequest):
         if 'W' in request.point2:
             props2['W'] = request.point2['W']
             
-        result2 = calculate_properties(props2)
+        result2 = calculate_properties(props2, return_state=True)
         
         if not result2.get("success"):
             raise HTTPException(status_code=400, detail="状态点2计算失败")
         
-        # 混风计算
+        # 混风计算：直接复用两个点的标准状态 (T, W, P)，避免取整误差和重复求解
+        state1 = result1['state']
+        state2 = result2['state']
+
         # 干球温度按质量加权平均
-        tdb_mix = request.ratio * result1['tdb'] + (1 - request.ratio) * result2['tdb']
+        t_mix = request.ratio * state1['T'] + (1 - request.ratio) * state2['T']
         
         # 含湿量按质量加权平均
-        w_mix = request.ratio * result1['w'] + (1 - request.ratio) * result2['w']
+        w_mix = request.ratio * state1['W'] + (1 - request.ratio) * state2['W']
         
         # 根据混合后的干球温度和含湿量计算其他参数
         mixing_props = {
             'P': request.pressure,
-            'T': tdb_mix + 273.15,  # 转换为K
-            'W': w_mix / 1000       # 转换为kg/kg
+            'T': t_mix,
+            'W': w_mix
         }
         
         mixing_result = calculate_properties(mixing_props)
@@ -275,8 +810,8 @@ def api_mixing(request: MixingRequest):
             "h": mixing_result['h'],
             "tdp": mixing_result['tdp'],
             "mixing_ratio": request.ratio,
-            "point1": result1,
-            "point2": result2
+            "point1": {key: value for key, value in result1.items() if key != 'state'},
+            "point2": {key: value for key, value in result2.items() if key != 'state'}
         }
         
     except HTTPException:
@@ -284,19 +819,232 @@ def api_mixing(request: MixingRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"混风计算时发生内部错误: {e}")
 
+@app.post("/mixing", summary="混风处理")
+async def api_mixing(request: MixingRequest):
+    """
+    计算两个状态点的混风结果
+    - **point1**: 状态点1的参数 (tdb, w)
+    - **point2**: 状态点2的参数 (tdb, w)  
+    - **ratio**: 状态点1的混合比例 (0-1)
+    """
+    return await interactive.run(request_key('mixing', request.dict()), _mixing, request)
+
+def _mixtures_table(payload: dict):
+    ratio_columns = tuple(f'ratio_{j + 1}' for j in range(len(payload["streams"])))
+    rows = [dict(mixture, **dict(zip(ratio_columns, mixture["ratios"]))) for mixture in payload["mixtures"]]
+    return Table.from_rows(
+        rows, PROPERTY_COLUMNS + ratio_columns, PROPERTY_COLUMNS + ratio_columns,
+        meta={"success": True, "pressure": payload["pressure"], "streams": payload["streams"]},
+    )
+
+def _mixing_sweep(request: MixingSweepRequest, mode: str, output=None):
+    try:
+        result = mix_streams(request.streams, request.ratios, request.pressure, mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"混风计算时发生内部错误: {e}")
+    result["pressure"] = request.pressure
+    return _respond(result, output, _mixtures_table)
+
+@app.post("/mixing-sweep", summary="多股气流混风曲线")
+async def api_mixing_sweep(
+    request: MixingSweepRequest,
+    http_request: Request,
+    mode: Literal['exact', 'fast'] = 'exact',
+    format: ResponseFormatName = None,
+):
+    """
+    N 股气流按多组混合比例混风（如回风、新风、旁通风），用于新风经济器选型等
+    - **streams**: 各股气流的输入参数，每股只解析一次状态
+    - **ratios**: 混合比例数组，每行对应一个混合点，按干空气质量加权、按行和归一化
+    - 混合点的含湿量与焓值按干空气质量加权平均，全部混合点一次向量化计算
+    - **mode=fast**: 同 /calculate
+    - **format**: 同 /calculate-multiple；紧凑格式中混合比例为 ratio_1..ratio_N 列
+    """
+    output = _output_format(http_request, format)
+    note_batch_size(len(request.ratios))
+    # 混合点由 (H,W) 直接求解，每个混合比例的成本为 1
+    return await scheduler.run(http_request, float(len(request.ratios)),
+                               request_key('mixing-sweep', request.dict(), mode, output),
+                               _mixing_sweep, request, mode, output)
+
+def _process_chain(request: ProcessChainRequest):
+    try:
+        result = simulate_chain(
+            request.start, [step.dict(exclude_none=True) for step in request.steps],
+            request.pressure, request.start_name
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"过程计算时发生内部错误: {e}")
+    result["pressure"] = request.pressure
+    return result
+
+@app.post("/process-chain", summary="空气处理过程链")
+async def api_process_chain(request: ProcessChainRequest):
+    """
+    按顺序模拟一串空气处理过程，一次返回全部中间状态与绘图数据
+    - **heat / cool**: 等湿加热或冷却，给定 T、dT 或 q 之一
+    - **coil**: 表冷除湿，给定机器露点 adp 与旁通系数 bypass_factor
+    - **humidify**: 蒸汽 (steam) 或绝热 (adiabatic) 加湿，给定 R、W 之一（绝热加湿也可给定 efficiency）
+    - **mix**: 与此前的状态（按名称）或另一股气流混合，ratio 为当前气流的干空气质量比例
+    - 返回的 points / process_lines 与 /generate-chart 格式相同
+    """
+    if simulate_chain is None:
+        raise HTTPException(status_code=503, detail="过程链模块不可用")
+    return await interactive.run(request_key('process-chain', request.dict()), _process_chain, request)
+
+def _weather_analysis(body: bytes, fmt: str, pressure: float, options: dict):
+    try:
+        return analyze_weather(body, fmt, pressure, **options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"气象数据分析时发生内部错误: {e}")
+
+@app.post("/weather-analysis", summary="全年气象数据焓湿分析")
+async def api_weather_analysis(
+    request: Request,
+    input_format: Optional[Literal['epw', 'csv']] = None,
+    pressure: float = 101325.0,
+    t_step: float = 1.0,
+    w_step: float = 1.0,
+    zones: Optional[str] = None,
+):
+    """
+    上传 EPW 或 CSV 气象文件（请求体为文件内容），返回全年逐时状态的统计结果。
+    - **bins**: 干球温度 (°C) × 含湿量 (g/kg) 的小时数分箱，步长由 t_step / w_step 指定
+    - **zones**: 各区域的小时数；查询参数 zones 为区域列表的 JSON，如
+      `[{"name": "A", "tdb_min": 20, "tdb_max": 26, "rh_max": 60}]`，字段为 tdb/twb/rh/w/h/tdp 的 _min/_max
+    - **design**: 年累计频率设计工况（供暖 99.6%/99%，供冷、湿球、露点、焓值 0.4%/1%/2% 及平均同时发生值）
+    - CSV 首行为表头，两个输入列使用 CoolProp 代码（SI 单位），无 P 列时使用 pressure
+    """
+    if analyze_weather is None:
+        raise HTTPException(status_code=503, detail="气象分析模块不可用")
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > MAX_WEATHER_BYTES:
+            raise HTTPException(status_code=413, detail=f"文件超过 {MAX_WEATHER_BYTES // (1024 * 1024)} MB")
+    body = b"".join(chunks)
+    options = {'t_step': t_step, 'w_step': w_step}
+    if zones:
+        try:
+            options['zones'] = json.loads(zones)
+            if not isinstance(options['zones'], list) or not all(isinstance(z, dict) for z in options['zones']):
+                raise ValueError
+        except ValueError:
+            raise HTTPException(status_code=400, detail="zones 应为区域对象列表的 JSON")
+    fmt = detect_weather_format(body, input_format)
+    key = request_key('weather-analysis', hashlib.sha256(body).hexdigest(), fmt, pressure, options)
+    # 按行数估算成本（每行一个逐时状态）
+    return await scheduler.run(request, float(body.count(b"\n")), key, _weather_analysis, body, fmt, pressure, options)
+
+def _register_zones(request: ZonesRequest):
+    try:
+        return {"zones": [zone_registry.register(zone, request.pressure) for zone in request.zones]}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/zones", summary="注册焓湿图区域")
+async def api_register_zones(request: ZonesRequest):
+    """
+    按名称注册（同名覆盖）舒适区、设备运行范围等区域，返回解析后的多边形（干球温度 °C, 含湿量 g/kg），可直接绘制
+    - **polygon**: 直接给出顶点，如 `{"name": "机组", "polygon": [[10, 2], [40, 4], [35, 20]]}`
+    - **上下限**: tdb/twb/rh/w/h/tdp 的 _min/_max（单位同计算结果），按 pressure 解析为多边形，如
+      `{"name": "舒适区", "tdb_min": 20, "tdb_max": 26, "rh_min": 30, "rh_max": 60}`
+    - 注册表在各实例进程内，多实例部署时也可在分类请求中直接携带区域定义
+    """
+    if zone_registry is None:
+        raise HTTPException(status_code=503, detail="区域模块不可用")
+    return await interactive.run(None, _register_zones, request)
+
+@app.get("/zones", summary="已注册的区域")
+def api_list_zones():
+    """返回已注册的区域（名称、压力、原始定义与多边形）"""
+    if zone_registry is None:
+        raise HTTPException(status_code=503, detail="区域模块不可用")
+    return {"zones": zone_registry.list()}
+
+@app.delete("/zones/{name}", summary="删除区域")
+def api_delete_zone(name: str):
+    if zone_registry is None:
+        raise HTTPException(status_code=503, detail="区域模块不可用")
+    if not zone_registry.remove(name):
+        raise HTTPException(status_code=404, detail=f"未注册的区域: {name}")
+    return {"deleted": name}
+
+def _classify_zones(body: bytes, binary: bool, pressure: float, hours: float):
+    try:
+        return classify_points(parse_points(body, binary), pressure, hours)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"区域统计时发生内部错误: {e}")
+
+@app.post("/zones/classify", summary="状态点区域归属统计")
+async def api_classify_zones(request: Request, pressure: float = 101325.0, hours: float = 1.0):
+    """
+    统计大批量状态点落在各区域内的点数与小时数（区域可重叠，另给出不在任何区域内的点数）
+    - 请求体为 JSON `{"tdb": [...], "w": [...] 或 "rh": [...], "hours": 0.25 或逐点数组, "zones": [...]}`，
+      或 Content-Type 为 application/vnd.psychro.float32 / float64 的列式二进制（格式同 response_format，
+      数值列 tdb、w 或 rh、可选 hours，zones 等字段放在头部）
+    - **zones**: 已注册的区域名称列表，或直接给出区域定义；省略时使用全部已注册区域
+    - **pressure**: 由 rh 求含湿量、解析上下限区域使用的压力；**hours**: 每个点代表的小时数（请求体未给出时）
+    - 区域预先建立网格索引，只有落在区域边界格子中的点才做多边形判断
+    """
+    if zone_registry is None:
+        raise HTTPException(status_code=503, detail="区域模块不可用")
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > MAX_CLASSIFY_BYTES:
+            raise HTTPException(status_code=413, detail=f"请求体超过 {MAX_CLASSIFY_BYTES // (1024 * 1024)} MB")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    binary = content_type in ("application/vnd.psychro.float32", "application/vnd.psychro.float64")
+    # 点数要解析请求体后才知道，按批量任务处理
+    return await scheduler.run(request, None, None, _classify_zones, b"".join(chunks), binary, pressure, hours)
+
 # --- Serverless 入口函数 ---
+# 导入 Mangum 用于 ASGI 适配；适配器在模块加载时创建一次，热启动的调用直接复用
+try:
+    from mangum import Mangum
+    from mangum.handlers import APIGateway
+    from urllib.parse import urlencode
+
+    class SCFAPIGateway(APIGateway):
+        """
+        SCF API 网关触发器事件：结构与 AWS API Gateway (REST) 相同，但没有 resource 字段，
+        查询参数可能只在 queryString 中
+        """
+
+        @classmethod
+        def infer(cls, event, context, config) -> bool:
+            return isinstance(event.get("requestContext"), dict) and "serviceId" in event["requestContext"]
+
+        @property
+        def scope(self):
+            scope = super().scope
+            if not scope["query_string"] and self.event.get("queryString"):
+                scope["query_string"] = urlencode(self.event["queryString"], doseq=True).encode()
+            return scope
+
+    handler = Mangum(app, lifespan="off", custom_handlers=[SCFAPIGateway])
+except ImportError:
+    handler = None
+
 def main(event, context):
     """
     腾讯云 SCF 入口函数
     """
-    try:
-        # 导入 Mangum 用于 ASGI 适配
-        from mangum import Mangum
-        handler = Mangum(app, lifespan="off")
-        return handler(event, context)
-    except ImportError:
+    if handler is None:
         # 如果没有 Mangum，尝试使用其他适配器
         raise HTTPException(status_code=500, detail="Serverless 适配器未安装")
+    return handler(event, context)
 
 # 根路径处理
 @app.get("/")
@@ -310,13 +1058,33 @@ def root():
             "health": "/health",
             "calculate": "/calculate",
             "calculate_multiple": "/calculate-multiple",
+            "calculate_stream": "/calculate-stream",
             "generate_chart": "/generate-chart",
-            "mixing": "/mixing"
+            "render_chart": "/render-chart",
+            "chart_background": "/chart-background",
+            "mixing": "/mixing",
+            "mixing_sweep": "/mixing-sweep",
+            "process_chain": "/process-chain",
+            "weather_analysis": "/weather-analysis",
+            "zones": "/zones",
+            "zones_classify": "/zones/classify",
+            "cache_stats": "/cache-stats",
+            "metrics": "/metrics",
+            "memory_profile": "/memory-profile",
+            "live": "/live (WebSocket)"
         }
     }
 
+# 应用模块的导入耗时（含计算模块、背景等值线预计算）
+metrics.record_startup('app_import', time.perf_counter() - _IMPORT_STARTED)
+
+# 预热完成：冻结启动阶段的对象，按配置调整垃圾回收阈值与 GIL 切换间隔
+tune_runtime()
+
 # 如果直接运行此文件，可以使用 uvicorn 启动（本地开发）
 if __name__ == "__main__":
+    import uvicorn
+
     # 本地开发模式
     print("🚀 启动焓湿图计算服务...")
     print("🌐 访问地址: http://localhost:7000")
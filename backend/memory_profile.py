@@ -0,0 +1,392 @@
+# memory_profile.py - 按接口与批量大小的内存峰值记录与实例规格建议
+"""
+SCF 按配置内存计费，实例规格需要依据实际的内存占用选择。本模块提供：
+
+- 可选的内存记录模式（PSYCHRO_MEMORY_PROFILE=1 时启用）：tracemalloc 记录 Python 分配的峰值，
+  后台线程按 PSYCHRO_MEMORY_SAMPLE_MS（默认 5 ms）采样进程 RSS；每个请求记录分配峰值与 RSS 峰值、
+  RSS 相对请求开始时的增长，按 (接口, 批量大小档位) 汇总，由 /memory-profile 返回。
+  tracemalloc 会使计算变慢数倍，只用于测量，不应在线上常开
+- 离线工具：collect 在进程内重放事件（可附加指定点数的批量请求）生成记录，
+  report 根据记录与负载组合（各接口/批量的并发数）给出能容纳该负载的最小 SCF 内存规格
+
+分配峰值来自进程级的 tracemalloc 峰值，请求之间有重叠时无法区分归属，此类记录计入 overlapped，
+其峰值为上界。流式响应只统计到响应开始为止。
+
+用法::
+
+    python memory_profile.py collect events/ --batch-sizes 100,10000,100000 --output profile.json
+    curl http://127.0.0.1:7000/memory-profile > profile.json        # 或从运行中的服务导出
+    python memory_profile.py report profile.json --mix /calculate-multiple:100000=2,/render-chart:1=1
+"""
+import argparse
+import contextvars
+import json
+import math
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块，只能读取 /proc（也不存在时 RSS 记为 0）
+    resource = None
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        print(f"{name} 配置无效，使用默认值: {default}")
+        return default
+
+
+ENABLED = os.environ.get('PSYCHRO_MEMORY_PROFILE', '').lower() in ('1', 'true', 'yes', 'on')
+SAMPLE_SECONDS = _env_number('PSYCHRO_MEMORY_SAMPLE_MS', 5.0, float) / 1000
+# tracemalloc 保存的调用栈深度（1 即可按文件 / 行汇总）
+TRACE_FRAMES = 1
+
+# SCF 可选的内存规格（MB）
+SCF_MEMORY_SIZES = (64, 128) + tuple(range(256, 3072 + 1, 128))
+# 规格建议在估算值之外预留的比例
+DEFAULT_HEADROOM = 0.2
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss() -> int:
+    """进程当前 RSS（字节）；无 /proc 时退化为历史峰值"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        pass
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def batch_bucket(size: Optional[int]) -> str:
+    """批量大小档位：不小于 size 的最小 10 的幂，未标注时为 '-'"""
+    if size is None:
+        return '-'
+    return str(10 ** max(0, math.ceil(math.log10(max(1, size)))))
+
+
+class _RequestMemory:
+    __slots__ = ('rss_start', 'rss_peak', 'alloc_start', 'batch', 'overlapped')
+
+    def __init__(self, rss: int):
+        self.rss_start = rss
+        self.rss_peak = rss
+        self.alloc_start = 0
+        self.batch: Optional[int] = None
+        self.overlapped = False
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar('request_memory', default=None)
+
+
+def note_batch_size(size: int):
+    """标注当前请求的批量大小（点数），不在记录中的请求忽略"""
+    request = _current.get()
+    if request is not None:
+        request.batch = size
+
+
+class MemoryProfiler:
+    """按 (接口, 批量档位) 汇总请求的 tracemalloc 分配峰值与 RSS 峰值"""
+
+    def __init__(self, sample_seconds: float = SAMPLE_SECONDS):
+        self.sample_seconds = sample_seconds
+        self.enabled = False
+        self.baseline_rss = 0
+        self.peak_rss = 0
+        self._active: set = set()
+        self._routes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self):
+        """开始记录：启动 tracemalloc 与 RSS 采样线程，以当前 RSS 为基线"""
+        if self.enabled:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+        self.baseline_rss = self.peak_rss = current_rss()
+        self.enabled = True
+        self._sampler = threading.Thread(target=self._sample_loop, name='memory-sampler', daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self.enabled = False
+        self._wake.set()
+        tracemalloc.stop()
+
+    def _sample(self):
+        rss = current_rss()
+        with self._lock:
+            self.peak_rss = max(self.peak_rss, rss)
+            for request in self._active:
+                if rss > request.rss_peak:
+                    request.rss_peak = rss
+
+    def _sample_loop(self):
+        # 没有进行中的请求时不采样
+        while self.enabled:
+            self._wake.wait()
+            self._sample()
+            time.sleep(self.sample_seconds)
+
+    def begin(self) -> Tuple[_RequestMemory, contextvars.Token]:
+        """请求开始，返回 (记录对象, 用于 end 的 token)"""
+        request = _RequestMemory(current_rss())
+        with self._lock:
+            if self._active:
+                request.overlapped = True
+                for other in self._active:
+                    other.overlapped = True
+            else:
+                # 没有其它进行中的请求时，峰值从此刻重新计
+                tracemalloc.reset_peak()
+            request.alloc_start = tracemalloc.get_traced_memory()[0]
+            self._active.add(request)
+            self._wake.set()
+        return request, _current.set(request)
+
+    def end(self, request: _RequestMemory, token: contextvars.Token, route: str):
+        """请求结束：计入 (route, 批量档位) 的汇总"""
+        _current.reset(token)
+        self._sample()
+        with self._lock:
+            self._active.discard(request)
+            if not self._active:
+                self._wake.clear()
+            alloc = max(0, tracemalloc.get_traced_memory()[1] - request.alloc_start)
+            key = (route, batch_bucket(request.batch))
+            entry = self._routes.get(key)
+            if entry is None:
+                entry = self._routes[key] = {'count': 0, 'overlapped': 0, 'batch_max': 0, 'alloc_peak_max': 0,
+                                             'alloc_peak_sum': 0, 'rss_peak_max': 0, 'rss_growth_max': 0}
+            entry['count'] += 1
+            entry['overlapped'] += request.overlapped
+            entry['batch_max'] = max(entry['batch_max'], request.batch or 0)
+            entry['alloc_peak_max'] = max(entry['alloc_peak_max'], alloc)
+            entry['alloc_peak_sum'] += alloc
+            entry['rss_peak_max'] = max(entry['rss_peak_max'], request.rss_peak)
+            entry['rss_growth_max'] = max(entry['rss_growth_max'], request.rss_peak - request.rss_start)
+
+    def reset(self):
+        """清空汇总，以当前 RSS 为新基线"""
+        with self._lock:
+            self._routes.clear()
+            self.baseline_rss = self.peak_rss = current_rss()
+
+    def snapshot(self, top: int = 0) -> Dict[str, Any]:
+        """
+        当前的记录（/memory-profile 的响应，也是 report 的输入）
+
+        Args:
+            top: 额外给出当前存活分配最多的 top 个源文件（需要遍历全部分配，较慢）
+        """
+        rss = current_rss()
+        with self._lock:
+            routes = [
+                dict(route=route, batch=batch, count=entry['count'], overlapped=entry['overlapped'],
+                     batch_max=entry['batch_max'], alloc_peak_max=entry['alloc_peak_max'],
+                     alloc_peak_mean=entry['alloc_peak_sum'] // entry['count'],
+                     rss_peak_max=entry['rss_peak_max'], rss_growth_max=entry['rss_growth_max'])
+                for (route, batch), entry in sorted(self._routes.items())
+            ]
+            result = {
+                'enabled': self.enabled,
+                'rss_bytes': rss,
+                'baseline_rss_bytes': self.baseline_rss,
+                'peak_rss_bytes': max(self.peak_rss, rss),
+                'routes': routes,
+            }
+        if self.enabled:
+            result['traced_bytes'], result['traced_peak_bytes'] = tracemalloc.get_traced_memory()
+            if top:
+                stats = tracemalloc.take_snapshot().statistics('filename')[:top]
+                result['top_allocations'] = [{'file': str(stat.traceback[0].filename), 'bytes': stat.size,
+                                              'blocks': stat.count} for stat in stats]
+        return result
+
+
+profiler = MemoryProfiler()
+if ENABLED:
+    profiler.start()
+
+
+# --- 规格建议 ---
+
+def estimate(profile: Dict[str, Any], mix: List[Tuple[str, str, int]]) -> List[Dict[str, Any]]:
+    """
+    负载组合中每项的单请求内存增量估算
+
+    单个请求取 tracemalloc 分配峰值与 RSS 增长中的较大者（前者不含 C 扩展在 Python 分配器之外的内存，
+    后者在内存已被此前的请求撑大时偏小）。
+
+    Args:
+        mix: [(接口, 批量档位或 '*' 取该接口最大的一档, 并发数)]
+
+    Raises:
+        ValueError: 记录中没有该接口 / 档位
+    """
+    rows = []
+    for route, batch, concurrent in mix:
+        entries = [entry for entry in profile['routes']
+                   if entry['route'] == route and (batch == '*' or entry['batch'] == batch)]
+        if not entries:
+            raise ValueError(f"记录中没有 {route} 批量 {batch} 的数据")
+        per_request = max(max(entry['alloc_peak_max'], entry['rss_growth_max']) for entry in entries)
+        rows.append({'route': route, 'batch': batch, 'concurrent': concurrent,
+                     'per_request_bytes': per_request, 'bytes': per_request * concurrent})
+    return rows
+
+
+def recommend(profile: Dict[str, Any], mix: List[Tuple[str, str, int]],
+              headroom: float = DEFAULT_HEADROOM) -> Dict[str, Any]:
+    """
+    能容纳负载组合的最小 SCF 内存规格：(基线 RSS + Σ 并发数 × 单请求增量) × (1 + headroom)
+
+    Returns:
+        {'baseline_bytes', 'required_bytes', 'memory_mb'（无合适规格时为 None）, 'rows'}
+    """
+    rows = estimate(profile, mix)
+    baseline = profile['baseline_rss_bytes']
+    required = int((baseline + sum(row['bytes'] for row in rows)) * (1 + headroom))
+    memory_mb = next((size for size in SCF_MEMORY_SIZES if size * 2 ** 20 >= required), None)
+    return {'baseline_bytes': baseline, 'required_bytes': required, 'memory_mb': memory_mb, 'rows': rows}
+
+
+def parse_mix(text: Optional[str], profile: Dict[str, Any]) -> List[Tuple[str, str, int]]:
+    """解析 "接口[:批量档位][=并发数],..."；为空时取记录中每个接口最大的一档、并发 1"""
+    if not text:
+        return [(route, '*', 1) for route in sorted({entry['route'] for entry in profile['routes']})]
+    mix = []
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        spec, _, concurrent = item.partition('=')
+        route, _, batch = spec.partition(':')
+        mix.append((route, batch_bucket(int(batch)) if batch else '*', int(concurrent or 1)))
+    return mix
+
+
+# --- 离线采集 ---
+
+def _batch_events(sizes: List[int]) -> Dict[str, Dict[str, Any]]:
+    """
+    指定点数的 /calculate-multiple 事件，输入在常见范围内变化以避免命中缓存
+
+    /generate-chart、/render-chart 逐点计算，大批量耗时过长，需要时另行录制事件。
+    """
+    from scf_harness import scf_event
+
+    events = {}
+    for size in sizes:
+        points = [{'name': f'P{i}', 'inputs': {'T': 283.15 + (i * 7919 % 2500) / 100,
+                                                'R': 0.2 + (i * 104729 % 7000) / 10000}}
+                  for i in range(size)]
+        events[f'calculate-multiple[{size}]'] = scf_event('POST', '/calculate-multiple', '',
+                                                          {'pressure': 101325.0, 'points': points})
+    return events
+
+
+def collect(events: Dict[str, Dict[str, Any]], repeat: int = 1, top: int = 10) -> Dict[str, Any]:
+    """
+    在当前进程中启用记录，经 main_app.main 依次重放事件（无并发，峰值归属准确），返回记录
+
+    需在未导入 main_app 的新进程中调用，以便基线与导入后的常驻内存一致。
+    """
+    from scf_harness import _context
+
+    # 以脚本运行时本模块为 __main__，应用使用的是按模块名导入的另一份实例
+    os.environ['PSYCHRO_MEMORY_PROFILE'] = '1'
+    import main_app
+    from memory_profile import profiler as active
+    from performance import initialize_serverless_environment
+
+    initialize_serverless_environment()
+    active.start()
+    active.reset()
+    for _ in range(repeat):
+        for name, event in events.items():
+            response = main_app.main(event, _context())
+            if not 200 <= response.get('statusCode', 0) < 400:
+                print(f"警告: {name} 返回 {response.get('statusCode')}", file=sys.stderr)
+    return active.snapshot(top)
+
+
+def _mb(value: float) -> str:
+    return f"{value / 2 ** 20:.1f}"
+
+
+def _print_profile(profile: Dict[str, Any]):
+    print(f"基线 RSS {_mb(profile['baseline_rss_bytes'])} MB，峰值 RSS {_mb(profile['peak_rss_bytes'])} MB")
+    print(f"  {'接口':<24}{'批量':>8}{'次数':>6}{'分配峰值':>12}{'RSS 增长':>12}{'RSS 峰值':>12}  (MB)")
+    for entry in profile['routes']:
+        print(f"  {entry['route']:<24}{entry['batch']:>8}{entry['count']:>6}{_mb(entry['alloc_peak_max']):>12}"
+              f"{_mb(entry['rss_growth_max']):>12}{_mb(entry['rss_peak_max']):>12}"
+              + (f"  （{entry['overlapped']} 次与其它请求重叠）" if entry['overlapped'] else ''))
+    for item in profile.get('top_allocations', []):
+        print(f"  存活分配 {_mb(item['bytes']):>8} MB  {item['file']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="内存峰值记录与 SCF 内存规格建议")
+    commands = parser.add_subparsers(dest='command', required=True)
+    collect_parser = commands.add_parser('collect', help="在新进程中重放事件并记录内存峰值")
+    collect_parser.add_argument('events', nargs='*', help="事件 JSON 文件或目录（同 scf_harness.py）")
+    collect_parser.add_argument('--batch-sizes', default='', help="附加的批量请求点数，逗号分隔，如 100,10000")
+    collect_parser.add_argument('--repeat', type=int, default=1, help="重放轮数")
+    collect_parser.add_argument('--top', type=int, default=10, help="输出存活分配最多的源文件数")
+    collect_parser.add_argument('--output', help="记录写入 JSON 文件（report 的输入）")
+    report_parser = commands.add_parser('report', help="根据记录与负载组合建议最小内存规格")
+    report_parser.add_argument('profile', help="collect 的输出或 /memory-profile 的响应")
+    report_parser.add_argument('--mix', help="负载组合：接口[:点数][=并发数],...（默认每个接口最大一档、并发 1）")
+    report_parser.add_argument('--headroom', type=float, default=DEFAULT_HEADROOM, help="预留比例")
+    args = parser.parse_args(argv)
+
+    if args.command == 'collect':
+        from scf_harness import load_events
+
+        events = load_events(args.events) if args.events else {}
+        events.update(_batch_events([int(size) for size in args.batch_sizes.split(',') if size.strip()]))
+        if not events:
+            print("没有可重放的事件")
+            return 1
+        profile = collect(events, args.repeat, args.top)
+        _print_profile(profile)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(profile, f, ensure_ascii=False, indent=2)
+        return 0
+
+    with open(args.profile, encoding='utf-8') as f:
+        profile = json.load(f)
+    try:
+        result = recommend(profile, parse_mix(args.mix, profile), args.headroom)
+    except ValueError as e:
+        print(f"错误: {e}")
+        return 1
+    print(f"基线 RSS {_mb(result['baseline_bytes'])} MB")
+    for row in result['rows']:
+        print(f"  {row['route']:<24} 批量 {row['batch']:>7} × {row['concurrent']:<3}"
+              f" 单请求 {_mb(row['per_request_bytes']):>7} MB  合计 {_mb(row['bytes']):>7} MB")
+    print(f"需要 {_mb(result['required_bytes'])} MB（含 {args.headroom:.0%} 预留）")
+    if result['memory_mb'] is None:
+        print(f"超过最大规格 {SCF_MEMORY_SIZES[-1]} MB，需要减小批量或并发")
+        return 1
+    print(f"建议内存规格: {result['memory_mb']} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,371 @@
+# metrics.py - 请求分段计时与 Prometheus 指标
+"""
+热点路径的观测：
+
+- 请求分段计时：每个请求持有一个 RequestTimings（通过 contextvars 传递，
+  包括交给执行器工作线程的计算），各阶段累计耗时，最终写入 Server-Timing 响应头。
+  阶段：parse（路由、读取与校验请求体）、queue（执行器排队）、compute（工作线程计算）、
+  coolprop（其中 HAPropsSI 调用）、cache（缓存查找开销）、serialize（响应序列化）
+- 进程级指标：按接口的延迟直方图、按输出代码的 HAPropsSI 次数与耗时、冷启动与预热耗时，
+  在 /metrics 以 Prometheus 文本格式输出
+
+本模块只依赖标准库，其它模块以可选导入的方式使用。
+"""
+import contextvars
+import functools
+import inspect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 进程启动（本模块首次导入）的时间
+PROCESS_START = time.time()
+
+# 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# HAPropsSI 单次调用耗时的桶上界（秒）
+HAPROPS_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2)
+
+# Server-Timing 中各阶段的输出顺序
+STAGES = ('parse', 'queue', 'compute', 'coolprop', 'cache', 'serialize')
+
+
+# --- 请求分段计时 ---
+
+class RequestTimings:
+    """一个请求的时间点与各阶段累计耗时"""
+
+    __slots__ = ('started', 'marks', 'stages')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks: Dict[str, float] = {}
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def finish(self) -> float:
+        """根据时间点补全 parse / serialize 阶段，返回请求总耗时"""
+        total = time.perf_counter() - self.started
+        marks = self.marks
+        if 'endpoint_start' in marks:
+            self.stages['parse'] = marks['endpoint_start'] - self.started
+        if 'endpoint_end' in marks and 'route_end' in marks:
+            self.stages['serialize'] = marks['route_end'] - marks['endpoint_end']
+        return total
+
+    def server_timing(self, total: float) -> str:
+        """Server-Timing 响应头（毫秒）"""
+        parts = [f'{stage};dur={self.stages[stage] * 1000:.2f}' for stage in STAGES if stage in self.stages]
+        parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar('request_timings', default=None)
+
+
+def start_request() -> Tuple[RequestTimings, contextvars.Token]:
+    """开始记录当前请求，返回 (计时对象, 用于 end_request 的 token)"""
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token: contextvars.Token):
+    _current.reset(token)
+
+
+def mark(name: str):
+    """在当前请求上记录一个时间点"""
+    timings = _current.get()
+    if timings is not None:
+        timings.marks[name] = time.perf_counter()
+
+
+def record_stage(stage: str, seconds: float):
+    """把一段耗时累计到当前请求的某个阶段（不在请求中时忽略）"""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """with 块的耗时累计到当前请求的 name 阶段"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def timed_endpoint(endpoint: Callable) -> Callable:
+    """包装接口函数，记录进入与返回的时间点（保留签名，FastAPI 按原函数解析参数）"""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            mark('endpoint_start')
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                mark('endpoint_end')
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            mark('endpoint_start')
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                mark('endpoint_end')
+    return wrapper
+
+
+# --- 指标 ---
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    items = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        items.append(extra)
+    return '{' + ','.join(items) + '}' if items else ''
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """带标签的累计直方图"""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = {labels: (list(s[0]), s[1], s[2]) for labels, s in self._series.items()}
+        for labels, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts + [count - sum(counts)]):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {count}')
+        return lines
+
+
+class Gauge:
+    """带标签的瞬时值"""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, amount: float, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        lines.extend(f'{self.name}{_labels(self.label_names, labels)} {_number(value)}' for labels, value in snapshot)
+        return lines
+
+
+class Counter:
+    """带标签的累计计数"""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        lines.extend(f'{self.name}{_labels(self.label_names, labels)} {_number(value)}' for labels, value in snapshot)
+        return lines
+
+
+request_latency = Histogram('psychro_request_duration_seconds', '按接口的请求耗时', ('method', 'route', 'status'))
+haprops_calls = Histogram('psychro_hapropssi_duration_seconds', '按输出代码的 CoolProp HAPropsSI 调用耗时',
+                          ('output',), HAPROPS_BUCKETS)
+render_duration = Histogram('psychro_render_duration_seconds', '按输出格式的图表渲染耗时', ('format',))
+render_peak = Histogram('psychro_render_peak_estimate_bytes', '按输出格式的单次图表渲染内存峰值估算（由输出像素尺寸推算的栅格缓冲区 + 输出）',
+                        ('format',),
+                        (2 ** 20, 2 ** 21, 2 ** 22, 2 ** 23, 2 ** 24, 2 ** 25, 2 ** 26, 2 ** 27))
+solver_points = Counter('psychro_inverse_solver_points_total',
+                        '(H,R)/(B,R) 逆向求解的点数，按求解路径（anchor 锚点试位法、newton 温启动牛顿法、bracketed 改用试位法、failed 无解）',
+                        ('pair', 'path'))
+solver_iterations = Counter('psychro_inverse_solver_newton_iterations_total', '温启动牛顿法的逐点迭代总次数', ('pair',))
+live_updates = Counter('psychro_live_updates_total',
+                       '/live 数据流的结果数（pushed 已推送、suppressed 未变化未推送、dropped 发送队列满被丢弃）', ('kind',))
+live_connections = Gauge('psychro_live_connections', '/live 当前连接数')
+queue_wait = Histogram('psychro_executor_queue_wait_seconds', '计算执行器准入队列中的等待时间', ('executor',))
+scheduled = Counter('psychro_scheduler_requests_total', '按成本分级后交给各执行器的请求数', ('lane',))
+slice_duration = Histogram('psychro_scheduler_slice_seconds', '批量任务单个时间片的耗时')
+slice_yield = Counter('psychro_scheduler_yield_seconds_total', '批量任务在时间片之间为交互请求让出的总时间')
+quota_rejected = Counter('psychro_client_quota_rejected_total',
+                         '按客户端配额拒绝的请求数（bulk_jobs 批量任务并发数、cost 计算成本配额）', ('reason',))
+startup = Gauge('psychro_startup_seconds', '冷启动各阶段耗时（应用导入、依赖预热、背景等值线预计算等）', ('phase',))
+
+
+def record_haprops(output: str, seconds: float):
+    """记录一次 HAPropsSI 调用，同时计入当前请求的 coolprop 阶段"""
+    haprops_calls.observe(seconds, output)
+    record_stage('coolprop', seconds)
+
+
+def record_solver(pair: str, stats: Dict[str, int]):
+    """记录一批逆向求解的收敛统计（batch_engine.solve_temperature 的返回值）"""
+    for path in ('newton', 'bracketed', 'failed'):
+        if stats[path]:
+            solver_points.inc(stats[path], pair, path)
+    solver_points.inc(stats['anchors'], pair, 'anchor')
+    solver_iterations.inc(stats['iterations'], pair)
+
+
+def record_live(kind: str, count: int = 1):
+    if count:
+        live_updates.inc(count, kind)
+
+
+def record_live_connection(delta: int):
+    live_connections.inc(delta)
+
+
+def record_queue_wait(executor: str, seconds: float):
+    queue_wait.observe(seconds, executor)
+
+
+def record_scheduled(lane: str):
+    scheduled.inc(1, lane)
+
+
+def record_slice(seconds: float, yielded: float):
+    """记录一个批量时间片的耗时与其后为交互请求让出的时间"""
+    slice_duration.observe(seconds)
+    if yielded:
+        slice_yield.inc(yielded)
+
+
+def record_quota_rejected(reason: str):
+    quota_rejected.inc(1, reason)
+
+
+def record_render(fmt: str, seconds: float, peak_estimate_bytes: int):
+    """记录一次图表渲染的耗时与内存峰值估算值"""
+    render_duration.observe(seconds, fmt)
+    render_peak.observe(peak_estimate_bytes, fmt)
+
+
+def record_startup(phase: str, seconds: float):
+    startup.set(seconds, phase)
+
+
+def _counter_lines(name: str, help_text: str, samples: Iterable[Tuple[Tuple[Tuple[str, str], ...], float]],
+                   kind: str = 'counter') -> List[str]:
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        names = tuple(k for k, _ in labels)
+        values = tuple(v for _, v in labels)
+        lines.append(f'{name}{_labels(names, values)} {_number(value)}')
+    return lines
+
+
+def render(cache_stats: Optional[Dict] = None, scope_stats: Optional[Dict] = None,
+           executors: Iterable = ()) -> str:
+    """
+    输出 Prometheus 文本格式的全部指标
+
+    Args:
+        cache_stats: ServerlessOptimizer.get_cache_stats() 的结果
+        scope_stats: ServerlessOptimizer.get_scope_stats() 的结果
+        executors: 需要输出队列状态的 ComputeExecutor
+    """
+    lines = []
+    lines += request_latency.render()
+    lines += haprops_calls.render()
+    lines += render_duration.render()
+    lines += render_peak.render()
+    lines += solver_points.render()
+    lines += solver_iterations.render()
+    lines += live_updates.render()
+    lines += live_connections.render()
+    lines += queue_wait.render()
+    lines += scheduled.render()
+    lines += slice_duration.render()
+    lines += slice_yield.render()
+    lines += quota_rejected.render()
+    lines += startup.render()
+    lines += _counter_lines('psychro_process_start_time_seconds', '进程启动时间 (Unix 时间戳)',
+                            [((), PROCESS_START)], kind='gauge')
+
+    if cache_stats is not None:
+        for key in ('hits', 'misses', 'coalesced', 'evictions', 'expirations'):
+            lines += _counter_lines(f'psychro_cache_{key}_total', f'结果缓存 {key} 次数', [((), cache_stats[key])])
+        lines += _counter_lines('psychro_cache_entries', '结果缓存当前条目数',
+                                [((), cache_stats['size'])], kind='gauge')
+        persistent = cache_stats.get('persistent')
+        if persistent:
+            for key in ('hits', 'misses', 'written', 'dropped', 'errors'):
+                lines += _counter_lines(f'psychro_result_store_{key}_total', f'第二级缓存 {key} 次数',
+                                        [((), persistent[key])])
+    if scope_stats:
+        for key in ('hits', 'misses', 'coalesced'):
+            lines += _counter_lines(
+                f'psychro_cache_scope_{key}_total', f'按接口统计的结果缓存 {key} 次数',
+                [((('scope', scope),), counters[key]) for scope, counters in sorted(scope_stats.items())]
+            )
+
+    executors = list(executors)
+    if executors:
+        snapshots = [(executor.name, executor.stats()) for executor in executors]
+        for key, kind in (('running', 'gauge'), ('waiting', 'gauge'), ('completed', 'counter'),
+                          ('coalesced', 'counter'), ('rejected', 'counter'), ('timed_out', 'counter')):
+            name = f'psychro_executor_{key}' + ('_total' if kind == 'counter' else '')
+            lines += _counter_lines(name, f'计算执行器 {key}',
+                                    [((('executor', n),), stats[key]) for n, stats in snapshots], kind=kind)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,219 @@
+# parallel.py - 多进程批量计算
+"""
+大批量计算的多进程执行后端：
+
+- 超过 PSYCHRO_POOL_THRESHOLD 行的批次按 PSYCHRO_POOL_CHUNK_ROWS 切块，分发到常驻进程池
+- 工作进程启动时预先导入 CoolProp 与 batch_engine 并完成一次计算，首个任务不再付出导入开销
+- 结果按输入顺序拼接，每行的成功标志与错误信息与单进程计算一致
+- 进程池不可用（单核、受限环境、工作进程崩溃）时自动回退到当前进程计算
+
+进程数由 PSYCHRO_POOL_WORKERS 配置（默认 CPU 核数，0 或 1 表示禁用）。
+initialize_serverless_environment 在启动阶段调用 prewarm_pool 创建进程池，
+首个大批次不再承担进程启动与导入开销；PSYCHRO_POOL_PREWARM=0 时改为首次使用时创建。
+``python parallel.py`` 输出不同进程数下的加速比。
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import batch_engine
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        print(f"{name} 配置无效，使用默认值: {default}")
+        return default
+
+
+def _available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# 进程数、启用阈值（行数）与每个任务的行数
+POOL_WORKERS = _env_int('PSYCHRO_POOL_WORKERS', _available_cpus())
+POOL_THRESHOLD = _env_int('PSYCHRO_POOL_THRESHOLD', 20000)
+POOL_CHUNK_ROWS = max(1, _env_int('PSYCHRO_POOL_CHUNK_ROWS', 5000))
+# 是否在启动阶段预先创建进程池
+POOL_PREWARM = _env_int('PSYCHRO_POOL_PREWARM', 1)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_failed = False  # 创建失败后不再重试，避免每个大批次都付出启动开销
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    """工作进程初始化：导入 CoolProp 并各走一遍向量化与回退路径"""
+    try:
+        import CoolProp.HumidAirProp as HA
+        HA.HAPropsSI('W', 'P', 101325, 'T', 298.15, 'R', 0.6)
+        batch_engine.compute_batch({'T': [298.15], 'R': [0.6]}, 101325.0)
+    except Exception as e:
+        print(f"工作进程预热警告: {e}")
+
+
+def _ping(hold: float = 0.0) -> int:
+    # 短暂占用工作进程，让同一轮的其余任务分发到其他进程
+    if hold:
+        time.sleep(hold)
+    return os.getpid()
+
+
+def _mp_context():
+    # 服务进程中已有线程在运行，fork 可能复制持有中的锁，优先使用 forkserver
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def get_pool(workers: Optional[int] = None) -> Optional[ProcessPoolExecutor]:
+    """
+    返回常驻进程池，首次调用时创建并等待全部工作进程完成预热
+
+    Args:
+        workers: 进程数，默认 POOL_WORKERS；与现有进程池不同时重建
+
+    Returns:
+        进程池；禁用或创建失败时返回 None
+    """
+    global _pool, _pool_workers, _pool_failed
+    workers = POOL_WORKERS if workers is None else workers
+    if workers < 2 or _pool_failed:
+        return None
+    with _pool_lock:
+        if _pool is not None and _pool_workers != workers:
+            # 其它线程可能仍在等待旧进程池中的任务：不取消，已提交的任务执行完后旧进程池自行退出
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            try:
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context(),
+                                           initializer=_init_worker)
+                # 同时提交 workers 个任务，促使全部工作进程立即启动；
+                # 直到每个进程都应答过一次（初始化函数先于任务执行）才算预热完成
+                seen = set()
+                for _ in range(10):
+                    seen.update(future.result() for future in
+                                [pool.submit(_ping, 0.05) for _ in range(workers)])
+                    if len(seen) >= workers:
+                        break
+            except Exception as e:
+                print(f"进程池不可用，使用单进程计算: {e}")
+                _pool_failed = True
+                return None
+            _pool, _pool_workers = pool, workers
+        return _pool
+
+
+def prewarm_pool() -> bool:
+    """启动阶段创建进程池并等待全部工作进程完成初始化，返回进程池是否可用"""
+    if not POOL_PREWARM or POOL_WORKERS < 2:
+        return False
+    return get_pool() is not None
+
+
+def shutdown_pool():
+    """关闭进程池（幂等）"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def _slice_inputs(inputs: Dict[str, Any], pressure, start: int, stop: int):
+    chunk = {code: values[start:stop] for code, values in inputs.items()}
+    if np.ndim(pressure):
+        pressure = pressure[start:stop]
+    return chunk, pressure
+
+
+def _concat_columns(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    columns = {name: np.concatenate([part[name] for part in parts])
+               for name in batch_engine.OUTPUT_COLUMNS + batch_engine.STATE_COLUMNS + ('success',)}
+    columns['error'] = [error for part in parts for error in part['error']]
+    return columns
+
+
+def compute_batch(inputs: Dict[str, Any], pressure, workers: Optional[int] = None,
+                  chunk_rows: Optional[int] = None, threshold: Optional[int] = None) -> Dict[str, Any]:
+    """
+    与 batch_engine.compute_batch 相同的接口，大批次切块后在进程池中并行计算
+
+    Args:
+        inputs: 两个输入参数的数组 (SI 单位)
+        pressure: 压力 (Pa)，标量或与输入等长的数组
+        workers / chunk_rows / threshold: 覆盖 POOL_WORKERS / POOL_CHUNK_ROWS / POOL_THRESHOLD
+
+    Returns:
+        列式结果字典，行顺序与输入一致
+    """
+    values = {code: np.ravel(np.asarray(v, dtype=float)) for code, v in inputs.items()}
+    pressure = np.asarray(pressure, dtype=float)
+    if pressure.ndim:
+        pressure = np.ravel(pressure)
+    n = max([a.size for a in values.values()] + [pressure.size])
+    chunk_rows = max(1, POOL_CHUNK_ROWS if chunk_rows is None else chunk_rows)
+    threshold = POOL_THRESHOLD if threshold is None else threshold
+
+    pool = get_pool(workers) if n > max(threshold, chunk_rows) else None
+    if pool is None:
+        return batch_engine.compute_batch(values, pressure)
+
+    chunks = [_slice_inputs(values, pressure, start, min(start + chunk_rows, n))
+              for start in range(0, n, chunk_rows)]
+    try:
+        # map 按提交顺序返回结果
+        parts = list(pool.map(batch_engine.compute_batch, *zip(*chunks)))
+    except (BrokenProcessPool, CancelledError) as e:
+        # CancelledError：进程池在计算期间被关闭（如 shutdown_pool），只回退到本进程计算
+        print(f"进程池异常，改为单进程计算: {e!r}")
+        if isinstance(e, BrokenProcessPool):
+            shutdown_pool()
+        parts = [batch_engine.compute_batch(chunk, p) for chunk, p in chunks]
+    return _concat_columns(parts)
+
+
+def benchmark(rows: int = 400000, worker_counts: Optional[List[int]] = None,
+              chunk_rows: Optional[int] = None, seed: int = 0) -> List[Dict[str, float]]:
+    """
+    测量不同进程数下整批计算的耗时与加速比
+
+    使用 (H, R) 输入组合（需迭代求解干球温度，计算量最大）。
+    进程池在计时前创建并预热，结果不含启动开销。
+    """
+    if worker_counts is None:
+        cpus = _available_cpus()
+        worker_counts = sorted({1, 2, 4, 8, cpus} & set(range(1, cpus + 1)))
+    rng = np.random.default_rng(seed)
+    T = rng.uniform(273.15 - 20, 273.15 + 40, rows)
+    R = rng.uniform(0.1, 0.95, rows)
+    P = 101325.0
+    inputs = {'H': batch_engine.enthalpy(T, batch_engine.humidity_ratio_from_rh(T, R, P), P), 'R': R}
+
+    report = []
+    for workers in worker_counts:
+        get_pool(workers)
+        started = time.perf_counter()
+        compute_batch(inputs, P, workers=workers, chunk_rows=chunk_rows, threshold=0)
+        elapsed = time.perf_counter() - started
+        baseline = report[0]['seconds'] if report else elapsed
+        report.append({'workers': workers, 'seconds': elapsed, 'speedup': baseline / elapsed})
+    shutdown_pool()
+    return report
+
+
+if __name__ == "__main__":
+    print(f"可用 CPU: {_available_cpus()}")
+    for item in benchmark():
+        print(f"{item['workers']:>3} 进程: {item['seconds']:.3f}s  加速比 {item['speedup']:.2f}x")
@@ -2,73 +2,160 @@
 import os
 import time
 import functools
-from typing import Dict, Any, Optional
 import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable, Hashable
+
+from cache import LRUTTLCache
+from result_store import PersistentCache, open_store
+
+# 请求分段计时与启动耗时指标（metrics 模块不可用时不记录）
+try:
+    from metrics import record_stage, record_startup
+except ImportError:
+    def record_stage(stage: str, seconds: float):
+        pass
+
+    def record_startup(phase: str, seconds: float):
+        pass
+
+# 当前请求的统计范围（通常为接口路径），用于按接口统计缓存命中率
+cache_scope: contextvars.ContextVar = contextvars.ContextVar('cache_scope', default='internal')
+
+_OUTCOME_COUNTERS = {'hit': 'hits', 'miss': 'misses', 'coalesced': 'coalesced'}
+
+def _persistable(value: Any) -> bool:
+    """出错的结果（带 error 字段的字典）可能由暂时性故障引起，不写入第二级缓存"""
+    return not (isinstance(value, dict) and 'error' in value)
 
 class ServerlessOptimizer:
     """Serverless 环境性能优化器"""
     
-    def __init__(self):
-        self._cache = {}
-        self._cache_lock = threading.Lock()
+    def __init__(self, cache_capacity: Optional[int] = None):
+        if cache_capacity is None:
+            cache_capacity = int(os.environ.get('PSYCHRO_CACHE_MAX_ENTRIES', '4096'))
+        self._cache = LRUTTLCache(capacity=cache_capacity)
+        # 第二级（跨实例）缓存，未配置时为 None
+        self._persistent: Optional[PersistentCache] = open_store()
+        self._scope_stats: Dict[str, Dict[str, int]] = {}
+        self._scope_lock = threading.Lock()
         self._startup_time = time.time()
         
-    def cache_function_result(self, expire_time: int = 300):
+    def cache_function_result(self, expire_time: int = 300,
+                              key_func: Optional[Callable[..., Hashable]] = None,
+                              persist: bool = False):
         """
         缓存函数结果装饰器
         
+        计算在锁外执行，同一参数的并发调用只计算一次；
+        每个条目按 expire_time 独立过期，缓存总量受容量上限约束。
+        
         Args:
             expire_time: 缓存过期时间（秒）
+            key_func: 自定义缓存键函数，接收与被装饰函数相同的参数，
+                返回可哈希的键；为 None 时使用参数的字符串形式
+            persist: 是否使用第二级缓存（一级未命中时先查第二级，新结果在后台写入）；
+                需要 key_func 给出由基本类型组成、跨进程稳定的键
         """
+        if persist and key_func is None:
+            raise ValueError("persist 需要 key_func 提供跨进程稳定的缓存键")
         def decorator(func):
             @functools.wraps(func)
             def wrapper(*args, **kwargs):
                 # 创建缓存键
-                cache_key = f"{func.__name__}_{hash(str(args))}{hash(str(kwargs))}"
-                
-                with self._cache_lock:
-                    # 检查缓存
-                    if cache_key in self._cache:
-                        cached_result, cached_time = self._cache[cache_key]
-                        if time.time() - cached_time < expire_time:
-                            return cached_result
-                    
-                    # 执行函数并缓存结果
-                    result = func(*args, **kwargs)
-                    self._cache[cache_key] = (result, time.time())
-                    
-                    # 清理过期缓存
-                    self._cleanup_cache()
-                    
-                    return result
+                if key_func is not None:
+                    cache_key = (func.__name__, key_func(*args, **kwargs))
+                else:
+                    cache_key = f"{func.__name__}_{hash(str(args))}{hash(str(kwargs))}"
+                started = time.perf_counter()
+                computed = [0.0]
+
+                persistent = self._persistent if persist else None
+
+                def compute():
+                    if persistent is not None:
+                        found, value = persistent.get(cache_key)
+                        if found:
+                            return value
+                    compute_started = time.perf_counter()
+                    try:
+                        value = func(*args, **kwargs)
+                    finally:
+                        computed[0] = time.perf_counter() - compute_started
+                    if persistent is not None and _persistable(value):
+                        persistent.put(cache_key, value, expire_time)
+                    return value
+
+                value, outcome = self._cache.lookup_or_compute(cache_key, compute, ttl=expire_time)
+                self._record_lookup(cache_scope.get(), outcome)
+                # 缓存阶段只计查找、加锁与等待合并的开销，不含被装饰函数本身的计算
+                record_stage('cache', time.perf_counter() - started - computed[0])
+                return value
             return wrapper
         return decorator
     
-    def _cleanup_cache(self):
-        """清理过期的缓存项"""
-        current_time = time.time()
-        expired_keys = []
-        
-        for key, (_, cached_time) in self._cache.items():
-            if current_time - cached_time > 300:  # 5分钟过期
-                expired_keys.append(key)
-        
-        for key in expired_keys:
-            del self._cache[key]
+    def _record_lookup(self, scope: str, outcome: str):
+        """按统计范围累计 hit/miss/coalesced 次数"""
+        with self._scope_lock:
+            counters = self._scope_stats.setdefault(scope, {'hits': 0, 'misses': 0, 'coalesced': 0})
+            counters[_OUTCOME_COUNTERS[outcome]] += 1
+    
+    @contextmanager
+    def scope(self, name: str):
+        """在 with 块内把缓存查找计入指定统计范围"""
+        token = cache_scope.set(name)
+        try:
+            yield
+        finally:
+            cache_scope.reset(token)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """返回缓存命中/未命中/淘汰等统计信息（含第二级缓存）"""
+        stats = self._cache.stats()
+        stats['persistent'] = self._persistent.stats() if self._persistent is not None else None
+        return stats
+    
+    def set_persistent(self, store: Optional[PersistentCache]) -> Optional[PersistentCache]:
+        """替换第二级缓存（如接入外部服务的后端），返回原来的实例"""
+        previous, self._persistent = self._persistent, store
+        return previous
+    
+    def warm_load_persistent(self, limit: Optional[int] = None) -> int:
+        """把第二级缓存中最近写入的条目载入一级缓存，返回载入条数"""
+        if self._persistent is None:
+            return 0
+        if limit is None:
+            limit = int(os.environ.get('PSYCHRO_RESULT_CACHE_WARM', '2048'))
+        # 不超过一级缓存容量的一半，给运行时的新结果留出空间
+        limit = min(limit, self._cache.capacity // 2)
+        started = time.perf_counter()
+        entries = self._persistent.warm(limit)
+        for key, value, ttl in entries:
+            self._cache.set(key, value, ttl=ttl)
+        record_startup('persistent_warm_load', time.perf_counter() - started)
+        return len(entries)
+    
+    def get_scope_stats(self) -> Dict[str, Dict[str, Any]]:
+        """返回各统计范围（接口）的缓存查找次数与有效命中率"""
+        with self._scope_lock:
+            snapshot = {scope: dict(counters) for scope, counters in self._scope_stats.items()}
+        for counters in snapshot.values():
+            lookups = counters['hits'] + counters['misses'] + counters['coalesced']
+            # 合并到进行中计算的查找同样省去了一次计算，计入有效命中
+            counters['hit_ratio'] = round((counters['hits'] + counters['coalesced']) / lookups, 4) if lookups else 0.0
+        return snapshot
     
     def warm_up_dependencies(self):
         """预热依赖项以减少冷启动时间"""
+        started = time.perf_counter()
         try:
-            # 预加载 CoolProp
-            import CoolProp.HumidAirProp as HA
-            # 执行一个简单计算来预热
-            HA.HAPropsSI('T', 'P', 101325, 'T', 298.15, 'R', 0.6)
-            
-            # 预加载 matplotlib
-            import matplotlib.pyplot as plt
-            plt.figure()
-            plt.close()
+            # 预热向量化计算引擎；CoolProp 与 matplotlib 导入耗时数秒，
+            # 分别在回退计算与首次渲染时按需加载
+            import batch_engine
+            batch_engine.compute_batch({'T': [298.15], 'R': [0.6]}, 101325.0, fallback=False)
             
+            record_startup('warm_up', time.perf_counter() - started)
             print(f"依赖预热完成，耗时: {time.time() - self._startup_time:.2f}s")
             
         except Exception as e:
@@ -80,10 +167,6 @@ class ServerlessOptimizer:
             import gc
             gc.collect()  # 强制垃圾回收
             
-            # 设置matplotlib内存优化
-            import matplotlib
-            matplotlib.rcParams['figure.max_open_warning'] = 0
-            
         except Exception as e:
             print(f"内存优化警告: {e}")
 
@@ -94,48 +177,137 @@ optimizer = ServerlessOptimizer()
 cache_result = optimizer.cache_function_result
 
 # 预计算常用数据的缓存
-@cache_result(expire_time=3600)  # 1小时缓存
-def get_psychrometric_constants(pressure: float) -> Dict[str, Any]:
-    """获取焓湿图常用常数（缓存1小时）"""
+# 标准大气下常用海拔 (0/500/1000/1500/2000/3000 m) 的压力 (Pa)，启动时预计算其背景等值线
+DEFAULT_STANDARD_PRESSURES = (101325.0, 95461.0, 89876.0, 84556.0, 79495.0, 70109.0)
+
+def _load_standard_pressures() -> tuple:
+    """读取 PSYCHRO_CHART_PRESSURES 环境变量（逗号分隔的 Pa 值）"""
+    raw = os.environ.get('PSYCHRO_CHART_PRESSURES')
+    if not raw:
+        return DEFAULT_STANDARD_PRESSURES
     try:
-        import CoolProp.HumidAirProp as HA
-        import numpy as np
-        
-        # 预计算常用温度范围的数据
-        temps = np.linspace(-5, 45, 51)
+        return tuple(float(item) for item in raw.split(',') if item.strip())
+    except ValueError:
+        print(f"PSYCHRO_CHART_PRESSURES 配置无效，使用默认值: {raw}")
+        return DEFAULT_STANDARD_PRESSURES
+
+STANDARD_PRESSURES = _load_standard_pressures()
+
+# 背景等值线的默认范围与分辨率，可逐项覆盖
+CHART_BACKGROUND_DEFAULTS = {
+    't_min': -10.0, 't_max': 50.0, 't_step': 0.5,
+    'rh_step': 10.0,
+    'h_min': 0.0, 'h_max': 120.0, 'h_step': 10.0,
+    'twb_min': -10.0, 'twb_max': 35.0, 'twb_step': 5.0,
+    'v_min': 0.75, 'v_max': 0.95, 'v_step': 0.01,
+    'w_max': 30.0,
+}
+
+# 单次请求最多返回的温度点数，防止过细的分辨率拖垮实例
+MAX_CHART_TEMPERATURE_POINTS = 2001
+
+def _chart_options(options: Dict[str, Any]) -> Dict[str, float]:
+    """合并默认参数并校验，返回规范化后的选项"""
+    unknown = set(options) - set(CHART_BACKGROUND_DEFAULTS)
+    if unknown:
+        raise ValueError(f"不支持的参数: {', '.join(sorted(unknown))}")
+    merged = dict(CHART_BACKGROUND_DEFAULTS)
+    merged.update({key: float(value) for key, value in options.items() if value is not None})
+    if merged['t_step'] <= 0 or merged['t_max'] <= merged['t_min']:
+        raise ValueError("温度范围无效")
+    if (merged['t_max'] - merged['t_min']) / merged['t_step'] + 1 > MAX_CHART_TEMPERATURE_POINTS:
+        raise ValueError(f"温度点数超过上限 {MAX_CHART_TEMPERATURE_POINTS}")
+    return merged
+
+def _constants_cache_key(pressure: float, **options) -> tuple:
+    return (round(float(pressure)),) + tuple(sorted(_chart_options(options).items()))
+
+def _column(values) -> list:
+    """ndarray 转为 JSON 列表，NaN 记为 None，保留 4 位小数"""
+    return [None if v != v else round(float(v), 4) for v in values]
+
+def _label(value: float) -> str:
+    return f'{float(value):g}'
+
+@cache_result(expire_time=3600, key_func=_constants_cache_key, persist=True)  # 1小时缓存
+def get_psychrometric_constants(pressure: float, **options) -> Dict[str, Any]:
+    """
+    获取焓湿图背景等值线（缓存1小时）
+
+    按列返回：所有曲线共用 temp_range (°C)，每条曲线为逐一对应的含湿量 (g/kg)，
+    超出饱和线或范围的位置为 null。options 可覆盖 CHART_BACKGROUND_DEFAULTS 中的范围与分辨率。
+    """
+    options = _chart_options(options)
+    try:
+        import batch_engine
         
-        constants = {
+        table = batch_engine.isoline_table(pressure, **options)
+        return {
             'pressure': pressure,
-            'temp_range': temps.tolist(),
-            'saturation_line': [],
-            'rh_lines': {},
-            'enthalpy_lines': {}
+            'units': {'temp_range': '°C', 'lines': 'g/kg', 'rh_lines': '%',
+                      'enthalpy_lines': 'kJ/kg', 'wet_bulb_lines': '°C', 'volume_lines': 'm³/kg'},
+            'options': options,
+            'temp_range': _column(table['tdb']),
+            'saturation_line': _column(table['saturation']),
+            'rh_lines': {_label(k): _column(v) for k, v in table['rh'].items()},
+            'enthalpy_lines': {_label(k): _column(v) for k, v in table['enthalpy'].items()},
+            'wet_bulb_lines': {_label(k): _column(v) for k, v in table['wet_bulb'].items()},
+            'volume_lines': {_label(k): _column(v) for k, v in table['volume'].items()},
         }
         
-        # 预计算饱和线
-        for temp in temps:
-            try:
-                w_sat = HA.HAPropsSI('W', 'T', temp + 273.15, 'P', pressure, 'R', 1.0) * 1000
-                constants['saturation_line'].append(w_sat)
-            except:
-                constants['saturation_line'].append(None)
-        
-        # 预计算相对湿度线
-        for rh in [20, 40, 60, 80]:
-            constants['rh_lines'][rh] = []
-            for temp in temps:
-                try:
-                    w = HA.HAPropsSI('W', 'T', temp + 273.15, 'P', pressure, 'R', rh / 100.0) * 1000
-                    constants['rh_lines'][rh].append(w)
-                except:
-                    constants['rh_lines'][rh].append(None)
-        
-        return constants
-        
     except Exception as e:
         print(f"常数预计算错误: {e}")
         return {'pressure': pressure, 'error': str(e)}
 
+# 已序列化的背景等值线：标准压力常驻内存，其余按 LRU/TTL 缓存
+_standard_backgrounds: Dict[tuple, tuple] = {}
+_background_payloads = LRUTTLCache(capacity=64, default_ttl=3600)
+
+def _serialize_background(pressure: float, options: Dict[str, Any]) -> tuple:
+    import hashlib
+    import json
+    
+    constants = get_psychrometric_constants(pressure, **options)
+    if 'error' in constants:
+        raise RuntimeError(constants['error'])
+    body = json.dumps(constants, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return body, hashlib.sha256(body).hexdigest()[:32]
+
+def chart_background(pressure: float, **options) -> tuple:
+    """
+    返回 (JSON 字节, ETag) 形式的背景等值线
+
+    内容只取决于压力与选项，可长期缓存；标准压力的默认配置在启动时预计算。
+    """
+    key = _constants_cache_key(pressure, **options)
+    payload = _standard_backgrounds.get(key)
+    if payload is None:
+        payload = _background_payloads.get_or_compute(key, lambda: _serialize_background(pressure, options))
+    return payload
+
+def precompute_chart_backgrounds():
+    """预计算标准压力下默认配置的背景等值线（幂等）"""
+    started = time.perf_counter()
+    missing = [p for p in STANDARD_PRESSURES if _constants_cache_key(p) not in _standard_backgrounds]
+    for pressure in missing:
+        try:
+            _standard_backgrounds[_constants_cache_key(pressure)] = _serialize_background(pressure, {})
+        except Exception as e:
+            print(f"背景等值线预计算警告 ({pressure} Pa): {e}")
+    if missing:
+        record_startup('chart_backgrounds', time.perf_counter() - started)
+
+def prewarm_process_pool():
+    """POOL_WORKERS > 1 时创建进程池并等待工作进程完成预热，单核或禁用时跳过"""
+    try:
+        import parallel
+    except ImportError:
+        return
+    started = time.perf_counter()
+    if parallel.prewarm_pool():
+        record_startup('process_pool', time.perf_counter() - started)
+        print(f"进程池已就绪: {parallel.POOL_WORKERS} 个工作进程")
+
 # 启动时优化
 def initialize_serverless_environment():
     """初始化 Serverless 环境"""
@@ -143,11 +315,19 @@ def initialize_serverless_environment():
         # 预热依赖
         optimizer.warm_up_dependencies()
         
+        # 从第二级缓存载入常用结果
+        loaded = optimizer.warm_load_persistent()
+        if loaded:
+            print(f"已从第二级缓存载入 {loaded} 条结果")
+        
         # 优化内存
         optimizer.optimize_memory_usage()
         
         # 预缓存常用数据
-        get_psychrometric_constants(101325.0)  # 标准大气压
+        precompute_chart_backgrounds()  # 标准压力的背景等值线
+        
+        # 多核实例预先启动批量计算进程池
+        prewarm_process_pool()
         
         print("Serverless 环境初始化完成")
         
@@ -0,0 +1,282 @@
+# process_chain.py - 空气处理过程链模拟
+"""
+在一次调用中按顺序模拟空气处理过程（如表冷 → 再热 → 加湿），逐步给出每个中间状态。
+
+每一步只在标准状态 (T, W, P) 上做能量与质量平衡，不经过 CoolProp 输入组合求解；
+全部状态的其余参数最后由 batch_engine.derive_properties 一次向量化推导。
+
+支持的过程（温度 K、含湿量 kg/kg、焓 J/kg 干空气，与 /calculate 一致）：
+
+- heat / cool: 等湿加热或冷却，给定出口温度 T、温升 dT 或单位干空气热量 q 之一；冷却不得低于露点
+- coil:        表冷除湿，给定机器露点 adp 与旁通系数 bypass_factor；
+               出口为进风与机器露点饱和状态按旁通系数的混合，露点高于进风露点时为干工况（等湿冷却）
+- humidify:    method='steam'（蒸汽加湿，焓增为加湿量 × 蒸汽焓）或 'adiabatic'（绝热加湿，湿球温度不变），
+               给定出口相对湿度 R、含湿量 W 之一；绝热加湿也可给定饱和效率 efficiency
+- mix:         与另一股气流混合，stream 为此前状态的名称或输入参数字典，ratio 为当前气流的干空气质量比例
+"""
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+import batch_engine
+from calculator import calculate_properties, _format_result
+
+PROCESS_OPERATIONS = ('heat', 'cool', 'coil', 'humidify', 'mix')
+HUMIDIFY_METHODS = ('steam', 'adiabatic')
+
+# 单个过程链的最大步数
+MAX_PROCESS_STEPS = 100
+
+# 加湿蒸汽比焓 (J/kg)，100 °C 饱和蒸汽
+STEAM_ENTHALPY = 2676.0e3
+
+# 各过程在焓湿图上的默认标签与颜色
+PROCESS_LABELS = {'heat': '加热', 'cool': '冷却', 'coil': '冷却除湿', 'humidify': '加湿', 'mix': '混合'}
+PROCESS_COLORS = {'heat': 'red', 'cool': 'blue', 'coil': 'navy', 'humidify': 'green', 'mix': 'purple'}
+
+State = Tuple[float, float, float]
+
+
+def _scalar(value) -> float:
+    return float(np.ravel(value)[0])
+
+
+def _enthalpy(state: State) -> float:
+    return _scalar(batch_engine.enthalpy(*state))
+
+
+def _saturation_w(T: float, P: float) -> float:
+    return _scalar(batch_engine.saturation_humidity_ratio(T, P))
+
+
+def _dew_point(W: float, P: float) -> float:
+    return _scalar(batch_engine.saturation_temperature(batch_engine.vapor_pressure(W, P), P))
+
+
+def _temperature(H: float, W: float, P: float) -> float:
+    return _scalar(batch_engine.temperature_from_enthalpy(H, W, P))
+
+
+def _solve(func, lo: float, hi: float) -> float:
+    root = _scalar(batch_engine._solve_bracketed(func, np.array([lo]), np.array([hi])))
+    if not np.isfinite(root):
+        raise ValueError("目标状态无解")
+    return root
+
+
+def _require(step: Dict[str, Any], *names: str) -> Dict[str, float]:
+    """取出必填参数"""
+    missing = [name for name in names if step.get(name) is None]
+    if missing:
+        raise ValueError(f"缺少参数: {', '.join(missing)}")
+    return {name: float(step[name]) for name in names}
+
+
+def _one_of(step: Dict[str, Any], *names: str) -> Tuple[str, float]:
+    """取出恰好一个给定的参数"""
+    given = [name for name in names if step.get(name) is not None]
+    if len(given) != 1:
+        raise ValueError(f"需要且只能给出 {' / '.join(names)} 中的一个")
+    return given[0], float(step[given[0]])
+
+
+def sensible(state: State, step: Dict[str, Any], cooling: bool) -> State:
+    """等湿加热或冷却"""
+    T, W, P = state
+    name, value = _one_of(step, 'T', 'dT', 'q')
+    if name == 'T':
+        T_out = value
+    elif name == 'dT':
+        T_out = T + value
+    else:
+        T_out = _temperature(_enthalpy(state) + value, W, P)
+    if cooling and T_out > T or not cooling and T_out < T:
+        raise ValueError("加热过程出口温度应不低于进口温度" if not cooling else "冷却过程出口温度应不高于进口温度")
+    if T_out < _dew_point(W, P) - 1e-6:
+        raise ValueError("出口温度低于露点，应使用 coil（冷却除湿）")
+    return T_out, W, P
+
+
+def cooling_coil(state: State, step: Dict[str, Any]) -> State:
+    """表冷除湿：进风与机器露点饱和状态按旁通系数混合"""
+    T, W, P = state
+    params = _require(step, 'adp', 'bypass_factor')
+    adp, bf = params['adp'], params['bypass_factor']
+    if not 0 <= bf <= 1:
+        raise ValueError("旁通系数超出范围 (0~1)")
+    if adp >= T:
+        raise ValueError("机器露点应低于进风干球温度")
+    W_adp = _saturation_w(adp, P)
+    if W_adp >= W:
+        # 干工况：盘管表面高于进风露点，不除湿
+        return bf * T + (1 - bf) * adp, W, P
+    H = bf * _enthalpy(state) + (1 - bf) * _enthalpy((adp, W_adp, P))
+    W_out = bf * W + (1 - bf) * W_adp
+    return _temperature(H, W_out, P), W_out, P
+
+
+def humidify(state: State, step: Dict[str, Any]) -> State:
+    """蒸汽加湿（焓增为加湿量 × 蒸汽焓）或绝热加湿（湿球温度不变）"""
+    T, W, P = state
+    method = step.get('method') or 'steam'
+    if method not in HUMIDIFY_METHODS:
+        raise ValueError(f"不支持的加湿方式: {method}")
+
+    if method == 'steam':
+        H = _enthalpy(state)
+
+        def temperature(W_out):
+            return batch_engine.temperature_from_enthalpy(H + (W_out - W) * STEAM_ENTHALPY, W_out, P)
+        name, value = _one_of(step, 'R', 'W')
+        # 蒸汽带入的显热使温度略有上升，饱和含湿量上限取进风温度 +10 K
+        upper = _saturation_w(T + 10.0, P)
+    else:
+        B = batch_engine.wet_bulb_temperature(T, W, P)
+
+        def temperature(W_out):
+            return batch_engine.temperature_from_wet_bulb(B, W_out, P)
+        name, value = _one_of(step, 'R', 'W', 'efficiency')
+        upper = _saturation_w(_scalar(B), P)
+        if name == 'efficiency':
+            if not 0 <= value <= 1:
+                raise ValueError("饱和效率超出范围 (0~1)")
+            name, value = 'W', W + value * (upper - W)
+
+    if name == 'R':
+        if not 0 < value <= 1:
+            raise ValueError("相对湿度超出范围 (0~1)")
+        if value < _scalar(batch_engine.relative_humidity(T, W, P)):
+            raise ValueError("目标相对湿度低于进风相对湿度")
+        W_out = _solve(lambda w: batch_engine.relative_humidity(temperature(w), w, P) - value, W, upper)
+    else:
+        W_out = value
+        if W_out < W:
+            raise ValueError("目标含湿量低于进风含湿量")
+    T_out = _scalar(temperature(W_out))
+    if W_out > _saturation_w(T_out, P) * (1 + 1e-6):
+        raise ValueError("加湿后超过饱和状态")
+    return T_out, W_out, P
+
+
+def mix(state: State, other: State, step: Dict[str, Any]) -> State:
+    """按干空气质量混合：含湿量与焓值加权平均"""
+    ratio = _require(step, 'ratio')['ratio']
+    if not 0 <= ratio <= 1:
+        raise ValueError("混合比例超出范围 (0~1)")
+    P = state[2]
+    W = ratio * state[1] + (1 - ratio) * other[1]
+    H = ratio * _enthalpy(state) + (1 - ratio) * _enthalpy(other)
+    return _temperature(H, W, P), W, P
+
+
+def simulate_chain(start: Dict[str, float], steps: List[Dict[str, Any]], pressure_pa: float,
+                   start_name: str = 'S0') -> Dict[str, Any]:
+    """
+    模拟过程链
+
+    Args:
+        start: 初始状态的输入参数，如 {'T': 303.15, 'R': 0.6}
+        steps: 过程列表，每步为 {'op': 'heat' | 'cool' | 'coil' | 'humidify' | 'mix', 'name': 可选, ...参数}
+        pressure_pa: 压力 (Pa)
+        start_name: 初始状态名称
+
+    Returns:
+        {'success', 'states': 各状态（含每步的焓差、含湿量差）,
+         'points' / 'process_lines': 与 /generate-chart 相同格式的绘图数据}
+
+    Raises:
+        ValueError: 输入无效或某一步无解，信息中带步骤序号
+    """
+    if not 1 <= len(steps) <= MAX_PROCESS_STEPS:
+        raise ValueError(f"过程步数超出范围 (1~{MAX_PROCESS_STEPS})")
+
+    def resolve(inputs: Dict[str, float], label: str) -> State:
+        props = {'P': pressure_pa}
+        props.update(inputs)
+        result = calculate_properties(props, return_state=True)
+        if not result.get('success'):
+            raise ValueError(f"{label}计算失败: {result.get('error')}")
+        state = result['state']
+        return state['T'], state['W'], state['P']
+
+    names = [start_name]
+    states = [resolve(start, "初始状态")]
+    extra = []  # 混合用的外部气流 (名称, 状态)
+    by_name = {start_name: states[0]}
+
+    for index, step in enumerate(steps, start=1):
+        op = step.get('op')
+        name = step.get('name') or f'S{index}'
+        try:
+            if op not in PROCESS_OPERATIONS:
+                raise ValueError(f"不支持的过程: {op}")
+            if name in by_name:
+                raise ValueError(f"状态名称重复: {name}")
+            current = states[-1]
+            if op in ('heat', 'cool'):
+                new_state = sensible(current, step, cooling=op == 'cool')
+            elif op == 'coil':
+                new_state = cooling_coil(current, step)
+            elif op == 'humidify':
+                new_state = humidify(current, step)
+            else:
+                stream = step.get('stream')
+                if isinstance(stream, str):
+                    if stream not in by_name:
+                        raise ValueError(f"未知的状态名称: {stream}")
+                    other = by_name[stream]
+                elif isinstance(stream, dict):
+                    other = resolve(stream, "混合气流")
+                    stream_name = f'{name}_in'
+                    extra.append((stream_name, other))
+                    by_name[stream_name] = other
+                else:
+                    raise ValueError("mix 需要 stream（状态名称或输入参数）")
+                new_state = mix(current, other, step)
+        except ValueError as e:
+            raise ValueError(f"第 {index} 步 ({op}): {e}")
+        names.append(name)
+        states.append(new_state)
+        by_name[name] = new_state
+
+    # 全部状态一次向量化推导其余参数
+    all_names = names + [stream_name for stream_name, _ in extra]
+    all_states = states + [state for _, state in extra]
+    T, W, P = (np.array(column, dtype=float) for column in zip(*all_states))
+    columns = batch_engine.derive_properties(T, W, P)
+    H = batch_engine.enthalpy(T, W, P)
+
+    results = []
+    for i, name in enumerate(names):
+        result = _format_result(columns, i)
+        result['name'] = name
+        if i > 0:
+            step = steps[i - 1]
+            result['op'] = step['op']
+            result['delta'] = {
+                'tdb': round(float(T[i] - T[i - 1]), 2),
+                'w': round(float(W[i] - W[i - 1]) * 1000.0, 3),
+                'h': round(float(H[i] - H[i - 1]) / 1000.0, 2),
+            }
+        results.append(result)
+
+    points = []
+    for i, name in enumerate(all_names):
+        properties = _format_result(columns, i)
+        points.append({
+            'name': name,
+            'tdb': properties['tdb'], 'w': properties['w'], 'h': properties['h'], 'rh': properties['rh'],
+            'color': 'blue' if i < len(names) else 'gray', 'marker': 'o', 'size': 8,
+            'properties': properties,
+        })
+
+    process_lines = []
+    for i, step in enumerate(steps, start=1):
+        line = {'from': names[i - 1], 'to': names[i], 'label': PROCESS_LABELS[step['op']],
+                'color': PROCESS_COLORS[step['op']], 'style': '-', 'width': 2}
+        process_lines.append(line)
+        if step['op'] == 'mix':
+            stream = step['stream'] if isinstance(step['stream'], str) else f'{names[i]}_in'
+            process_lines.append(dict(line, **{'from': stream, 'label': None, 'style': '--'}))
+
+    return {'success': True, 'states': results, 'points': points, 'process_lines': process_lines}
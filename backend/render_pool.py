@@ -0,0 +1,186 @@
+# render_pool.py - 有界图表渲染池
+"""
+焓湿图渲染只使用 matplotlib 面向对象接口（Figure + FigureCanvasAgg），不触碰 pyplot 全局状态；
+每个 Figure 同一时刻只由一个线程使用，因此不同请求可以在多个线程中同时渲染。
+
+- 画布复用：按键（压力）保存已绘好背景的空闲画布，渲染时借出、叠加状态点与过程线、输出后归还
+- 并发上限：同时进行的渲染数不超过 workers，超出的调用排队等待
+- 空闲画布总数不超过 max_idle，超出时丢弃最久未用的画布
+- 内存上限：渲染前按画布尺寸与 DPI 估算栅格缓冲区大小，超过 max_bytes 时拒绝；
+  渲染后按实际输出的像素尺寸重新估算内存峰值并记录（估算值，并非测量值）
+
+配置：PSYCHRO_RENDER_WORKERS（并发渲染数，默认 2）、PSYCHRO_RENDER_IDLE（空闲画布上限，默认 8）、
+PSYCHRO_RENDER_MAX_BYTES（单次渲染内存上限，默认 64 MB）、PSYCHRO_RENDER_MAX_DPI（默认 300）。
+"""
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+# 渲染指标（metrics 模块不可用时不记录）
+try:
+    from metrics import record_render
+except ImportError:
+    def record_render(fmt: str, seconds: float, peak_estimate_bytes: int):
+        pass
+
+# 输出格式 → 媒体类型
+RENDER_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml', 'webp': 'image/webp'}
+# 栅格格式（需要按 DPI 分配像素缓冲区）
+RASTER_FORMATS = ('png', 'webp')
+
+DEFAULT_DPI = 100
+MIN_DPI = 30
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        print(f"{name} 配置无效，使用默认值: {default}")
+        return default
+
+
+def _estimate_peak(output: bytes, fmt: str) -> int:
+    """
+    估算单次渲染的内存峰值：栅格格式为实际输出像素的 RGBA 缓冲区（WebP 编码另有一份副本）加输出字节数，
+    矢量格式为输出字节数
+
+    这是由图片尺寸推算的估算值，并非测量值：Agg 缓冲区由 C++ 分配，tracemalloc 统计不到；
+    进程 RSS 的变化又会混入并发渲染与其他请求的分配。实际内存请用 memory_profile 模块测量。
+    """
+    if fmt not in RASTER_FORMATS:
+        return len(output)
+    from PIL import Image
+
+    # 只读取文件头中的尺寸
+    width, height = Image.open(io.BytesIO(output)).size
+    return width * height * 4 * (2 if fmt == 'webp' else 1) + len(output)
+
+
+class RenderLimitExceeded(ValueError):
+    """请求的输出尺寸超过单次渲染的内存上限"""
+
+
+class Canvas:
+    """一张可复用的画布：背景已绘制，叠加层在每次渲染后移除"""
+
+    def __init__(self, fig, ax):
+        self.fig = fig
+        self.ax = ax
+
+
+class RenderPool:
+    """按键复用画布的有界渲染池"""
+
+    def __init__(self, workers: Optional[int] = None, max_idle: Optional[int] = None,
+                 max_bytes: Optional[int] = None, max_dpi: Optional[int] = None):
+        self.workers = max(1, workers if workers is not None else _env_number('PSYCHRO_RENDER_WORKERS', 2, int))
+        self.max_idle = max(0, max_idle if max_idle is not None else _env_number('PSYCHRO_RENDER_IDLE', 8, int))
+        self.max_bytes = max_bytes if max_bytes is not None else _env_number(
+            'PSYCHRO_RENDER_MAX_BYTES', 64 * 1024 * 1024, int)
+        self.max_dpi = max_dpi if max_dpi is not None else _env_number('PSYCHRO_RENDER_MAX_DPI', 300, int)
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._lock = threading.Lock()
+        # (键, 序号) → 空闲画布，按最近归还排序
+        self._idle: "OrderedDict[Tuple[Hashable, int], Canvas]" = OrderedDict()
+        self._serial = 0
+        self._stats = {'renders': 0, 'built': 0, 'reused': 0, 'discarded': 0, 'rejected': 0,
+                       'last_peak_estimate_bytes': 0, 'max_peak_estimate_bytes': 0}
+
+    def check_limits(self, fig_size: Tuple[float, float], fmt: str, dpi: float) -> int:
+        """校验格式与 DPI，返回估算的栅格缓冲区字节数；超出上限时抛出 RenderLimitExceeded"""
+        if fmt not in RENDER_FORMATS:
+            raise ValueError(f"不支持的图片格式: {fmt}")
+        if not MIN_DPI <= dpi <= self.max_dpi:
+            raise ValueError(f"DPI 超出范围 ({MIN_DPI}~{self.max_dpi})")
+        if fmt not in RASTER_FORMATS:
+            return 0
+        width, height = fig_size
+        # RGBA 缓冲区；WebP 编码时 Pillow 还会复制一份图像
+        estimate = int(width * dpi) * int(height * dpi) * 4 * (2 if fmt == 'webp' else 1)
+        if estimate > self.max_bytes:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise RenderLimitExceeded(
+                f"输出尺寸过大：约需 {estimate / 2 ** 20:.1f} MB，上限 {self.max_bytes / 2 ** 20:.1f} MB，请降低 DPI"
+            )
+        return estimate
+
+    def _checkout(self, key: Hashable, build: Callable[[], Canvas]) -> Canvas:
+        with self._lock:
+            for slot in reversed(self._idle):
+                if slot[0] == key:
+                    self._stats['reused'] += 1
+                    return self._idle.pop(slot)
+            self._stats['built'] += 1
+        return build()
+
+    def _checkin(self, key: Hashable, canvas: Canvas):
+        with self._lock:
+            self._serial += 1
+            self._idle[(key, self._serial)] = canvas
+            while len(self._idle) > self.max_idle:
+                self._idle.popitem(last=False)
+                self._stats['discarded'] += 1
+
+    @contextmanager
+    def canvas(self, key: Hashable, build: Callable[[], Canvas]) -> Iterator[Canvas]:
+        """占用一个渲染名额并借出 key 对应的画布（没有空闲画布时调用 build 新建）"""
+        with self._slots:
+            canvas = self._checkout(key, build)
+            try:
+                yield canvas
+            except BaseException:
+                # 出错的画布可能残留叠加层，不再复用
+                with self._lock:
+                    self._stats['discarded'] += 1
+                raise
+            self._checkin(key, canvas)
+
+    def render(self, key: Hashable, build: Callable[[], Canvas], draw: Callable[[Any], List[Any]],
+               fig_size: Tuple[float, float], fmt: str = 'png', dpi: float = DEFAULT_DPI,
+               **savefig_kwargs) -> bytes:
+        """
+        在 key 对应的画布上绘制叠加层并输出图片
+
+        Args:
+            build: 新建画布（绘制背景）的函数，画布尺寸为 fig_size（英寸）
+            draw: draw(ax) 绘制叠加层，返回需在渲染后移除的 artist 列表
+            fmt: 'png' / 'svg' / 'webp'
+            dpi: 输出分辨率
+        """
+        self.check_limits(fig_size, fmt, dpi)
+        started = time.perf_counter()
+        with self.canvas(key, build) as canvas:
+            added = draw(canvas.ax)
+            buffer = io.BytesIO()
+            try:
+                canvas.fig.savefig(buffer, format=fmt, dpi=dpi, **savefig_kwargs)
+            finally:
+                for artist in added:
+                    artist.remove()
+        output = buffer.getvalue()
+        peak = _estimate_peak(output, fmt)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._stats['renders'] += 1
+            self._stats['last_peak_estimate_bytes'] = peak
+            self._stats['max_peak_estimate_bytes'] = max(self._stats['max_peak_estimate_bytes'], peak)
+        record_render(fmt, elapsed, peak)
+        return output
+
+    def clear(self):
+        """丢弃全部空闲画布"""
+        with self._lock:
+            self._idle.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'workers': self.workers, 'idle': len(self._idle), 'max_idle': self.max_idle,
+                          'max_bytes': self.max_bytes, 'max_dpi': self.max_dpi})
+        return stats
@@ -0,0 +1,217 @@
+# response_format.py - 批量接口的紧凑响应格式与压缩
+"""
+批量接口默认返回逐点对象的 JSON 列表，每个点重复全部键名。大批量时可按内容协商改用紧凑格式：
+
+- columnar: 列式 JSON，每个字段一列，``{..., "count": n, "columns": {字段: [...]}, "errors": {行号: 信息}}``
+- msgpack:  与 columnar 相同结构的 MessagePack（需要 msgpack 包）
+- f32 / f64: 数值列为小端 float32 / float64 原始数组，结构如下::
+
+      b'PSYCOL01' | uint32 小端 头部长度 | 头部 JSON (UTF-8) | 补零到 8 字节对齐 | 各数值列依次排列（每列 count 个值）
+
+  头部 JSON 含 count、dtype、numeric（数值列顺序）、columns（文本列）、errors 及接口的其它字段；
+  失败的行数值为 NaN。Python 客户端可直接用 read_table 解析
+
+紧凑格式中失败的行只出现在 errors（行号 → 错误信息）中，不再单独给出 success 列。
+
+选择方式：查询参数 ``format``，或 Accept 头（见 FORMAT_MEDIA_TYPES）；都未指定时为默认 JSON，与原格式一致。
+Accept-Encoding 含 br（需要 brotli 包）或 gzip 且响应超过 MIN_COMPRESS_BYTES 时压缩响应体。
+"""
+import gzip
+import json
+import struct
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi.responses import Response
+
+# 可选依赖：缺少时对应格式 / 编码不可用
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FORMAT_MEDIA_TYPES = {
+    'json': 'application/json',
+    'columnar': 'application/vnd.psychro.columnar+json',
+    'msgpack': 'application/msgpack',
+    'f32': 'application/vnd.psychro.float32',
+    'f64': 'application/vnd.psychro.float64',
+}
+# 其它可识别的 Accept 媒体类型
+_ACCEPT_ALIASES = {'application/x-msgpack': 'msgpack', 'application/octet-stream': 'f64'}
+_BINARY_DTYPES = {'f32': '<f4', 'f64': '<f8'}
+
+# 小于该字节数的响应不压缩
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+_MAGIC = b'PSYCOL01'
+
+
+class FormatUnavailable(ValueError):
+    """请求的格式依赖未安装的可选包"""
+
+
+class OutputFormat(NamedTuple):
+    """协商结果：响应格式与内容编码（None 表示不压缩）"""
+    format: str = 'json'
+    encoding: Optional[str] = None
+
+
+def _parse_header(value: Optional[str]) -> List[Tuple[str, float]]:
+    """解析 Accept / Accept-Encoding，按 q 值降序返回 (取值, q)；q=0 的项忽略"""
+    items = []
+    for position, part in enumerate((value or '').split(',')):
+        token, *params = (piece.strip() for piece in part.split(';'))
+        if not token:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            items.append((token.lower(), q, position))
+    return [(token, q) for token, q, _ in sorted(items, key=lambda item: (-item[1], item[2]))]
+
+
+def negotiate(accept: Optional[str], accept_encoding: Optional[str], explicit: Optional[str] = None) -> OutputFormat:
+    """
+    确定响应格式与压缩方式
+
+    Args:
+        accept: 请求的 Accept 头
+        accept_encoding: 请求的 Accept-Encoding 头
+        explicit: 查询参数 format，优先于 Accept
+
+    Raises:
+        ValueError: format 取值无效
+        FormatUnavailable: 请求的格式依赖未安装的包
+    """
+    fmt = explicit
+    if fmt is None:
+        fmt = 'json'
+        for media_type, _ in _parse_header(accept):
+            match = _ACCEPT_ALIASES.get(media_type) or next(
+                (name for name, known in FORMAT_MEDIA_TYPES.items() if known == media_type), None)
+            if match is not None:
+                fmt = match
+                break
+    if fmt not in FORMAT_MEDIA_TYPES:
+        raise ValueError(f"不支持的响应格式: {fmt}")
+    if fmt == 'msgpack' and msgpack is None:
+        raise FormatUnavailable("服务端未安装 msgpack，无法返回 MessagePack")
+
+    # q 值相同时优先 br（压缩率更高）
+    candidates = [(q, token == 'br') for token, q in _parse_header(accept_encoding)
+                  if token == 'gzip' or token == 'br' and brotli is not None]
+    encoding = ('br' if max(candidates)[1] else 'gzip') if candidates else None
+    return OutputFormat(fmt, encoding)
+
+
+class Table:
+    """紧凑格式的中间表示：接口级字段 + 按列存放的逐点数据"""
+
+    def __init__(self, meta: Dict[str, Any], columns: Dict[str, list], numeric: Sequence[str],
+                 errors: Optional[Dict[int, str]] = None):
+        self.meta = meta
+        self.columns = columns
+        self.numeric = tuple(numeric)
+        self.errors = errors or {}
+        self.count = len(next(iter(columns.values()))) if columns else 0
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Dict[str, Any]], fields: Sequence[str], numeric: Sequence[str],
+                  meta: Dict[str, Any]) -> 'Table':
+        """由逐点字典构建；success 为 False 的行计入 errors，其数值列为 None"""
+        columns = {field: [row.get(field) for row in rows] for field in fields}
+        errors = {index: row.get('error') or '计算失败'
+                  for index, row in enumerate(rows) if row.get('success') is False}
+        return cls(meta, columns, numeric, errors)
+
+    def document(self) -> Dict[str, Any]:
+        """列式 JSON / MessagePack 的结构"""
+        return dict(self.meta, count=self.count, columns=self.columns,
+                    errors={str(index): message for index, message in self.errors.items()})
+
+    def pack(self, dtype: str) -> bytes:
+        """二进制格式：头部 JSON + 数值列原始数组"""
+        text_columns = {name: values for name, values in self.columns.items() if name not in self.numeric}
+        header = dict(self.meta, count=self.count, dtype=dtype, numeric=list(self.numeric), columns=text_columns,
+                      errors={str(index): message for index, message in self.errors.items()})
+        header_bytes = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        prefix = _MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes
+        parts = [prefix, b'\0' * (-len(prefix) % 8)]
+        for name in self.numeric:
+            values = np.array([np.nan if value is None else value for value in self.columns[name]], dtype=float)
+            parts.append(values.astype(dtype).tobytes())
+        return b''.join(parts)
+
+
+def read_table(data: bytes) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """解析二进制格式，返回 (头部, {数值列: ndarray})"""
+    if data[:len(_MAGIC)] != _MAGIC:
+        raise ValueError("不是有效的列式二进制数据")
+    (header_length,) = struct.unpack_from('<I', data, len(_MAGIC))
+    start = len(_MAGIC) + 4
+    header = json.loads(data[start:start + header_length].decode('utf-8'))
+    offset = start + header_length
+    offset += -offset % 8
+    dtype = np.dtype(header['dtype'])
+    arrays = {}
+    for name in header['numeric']:
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=header['count'], offset=offset)
+        offset += header['count'] * dtype.itemsize
+    return header, arrays
+
+
+def _compress(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    if encoding is None or len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY), 'br'
+    return gzip.compress(body, compresslevel=GZIP_LEVEL), 'gzip'
+
+
+def encoded_json(body: bytes, output: Optional[OutputFormat]) -> Response:
+    """已按 JSONResponse 参数编码好的默认 JSON 响应体，按协商结果压缩后返回（分段编码的批量结果使用）"""
+    body, applied = _compress(body, output.encoding if output is not None else None)
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+    if applied is not None:
+        headers['Content-Encoding'] = applied
+    return Response(content=body, media_type=FORMAT_MEDIA_TYPES['json'], headers=headers)
+
+
+def respond(payload: Dict[str, Any], output: OutputFormat, table: Callable[[Dict[str, Any]], Table]
+            ) -> Response:
+    """
+    按协商结果输出批量接口的结果
+
+    在调用线程中完成编码与压缩，返回带 Vary 头的 Response（默认 JSON 也不例外，
+    否则共享缓存可能把 JSON 响应复用给请求紧凑格式的客户端）。table(payload) 构建紧凑格式的中间表示。
+    """
+    fmt, encoding = output
+    if fmt == 'json':
+        # 与 FastAPI JSONResponse 的序列化参数一致
+        body = json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+    elif fmt == 'columnar':
+        body = json.dumps(table(payload).document(), ensure_ascii=False, allow_nan=False,
+                          separators=(',', ':')).encode('utf-8')
+    elif fmt == 'msgpack':
+        body = msgpack.packb(table(payload).document(), use_bin_type=True)
+    else:
+        body = table(payload).pack(_BINARY_DTYPES[fmt])
+
+    body, applied = _compress(body, encoding)
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+    if applied is not None:
+        headers['Content-Encoding'] = applied
+    return Response(content=body, media_type=FORMAT_MEDIA_TYPES[fmt], headers=headers)
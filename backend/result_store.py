@@ -0,0 +1,352 @@
+# result_store.py - 跨实例的第二级结果缓存
+"""
+进程内的 LRUTTLCache 在每次云函数冷启动后为空；本模块提供可持久化的第二级缓存，
+冷启动的实例可以直接读取此前（或构建时）算好的结果。
+
+- 后端接口 ResultBackend 只处理 (命名空间, 键, 字节串)，SQLiteBackend 为本地文件实现；
+  Redis 等外部服务实现同样的四个方法即可接入
+- 读穿 (read-through)：一级缓存未命中时先查第二级，命中则不再计算
+- 写后 (write-behind)：新算出的结果放入队列，由后台线程批量写入，不阻塞请求；队列满时丢弃
+- 版本：命名空间由 RESULT_STORE_VERSION 与 CoolProp 版本组成，计算方法或依赖升级后旧条目自动失效
+- 预热：启动时把最近写入的条目载入一级缓存；部署时可用命令行工具预先写入常用状态
+
+配置：PSYCHRO_RESULT_CACHE（SQLite 文件路径，默认 backend/result_cache.sqlite，文件不存在时不启用；
+设为 off 关闭）、PSYCHRO_RESULT_CACHE_WARM（启动时载入的条目数，默认 2048）。
+云函数代码目录只读，此时文件以只读方式打开、只读不写；指向 CFS 等可写挂载点时新结果可被其它实例复用。
+
+条目以 pickle 保存，文件只能来自本服务的构建或运行，不得使用外部来源的文件。
+
+用法::
+
+    python result_store.py seed [--path result_cache.sqlite] [--pressures 101325,89876]
+    python result_store.py info [result_cache.sqlite]
+"""
+import abc
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+# 计算方法或结果格式变化时递增，使已持久化的条目失效
+RESULT_STORE_VERSION = 2
+
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'result_cache.sqlite')
+
+# 写后队列的长度上限与单批写入条数
+WRITE_QUEUE_SIZE = 10000
+WRITE_BATCH = 256
+
+
+def _coolprop_version() -> str:
+    """读取已安装的 CoolProp 版本（只读包元数据，不导入 CoolProp）"""
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:  # Python < 3.8
+        return 'unknown'
+    try:
+        return version('CoolProp')
+    except PackageNotFoundError:
+        return 'none'
+
+
+def default_namespace() -> str:
+    return f'v{RESULT_STORE_VERSION}-coolprop{_coolprop_version()}'
+
+
+class ResultBackend(abc.ABC):
+    """第二级缓存后端接口：按命名空间存取字节串；未实现全部抽象方法的子类无法实例化"""
+
+    read_only = False
+
+    @abc.abstractmethod
+    def get_many(self, namespace: str, keys: Sequence[str]) -> Dict[str, bytes]:
+        """返回存在的键对应的值"""
+
+    @abc.abstractmethod
+    def put_many(self, namespace: str, items: Sequence[Tuple[str, bytes]]):
+        """写入或覆盖多个键"""
+
+    @abc.abstractmethod
+    def recent(self, namespace: str, limit: int) -> List[bytes]:
+        """最近写入的至多 limit 个值，用于启动预热"""
+
+    @abc.abstractmethod
+    def purge(self, keep_namespace: str) -> int:
+        """删除其它命名空间（旧版本）的条目，返回删除条数"""
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend(ResultBackend):
+    """本地 SQLite 文件后端；所在目录不可写时以只读方式打开"""
+
+    def __init__(self, path: str, read_only: Optional[bool] = None):
+        self.path = path
+        if read_only is None:
+            directory = os.path.dirname(os.path.abspath(path))
+            read_only = not os.access(directory, os.W_OK) or (os.path.exists(path) and not os.access(path, os.W_OK))
+        self.read_only = read_only
+        if read_only:
+            # immutable: 不创建日志文件、不加锁，适合部署包中的只读文件
+            self._conn = sqlite3.connect(f'file:{os.path.abspath(path)}?mode=ro&immutable=1',
+                                         uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                ' namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, updated REAL NOT NULL,'
+                ' PRIMARY KEY (namespace, key)) WITHOUT ROWID'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS results_updated ON results (namespace, updated)')
+            self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, namespace: str, keys: Sequence[str]) -> Dict[str, bytes]:
+        if not keys:
+            return {}
+        placeholders = ','.join('?' * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT key, value FROM results WHERE namespace = ? AND key IN ({placeholders})',
+                (namespace, *keys)
+            ).fetchall()
+        return dict(rows)
+
+    def put_many(self, namespace: str, items: Sequence[Tuple[str, bytes]]):
+        if self.read_only or not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO results (namespace, key, value, updated) VALUES (?, ?, ?, ?)',
+                [(namespace, key, value, now) for key, value in items]
+            )
+            self._conn.commit()
+
+    def recent(self, namespace: str, limit: int) -> List[bytes]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT value FROM results WHERE namespace = ? ORDER BY updated DESC LIMIT ?', (namespace, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def purge(self, keep_namespace: str) -> int:
+        if self.read_only:
+            return 0
+        with self._lock:
+            deleted = self._conn.execute('DELETE FROM results WHERE namespace != ?', (keep_namespace,)).rowcount
+            self._conn.commit()
+        return deleted
+
+    def counts(self) -> Dict[str, int]:
+        """各命名空间的条目数"""
+        with self._lock:
+            return dict(self._conn.execute('SELECT namespace, COUNT(*) FROM results GROUP BY namespace').fetchall())
+
+    def close(self):
+        with self._lock:
+            if not self.read_only:
+                # 合并 WAL，文件可单独随部署包发布
+                self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            self._conn.close()
+
+
+def _digest(key: Hashable) -> str:
+    """缓存键的稳定摘要；键须由基本类型组成，repr 在各进程间一致"""
+    return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+
+
+class PersistentCache:
+    """第二级缓存：读穿查找与后台批量写入"""
+
+    def __init__(self, backend: ResultBackend, namespace: Optional[str] = None):
+        self.backend = backend
+        self.namespace = namespace or default_namespace()
+        self._queue: "queue.Queue[Tuple[Hashable, Any, float]]" = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'errors': 0, 'queued': 0, 'written': 0, 'dropped': 0,
+                       'warm_loaded': 0}
+
+    def _count(self, name: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """返回 (是否命中, 值)；后端出错时按未命中处理"""
+        digest = _digest(key)
+        try:
+            blob = self.backend.get_many(self.namespace, [digest]).get(digest)
+            if blob is not None:
+                stored_key, value, _ = pickle.loads(blob)
+                # 摘要相同而键不同（几乎不可能）时不使用
+                if stored_key == key:
+                    self._count('hits')
+                    return True, value
+        except Exception as e:
+            self._count('errors')
+            print(f"第二级缓存读取警告: {e}")
+        self._count('misses')
+        return False, None
+
+    def put(self, key: Hashable, value: Any, ttl: float):
+        """放入写后队列（序列化与写入都在后台线程中进行）；只读后端或队列已满时丢弃"""
+        if self.backend.read_only:
+            return
+        try:
+            self._queue.put_nowait((key, value, ttl))
+        except queue.Full:
+            self._count('dropped')
+            return
+        self._count('queued')
+        self._ensure_writer()
+
+    def _ensure_writer(self):
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name='result-store-writer', daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch: List[Tuple[Hashable, Any, float]]):
+        try:
+            items = [(_digest(key), pickle.dumps((key, value, ttl), protocol=pickle.HIGHEST_PROTOCOL))
+                     for key, value, ttl in batch]
+            self.backend.put_many(self.namespace, items)
+            self._count('written', len(items))
+        except Exception as e:
+            self._count('errors')
+            print(f"第二级缓存写入警告: {e}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """等待写后队列清空，返回是否在超时前完成"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def warm(self, limit: int) -> Iterable[Tuple[Hashable, Any, float]]:
+        """最近写入的至多 limit 个条目：(键, 值, ttl)"""
+        try:
+            blobs = self.backend.recent(self.namespace, limit)
+        except Exception as e:
+            self._count('errors')
+            print(f"第二级缓存预热警告: {e}")
+            return []
+        entries = []
+        for blob in blobs:
+            try:
+                entries.append(pickle.loads(blob))
+            except Exception:
+                self._count('errors')
+        self._count('warm_loaded', len(entries))
+        return entries
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({'backend': type(self.backend).__name__, 'namespace': self.namespace,
+                      'read_only': self.backend.read_only, 'pending': self._queue.unfinished_tasks})
+        return stats
+
+
+def open_store(path: Optional[str] = None) -> Optional[PersistentCache]:
+    """
+    按 PSYCHRO_RESULT_CACHE 打开第二级缓存
+
+    未配置路径且默认文件不存在、或配置为 off 时返回 None（不启用）。
+    """
+    configured = os.environ.get('PSYCHRO_RESULT_CACHE')
+    if configured is not None and configured.strip().lower() in ('', 'off', '0', 'false'):
+        return None
+    if path is None:
+        path = configured or DEFAULT_STORE_PATH
+        if configured is None and not os.path.exists(path):
+            return None
+    try:
+        return PersistentCache(SQLiteBackend(path))
+    except sqlite3.Error as e:
+        print(f"第二级缓存不可用 ({path}): {e}")
+        return None
+
+
+def seed(path: str, pressures: Sequence[float]) -> Dict[str, int]:
+    """
+    在 path 中写入常用状态：各压力下 -10~45 °C × 10~100 %RH 的状态参数，以及默认配置的背景等值线
+    """
+    import performance
+    import calculator
+
+    store = PersistentCache(SQLiteBackend(path, read_only=False))
+    previous = performance.optimizer.set_persistent(store)
+    try:
+        purged = store.backend.purge(store.namespace)
+        performance.optimizer._cache.clear()
+        for pressure in pressures:
+            performance.get_psychrometric_constants(pressure)
+            for t in range(-10, 46):
+                for rh in range(10, 101, 5):
+                    calculator.calculate_properties({'P': pressure, 'T': t + 273.15, 'R': rh / 100.0})
+        store.flush(timeout=120.0)
+    finally:
+        performance.optimizer.set_persistent(previous)
+    counts = store.backend.counts()
+    store.backend.close()
+    return {'purged': purged, **counts}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='第二级结果缓存（SQLite）')
+    sub = parser.add_subparsers(dest='command', required=True)
+    seed_parser = sub.add_parser('seed', help='预先写入常用状态')
+    seed_parser.add_argument('--path', default=os.environ.get('PSYCHRO_RESULT_CACHE') or DEFAULT_STORE_PATH)
+    seed_parser.add_argument('--pressures', default=None, help='逗号分隔的压力 (Pa)，默认使用标准压力')
+    info_parser = sub.add_parser('info', help='各版本的条目数')
+    info_parser.add_argument('path', nargs='?', default=os.environ.get('PSYCHRO_RESULT_CACHE') or DEFAULT_STORE_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == 'info':
+        backend = SQLiteBackend(args.path, read_only=True)
+        print(json.dumps({'path': args.path, 'current': default_namespace(), 'namespaces': backend.counts(),
+                          'bytes': os.path.getsize(args.path)}, ensure_ascii=False, indent=2))
+        return
+
+    if args.pressures:
+        pressures = [float(item) for item in args.pressures.split(',') if item.strip()]
+    else:
+        from performance import STANDARD_PRESSURES
+        pressures = list(STANDARD_PRESSURES)
+    started = time.perf_counter()
+    counts = seed(args.path, pressures)
+    print(f"已写入 {args.path}（{time.perf_counter() - started:.1f}s，{os.path.getsize(args.path) / 1e6:.1f} MB）："
+          f"{json.dumps(counts, ensure_ascii=False)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+# scf_harness.py - SCF 入口函数的冷/热调用耗时测量
+"""
+在本地重放 API 网关触发器事件，经 main_app.main 调用，测量一次 SCF 调用的实际开销，不需要任何云端资源。
+
+- 冷启动：每次在新的子进程中依次执行 导入 main_app → initialize_serverless_environment → 调用一次事件，
+  分别计时；子进程总耗时另含解释器启动
+- 热调用：在同一个子进程中初始化后，对每个事件先调用一次（不计入），再循环调用 --warm 次
+
+各阶段：import（导入 main_app）、warmup（initialize_serverless_environment）、
+handler（main(event, context)，含 Mangum 转换与应用处理）、serialize（SCF 运行时对返回值做 JSON 序列化，以 json.dumps 计时）。
+热调用中相同事件的结果会命中缓存，与线上重复请求一致。
+
+事件文件为 JSON（单个事件或事件列表），格式同 SCF API 网关触发器；events/ 下为录制的样例，
+也可用 --from-routes 由 coldstart.COMPUTE_ROUTES 生成。
+
+用法::
+
+    python scf_harness.py                          # events/ 下全部事件，冷启动 5 次、热调用 50 次
+    python scf_harness.py events/calculate.json --cold 10 --warm 200 --output harness.json
+    python scf_harness.py --from-routes --cold 0   # 只测热调用
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+EVENTS_DIR = os.path.join(BACKEND_DIR, 'events')
+
+# 子进程中会自动初始化 Serverless 环境的变量；测量时去掉，以便单独计时 warmup
+_AUTO_INIT_VARS = ('SERVERLESS_RUNTIME', 'SCF_RUNTIME')
+
+
+def scf_event(method: str, path: str, query: str = '', body: Any = None,
+              headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """构造 SCF API 网关触发器事件（body 为 dict/list 时按 JSON 编码）"""
+    params: Dict[str, str] = {}
+    for part in filter(None, query.split('&')):
+        name, _, value = part.partition('=')
+        params[name] = value
+    all_headers = {'host': 'service-local.gz.apigw.tencentcs.com', 'accept': 'application/json'}
+    if body is not None:
+        all_headers['content-type'] = 'application/json'
+    all_headers.update(headers or {})
+    return {
+        'httpMethod': method,
+        'path': path,
+        'headers': all_headers,
+        'headerParameters': {},
+        'pathParameters': {},
+        'queryString': params,
+        'queryStringParameters': {},
+        'stageVariables': {},
+        'body': body if body is None or isinstance(body, str) else json.dumps(body),
+        'isBase64Encoded': False,
+        'requestContext': {
+            'serviceId': 'service-local',
+            'path': '/{proxy+}',
+            'httpMethod': 'ANY',
+            'requestId': 'local',
+            'identity': {},
+            'sourceIp': '127.0.0.1',
+            'stage': 'release',
+        },
+    }
+
+
+def route_events() -> Dict[str, Dict[str, Any]]:
+    """由 coldstart.COMPUTE_ROUTES 生成事件，名称为 "方法 路径?查询串" """
+    from coldstart import COMPUTE_ROUTES
+
+    return {f"{method} {path}{'?' + query if query else ''}": scf_event(method, path, query, body)
+            for method, path, query, body in COMPUTE_ROUTES}
+
+
+def load_events(paths: List[str]) -> Dict[str, Dict[str, Any]]:
+    """读取事件文件（目录取其中的 *.json），名称为文件名（列表中的事件加序号）"""
+    files: List[str] = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, '*.json'))) if os.path.isdir(path) else [path])
+    events = {}
+    for file in files:
+        with open(file, encoding='utf-8') as f:
+            data = json.load(f)
+        name = os.path.splitext(os.path.basename(file))[0]
+        if isinstance(data, list):
+            events.update({f'{name}[{index}]': event for index, event in enumerate(data)})
+        else:
+            events[name] = data
+    return events
+
+
+def _context() -> Dict[str, Any]:
+    """本地调用的 SCF context"""
+    return {
+        'request_id': str(uuid.uuid4()),
+        'function_name': 'psychro-calculator-api',
+        'function_version': '$LATEST',
+        'namespace': 'default',
+        'memory_limit_in_mb': 1024,
+        'time_limit_in_ms': 30000,
+    }
+
+
+def _invoke(main, event: Dict[str, Any]) -> Dict[str, Any]:
+    """调用一次入口函数，返回 handler / serialize 耗时、状态码与响应字节数"""
+    started = time.perf_counter()
+    result = main(event, _context())
+    handled = time.perf_counter()
+    body = json.dumps(result, ensure_ascii=False)
+    serialized = time.perf_counter()
+    return {
+        'handler': handled - started,
+        'serialize': serialized - handled,
+        'status': result.get('statusCode'),
+        'bytes': len(body.encode('utf-8')),
+    }
+
+
+def _child(events: Dict[str, Dict[str, Any]], warm: int) -> Dict[str, Any]:
+    """
+    子进程内：导入、初始化并调用事件
+
+    warm 为 0 时只调用第一个事件一次（冷启动）；否则对每个事件预调用一次后循环调用 warm 次。
+    应用的输出转到 stderr，stdout 只输出结果 JSON。
+    """
+    with contextlib.redirect_stdout(sys.stderr):
+        sys.path.insert(0, BACKEND_DIR)
+        started = time.perf_counter()
+        import main_app
+        imported = time.perf_counter()
+        from performance import initialize_serverless_environment
+        initialize_serverless_environment()
+        report: Dict[str, Any] = {'import': imported - started, 'warmup': time.perf_counter() - imported}
+
+        if not warm:
+            name, event = next(iter(events.items()))
+            report['event'] = name
+            report.update(_invoke(main_app.main, event))
+            return report
+
+        report['events'] = {}
+        for name, event in events.items():
+            _invoke(main_app.main, event)
+            calls = [_invoke(main_app.main, event) for _ in range(warm)]
+            report['events'][name] = {
+                'handler': [call['handler'] for call in calls],
+                'serialize': [call['serialize'] for call in calls],
+                'status': calls[-1]['status'],
+                'bytes': calls[-1]['bytes'],
+            }
+        return report
+
+
+def _spawn(events: Dict[str, Dict[str, Any]], warm: int) -> Dict[str, Any]:
+    """在新进程中运行 _child，返回其结果并附上进程总耗时 process"""
+    env = {key: value for key, value in os.environ.items() if key not in _AUTO_INIT_VARS}
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', str(warm)],
+                          input=json.dumps(events), cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"退出码 {proc.returncode}")
+    report = json.loads(proc.stdout.strip().splitlines()[-1])
+    report['process'] = elapsed
+    return report
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    """毫秒：中位数、p95、最大值"""
+    ordered = sorted(samples)
+    return {
+        'median_ms': round(statistics.median(ordered) * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def run(events: Dict[str, Dict[str, Any]], cold: int = 5, warm: int = 50) -> Dict[str, Any]:
+    """
+    冷启动：每个事件各 cold 个新进程；热调用：一个进程内每个事件 warm 次
+
+    Returns:
+        {'cold': {事件: {阶段: 统计}}, 'warm': {'import', 'warmup', 'events': {事件: {阶段: 统计}}}}
+    """
+    results: Dict[str, Any] = {'cold': {}, 'warm': {}}
+    for name, event in events.items():
+        if not cold:
+            break
+        runs = [_spawn({name: event}, 0) for _ in range(cold)]
+        results['cold'][name] = {
+            phase: _summary([run_[phase] for run_ in runs])
+            for phase in ('process', 'import', 'warmup', 'handler', 'serialize')
+        }
+        results['cold'][name]['status'] = runs[-1]['status']
+    if warm:
+        report = _spawn(events, warm)
+        results['warm'] = {
+            'import': round(report['import'] * 1000, 3),
+            'warmup': round(report['warmup'] * 1000, 3),
+            'events': {
+                name: dict(handler=_summary(data['handler']), serialize=_summary(data['serialize']),
+                           status=data['status'], bytes=data['bytes'])
+                for name, data in report['events'].items()
+            },
+        }
+    return results
+
+
+def _print_report(results: Dict[str, Any]):
+    if results['cold']:
+        print("冷启动（中位数 / p95，毫秒）")
+        print(f"  {'事件':<28}{'进程':>16}{'import':>16}{'warmup':>16}{'handler':>16}{'serialize':>14}  状态")
+        for name, phases in results['cold'].items():
+            cells = ''.join(f"{phases[phase]['median_ms']:>8.1f}/{phases[phase]['p95_ms']:<7.1f}"
+                            for phase in ('process', 'import', 'warmup', 'handler'))
+            print(f"  {name:<28}{cells}{phases['serialize']['median_ms']:>13.2f}   {phases['status']}")
+    if results['warm']:
+        warm = results['warm']
+        print(f"热调用（进程内 import {warm['import']:.1f} ms，warmup {warm['warmup']:.1f} ms；中位数 / p95，毫秒）")
+        print(f"  {'事件':<28}{'handler':>18}{'serialize':>18}{'字节':>10}  状态")
+        for name, data in warm['events'].items():
+            handler, serialize = data['handler'], data['serialize']
+            print(f"  {name:<28}{handler['median_ms']:>9.2f}/{handler['p95_ms']:<8.2f}"
+                  f"{serialize['median_ms']:>9.3f}/{serialize['p95_ms']:<8.3f}{data['bytes']:>10}   {data['status']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="SCF 入口函数冷/热调用耗时测量（本地重放 API 网关事件）")
+    parser.add_argument('events', nargs='*', help="事件 JSON 文件或目录（默认 events/）")
+    parser.add_argument('--from-routes', action='store_true', help="使用 coldstart.COMPUTE_ROUTES 生成的事件")
+    parser.add_argument('--cold', type=int, default=5, help="每个事件的冷启动次数（0 表示不测）")
+    parser.add_argument('--warm', type=int, default=50, help="每个事件的热调用次数（0 表示不测）")
+    parser.add_argument('--output', help="结果写入 JSON 文件")
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        print(json.dumps(_child(json.load(sys.stdin), args.child)))
+        return 0
+
+    events = route_events() if args.from_routes else load_events(args.events or [EVENTS_DIR])
+    if not events:
+        print("没有可重放的事件")
+        return 1
+    results = run(events, args.cold, args.warm)
+    _print_report(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    failed = sorted({name for name, data in list(results['cold'].items()) + list(results['warm'].get('events', {}).items())
+                     if not 200 <= (data['status'] or 0) < 400})
+    for name in failed:
+        print(f"失败: {name} 返回非 2xx/3xx 状态")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,462 @@
+# scheduler.py - 按成本分级的请求调度（交互优先、批量分片、按客户端配额）
+"""
+单点 /calculate 与数万点的 /calculate-multiple 最终都在同一个进程、同一把 GIL 下计算，
+只把它们放进不同的执行器并不能阻止大批量请求拖慢交互请求。本模块在 executor 之上加一层调度：
+
+- 成本分级：按点数与输入参数组合估算计算成本（直接解析的组合为 1，(H,R)/(B,R) 需要牛顿迭代，
+  (B,H) 回退到逐点 CoolProp，mode=fast 减半），成本不超过 PSYCHRO_INTERACTIVE_COST 的请求进入
+  interactive 执行器，其余进入 bulk 执行器
+- 交互优先：批量任务按时间片（PSYCHRO_SLICE_MS，默认 20 ms）分段执行，每片之后若有非批量请求
+  正在处理（RequestTracker 按请求计数，包括事件循环中的解析与序列化），就让出 CPU 与 GIL
+  直到这些请求完成（请求结束时由 RequestTracker 唤醒），单次最多让出 PSYCHRO_SLICE_MAX_YIELD_MS，
+  保证批量任务不会被饿死；每片的行数按该类任务每行耗时的移动平均自动调整
+- 运行时调优（tune_runtime，由 main_app 在启动完成后调用一次，影响整个进程）：
+  冻结启动阶段创建的对象（gc.freeze），全量回收不再反复扫描它们；PSYCHRO_GC_THRESHOLD 大于 0 时
+  把年轻代回收阈值改为该值，大批量任务分配大量对象时全量回收的次数随之减少（默认 0 保持解释器默认值）；
+  PSYCHRO_SWITCH_INTERVAL_MS 大于 0 时修改 GIL 切换间隔，事件循环线程从批量线程取回 GIL 的等待随之缩短
+  （默认 0 保持解释器默认的 5 ms）
+- 客户端配额：按 PSYCHRO_CLIENT_HEADER 请求头（默认 X-Client-Id，缺省时为客户端 IP）区分客户端，
+  限制每个客户端同时进行的批量任务数（PSYCHRO_CLIENT_BULK_JOBS），
+  可选按每分钟计算成本限流（PSYCHRO_CLIENT_COST_PER_MINUTE，0 表示不限），超出时返回 429
+
+排队深度见 /metrics 中的 psychro_executor_waiting，排队等待时间见 psychro_executor_queue_wait_seconds。
+
+负载测试（进程内经 ASGI 请求，比较无批量负载、批量分片、批量不分片时交互请求的延迟）::
+
+    python scheduler.py --duration 10 --bulk-clients 2 --bulk-points 50000
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import gc
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, Optional, Tuple
+
+from executor import ComputeExecutor, Overloaded, interactive, bulk
+
+# 调度与分片计数（metrics 模块不可用时不记录）
+try:
+    from metrics import record_scheduled, record_slice, record_quota_rejected
+except ImportError:
+    def record_scheduled(lane: str):
+        pass
+
+    def record_slice(seconds: float, yielded: float):
+        pass
+
+    def record_quota_rejected(reason: str):
+        pass
+
+# 进程池可用时，大批量的每个时间片不少于进程池的启用阈值，仍能并行计算
+try:
+    from parallel import POOL_WORKERS, POOL_THRESHOLD
+except ImportError:
+    POOL_WORKERS, POOL_THRESHOLD = 1, 20000
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        print(f"{name} 配置无效，使用默认值: {default}")
+        return default
+
+
+INTERACTIVE_COST = _env_number('PSYCHRO_INTERACTIVE_COST', 500, float)
+SLICE_SECONDS = _env_number('PSYCHRO_SLICE_MS', 20, float) / 1000
+MAX_YIELD_SECONDS = _env_number('PSYCHRO_SLICE_MAX_YIELD_MS', 100, float) / 1000
+CLIENT_HEADER = os.environ.get('PSYCHRO_CLIENT_HEADER', 'x-client-id').lower()
+CLIENT_BULK_JOBS = _env_number('PSYCHRO_CLIENT_BULK_JOBS', 2, int)
+CLIENT_COST_PER_MINUTE = _env_number('PSYCHRO_CLIENT_COST_PER_MINUTE', 0, float)
+SWITCH_INTERVAL = _env_number('PSYCHRO_SWITCH_INTERVAL_MS', 0, float) / 1000
+GC_THRESHOLD = _env_number('PSYCHRO_GC_THRESHOLD', 0, int)
+
+# 每个时间片的最少行数（首个时间片按此行数试探每行耗时）
+MIN_SLICE_ROWS = 256
+# 输入参数组合（排序后的标准代码）的每点相对成本，未列出的组合为 1
+PAIR_COSTS = {('H', 'R'): 3.0, ('B', 'R'): 3.0, ('B', 'H'): 50.0}
+FAST_MODE_FACTOR = 0.5
+# 配额记录超过该客户端数时清理空闲的客户端
+MAX_TRACKED_CLIENTS = 10000
+
+# CoolProp 输入参数别名 → 标准代码（同 calculator.INPUT_ALIASES，不为此导入 calculator）
+_ALIASES = {
+    'Tdb': 'T', 'T_db': 'T', 'Twb': 'B', 'T_wb': 'B', 'WetBulb': 'B', 'Tdp': 'D', 'T_dp': 'D', 'DewPoint': 'D',
+    'RH': 'R', 'RelHum': 'R', 'Omega': 'W', 'HumRat': 'W', 'Hda': 'H',
+}
+
+# 当前请求所在的执行器（'interactive' / 'bulk'），随上下文带入工作线程
+_lane: contextvars.ContextVar = contextvars.ContextVar('scheduler_lane', default=None)
+# ASGI scope 中标记已计为批量请求的键
+_BULK_MARK = 'psychro.bulk'
+
+
+def tune_runtime():
+    """服务预热完成后调用：冻结已有对象，并按配置修改垃圾回收阈值与 GIL 切换间隔（影响整个进程）"""
+    gc.collect()
+    gc.freeze()
+    if GC_THRESHOLD > 0:
+        gc.set_threshold(GC_THRESHOLD, *gc.get_threshold()[1:])
+    if SWITCH_INTERVAL > 0:
+        sys.setswitchinterval(SWITCH_INTERVAL)
+
+
+def _pair_cost(row: Any) -> float:
+    if not isinstance(row, dict):
+        return 1.0
+    codes = tuple(sorted(_ALIASES.get(code, code) for code in row if code != 'P'))
+    return PAIR_COSTS.get(codes, 1.0)
+
+
+def estimate_cost(rows: Iterable[Any], mode: str = 'exact') -> float:
+    """
+    估算一批输入的计算成本（单位约为一个直接解析的状态点）
+
+    Args:
+        rows: 输入参数字典，如 [{'T': 298.15, 'R': 0.6}, ...]
+        mode: 'fast' 查表计算，成本减半
+    """
+    cost = sum(_pair_cost(row) for row in rows)
+    return cost * FAST_MODE_FACTOR if mode == 'fast' else cost
+
+
+def client_id(request) -> str:
+    """客户端标识：PSYCHRO_CLIENT_HEADER 请求头，缺省时为客户端 IP"""
+    value = request.headers.get(CLIENT_HEADER)
+    if value:
+        return value[:64]
+    return request.client.host if request.client is not None else 'anonymous'
+
+
+class ClientQuotas:
+    """按客户端的批量任务并发数与计算成本令牌桶"""
+
+    def __init__(self, bulk_jobs: int = CLIENT_BULK_JOBS, cost_per_minute: float = CLIENT_COST_PER_MINUTE):
+        """
+        Args:
+            bulk_jobs: 每个客户端同时进行的批量任务上限，0 表示不限
+            cost_per_minute: 每个客户端每分钟的计算成本上限（令牌桶容量，按秒均匀补充），0 表示不限
+        """
+        self.bulk_jobs = bulk_jobs
+        self.cost_per_minute = cost_per_minute
+        self._active: Dict[str, int] = {}
+        self._buckets: Dict[str, list] = {}  # 客户端 → [剩余令牌, 上次补充时间]
+
+    def _take_tokens(self, client: str, cost: float):
+        capacity = self.cost_per_minute
+        rate = capacity / 60
+        now = time.monotonic()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_CLIENTS:
+                self._prune(now)
+            bucket = self._buckets[client] = [capacity, now]
+        bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        # 超过容量的单个请求在令牌桶满时放行，之后按欠额计算等待时间
+        needed = min(cost, capacity)
+        if bucket[0] < needed:
+            record_quota_rejected('cost')
+            raise Overloaded(f"客户端 {client} 的计算配额已用尽，请稍后重试", 429,
+                             max(1, math.ceil((needed - bucket[0]) / rate)))
+        bucket[0] -= cost
+
+    def _prune(self, now: float):
+        """清理令牌已补满且没有进行中任务的客户端"""
+        rate = self.cost_per_minute / 60
+        for client, (tokens, updated) in list(self._buckets.items()):
+            if client not in self._active and tokens + (now - updated) * rate >= self.cost_per_minute:
+                del self._buckets[client]
+
+    @contextlib.contextmanager
+    def admit(self, client: str, cost: float, lane: ComputeExecutor, is_bulk: bool):
+        """在配额内时进入，批量任务计入该客户端的并发数直到退出；超出配额时抛出 Overloaded (429)"""
+        if is_bulk and self.bulk_jobs and self._active.get(client, 0) >= self.bulk_jobs:
+            record_quota_rejected('bulk_jobs')
+            raise Overloaded(f"客户端 {client} 同时进行的批量任务已达上限 ({self.bulk_jobs})，请稍后重试",
+                             429, lane.retry_after())
+        if self.cost_per_minute > 0:
+            self._take_tokens(client, cost)
+        if not is_bulk:
+            yield
+            return
+        self._active[client] = self._active.get(client, 0) + 1
+        try:
+            yield
+        finally:
+            remaining = self._active[client] - 1
+            if remaining:
+                self._active[client] = remaining
+            else:
+                del self._active[client]
+
+
+class Scheduler:
+    """按成本把请求分到交互或批量执行器，批量任务分片执行并在片间让出给交互请求"""
+
+    def __init__(self, high: ComputeExecutor, low: ComputeExecutor, quotas: Optional[ClientQuotas] = None,
+                 interactive_cost: float = INTERACTIVE_COST, slice_seconds: float = SLICE_SECONDS,
+                 max_yield: float = MAX_YIELD_SECONDS):
+        """
+        Args:
+            high / low: 交互与批量执行器
+            quotas: 客户端配额，默认按环境变量配置
+            interactive_cost: 进入交互执行器的成本上限
+            slice_seconds: 批量任务每个时间片的目标耗时，0 表示不分片
+            max_yield: 每个时间片之后最多让出的秒数
+        """
+        self.high = high
+        self.low = low
+        self.quotas = quotas if quotas is not None else ClientQuotas()
+        self.interactive_cost = interactive_cost
+        self.slice_seconds = slice_seconds
+        self.max_yield = max_yield
+        self._row_seconds: Dict[str, float] = {}  # 按任务类型的每行耗时指数移动平均
+        # 处理中的 HTTP 请求数与其中的批量请求数（只在事件循环线程中修改，工作线程只读）
+        self._requests = 0
+        self._bulk_requests = 0
+        # pause 中等待的批量任务由 RequestTracker 在请求结束时唤醒
+        self._idle = threading.Condition()
+
+    def lane(self, cost: Optional[float]) -> ComputeExecutor:
+        """成本未知（如尚未解析的大请求体）按批量处理"""
+        return self.high if cost is not None and cost <= self.interactive_cost else self.low
+
+    async def run(self, request, cost: Optional[float], key: Optional[Hashable],
+                  func: Callable[..., Any], *args) -> Any:
+        """
+        按成本选择执行器，在客户端配额内执行 func(*args)
+
+        Args:
+            request: 当前请求，用于识别客户端
+            cost: estimate_cost 的结果，None 表示按批量处理
+            key: 合并键，同 ComputeExecutor.run
+        """
+        lane = self.lane(cost)
+        is_bulk = lane is self.low
+        with self.quotas.admit(client_id(request), cost or 0, lane, is_bulk):
+            record_scheduled(lane.name)
+            _lane.set(lane.name)
+            if is_bulk:
+                self.mark_bulk(request)
+            return await lane.run(key, func, *args)
+
+    def mark_bulk(self, request):
+        """把请求计为批量请求（如流式计算），批量任务不再为它让出；请求结束时由 RequestTracker 扣除"""
+        if _BULK_MARK in request.scope or not request.scope.get('psychro.tracked'):
+            return
+        request.scope[_BULK_MARK] = True
+        self._bulk_requests += 1
+
+    def interactive_pending(self) -> bool:
+        """是否有非批量请求正在处理，或交互执行器中有排队、计算中的任务"""
+        return self._requests > self._bulk_requests or self.high.active() > 0
+
+    def request_finished(self):
+        """请求结束时在事件循环线程中调用，唤醒 pause 中等待的批量任务"""
+        with self._idle:
+            self._idle.notify_all()
+
+    def pause(self) -> float:
+        """在批量任务的工作线程中调用：有交互请求时等待（最多 max_yield 秒），返回等待的秒数"""
+        if _lane.get() != self.low.name or not self.interactive_pending():
+            return 0.0
+        started = time.perf_counter()
+        with self._idle:
+            self._idle.wait_for(lambda: not self.interactive_pending(), timeout=self.max_yield)
+        return time.perf_counter() - started
+
+    def slices(self, total: int, kind: str) -> Iterator[Tuple[int, int]]:
+        """
+        把 total 行的任务切成时间片，逐个产出 (start, stop)；调用方在两次迭代之间处理该片
+
+        每片的行数按 kind 类任务的每行耗时调整到约 slice_seconds；片与片之间在批量执行器中
+        为交互请求让出。不分片（slice_seconds 为 0）时一次产出全部行。
+        """
+        if self.slice_seconds <= 0 or total <= MIN_SLICE_ROWS:
+            yield 0, total
+            return
+        min_rows = POOL_THRESHOLD if POOL_WORKERS > 1 and total >= POOL_THRESHOLD else MIN_SLICE_ROWS
+        start = 0
+        while start < total:
+            row_seconds = self._row_seconds.get(kind)
+            size = max(min_rows, int(self.slice_seconds / row_seconds)) if row_seconds else min_rows
+            stop = min(total, start + size)
+            began = time.perf_counter()
+            yield start, stop
+            elapsed = time.perf_counter() - began
+            per_row = elapsed / (stop - start)
+            self._row_seconds[kind] = per_row if row_seconds is None else row_seconds + 0.2 * (per_row - row_seconds)
+            start = stop
+            record_slice(elapsed, self.pause() if start < total else 0.0)
+
+
+class RequestTracker:
+    """ASGI 中间件：统计处理中的 HTTP 请求数，供批量任务判断是否让出"""
+
+    def __init__(self, app, scheduler: Scheduler):
+        self.app = app
+        self.scheduler = scheduler
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        scope['psychro.tracked'] = True
+        self.scheduler._requests += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.scheduler._requests -= 1
+            if scope.get(_BULK_MARK):
+                self.scheduler._bulk_requests -= 1
+            self.scheduler.request_finished()
+
+
+scheduler = Scheduler(interactive, bulk)
+
+
+# --- 负载测试 ---
+
+def _random_inputs() -> Dict[str, float]:
+    return {'T': round(random.uniform(273.15, 313.15), 4), 'R': round(random.uniform(0.1, 0.9), 4)}
+
+
+def _bulk_body(points: int) -> bytes:
+    return json.dumps({
+        'pressure': 101325.0,
+        'points': [{'name': f'P{i}', 'inputs': _random_inputs()} for i in range(points)],
+    }).encode()
+
+
+async def _interactive_client(client, stop: asyncio.Event, latencies: list, errors: list, think: float):
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.post('/calculate', json={'P': 101325.0, **_random_inputs()},
+                                     headers={'x-client-id': 'interactive'})
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(response.status_code)
+        await asyncio.sleep(think)
+
+
+async def _bulk_client(client, stop: asyncio.Event, name: str, bodies: list, jobs: list, errors: list):
+    index = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        # 客户端与服务端在同一事件循环中，不要求压缩，以免客户端解压计入交互请求的延迟
+        response = await client.post('/calculate-multiple', content=bodies[index % len(bodies)],
+                                     headers={'content-type': 'application/json', 'accept-encoding': 'identity',
+                                              'x-client-id': name})
+        index += 1
+        if response.status_code == 200:
+            jobs.append(time.perf_counter() - started)
+        else:
+            errors.append(response.status_code)
+            await asyncio.sleep(0.1)
+
+
+def _percentiles(samples: list) -> Dict[str, float]:
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {'count': len(ordered), 'p50_ms': pick(0.5), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99),
+            'max_ms': round(ordered[-1] * 1000, 2), 'mean_ms': round(statistics.mean(ordered) * 1000, 2)}
+
+
+async def _phase(app, seconds: float, interactive_clients: int, think: float,
+                 bulk_clients: int, bodies: list, points: int) -> Dict[str, Any]:
+    import httpx
+
+    stop = asyncio.Event()
+    latencies, jobs, errors = [], [], []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://loadtest', timeout=120) as client:
+        tasks = [asyncio.create_task(_bulk_client(client, stop, f'bulk-{i}', bodies, jobs, errors))
+                 for i in range(bulk_clients)]
+        if bulk_clients:
+            await asyncio.sleep(0.5)  # 让批量任务先进入计算
+        tasks += [asyncio.create_task(_interactive_client(client, stop, latencies, errors, think))
+                  for _ in range(interactive_clients)]
+        await asyncio.sleep(seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+    return {
+        'interactive': _percentiles(latencies),
+        'bulk_jobs': len(jobs),
+        'bulk_job_ms': _percentiles(jobs).get('p50_ms'),
+        'bulk_points_per_second': round(len(jobs) * points / seconds),
+        'errors': len(errors),
+    }
+
+
+def loadtest(seconds: float = 10.0, bulk_clients: int = 2, points: int = 50000,
+             interactive_clients: int = 4, think: float = 0.02) -> Dict[str, Any]:
+    """
+    进程内负载测试：持续发送单点 /calculate（随机输入，不命中缓存），分三个阶段测量交互请求延迟：
+    idle 无批量负载；bulk 同时有 bulk_clients 个客户端不断提交 points 点的 /calculate-multiple；
+    bulk-unsliced 同上但批量任务不分片（slice_seconds=0）
+    """
+    import main_app
+    # 以脚本运行时本模块是 __main__，应用使用的是按模块名导入的调度器
+    from scheduler import scheduler as active
+
+    bodies = [_bulk_body(points) for _ in range(3)]
+    slice_seconds = active.slice_seconds
+    results = {}
+    try:
+        for name, clients, slicing in (('idle', 0, slice_seconds), ('bulk', bulk_clients, slice_seconds),
+                                       ('bulk-unsliced', bulk_clients, 0.0)):
+            active.slice_seconds = slicing
+            results[name] = asyncio.run(_phase(main_app.app, seconds, interactive_clients, think,
+                                               clients, bodies, points))
+    finally:
+        active.slice_seconds = slice_seconds
+    return results
+
+
+def _print_report(results: Dict[str, Any]):
+    print(f"  {'阶段':<16}{'请求数':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}"
+          f"{'批量任务':>10}{'批量点/秒':>12}{'错误':>6}")
+    for name, data in results.items():
+        lat = data['interactive']
+        cells = ''.join(f"{lat.get(key, float('nan')):>10.1f}" for key in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms'))
+        print(f"  {name:<16}{lat['count']:>8}{cells}{data['bulk_jobs']:>10}"
+              f"{data['bulk_points_per_second']:>12}{data['errors']:>6}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="交互请求在批量负载下的延迟（进程内负载测试）")
+    parser.add_argument('--duration', type=float, default=10.0, help="每个阶段的秒数")
+    parser.add_argument('--bulk-clients', type=int, default=2, help="并发提交批量任务的客户端数")
+    parser.add_argument('--bulk-points', type=int, default=50000, help="每个批量任务的点数")
+    parser.add_argument('--interactive-clients', type=int, default=4, help="并发发送单点请求的客户端数")
+    parser.add_argument('--think', type=float, default=0.02, help="交互客户端两次请求之间的间隔（秒）")
+    parser.add_argument('--output', help="结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    results = loadtest(args.duration, args.bulk_clients, args.bulk_points, args.interactive_clients, args.think)
+    print(f"交互请求延迟（毫秒），批量任务 {args.bulk_points} 点 × {args.bulk_clients} 个客户端")
+    _print_report(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    sys.exit(main())
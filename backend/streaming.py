@@ -0,0 +1,240 @@
+# streaming.py - 流式批量计算（NDJSON / CSV）
+"""
+面向传感器趋势日志的流式计算管线：
+
+    请求体字节流 → 按行切分 → 解析为输入行 → 固定大小分块 → 向量化批量计算 → 逐行序列化输出
+
+每一级都是生成器，任意时刻只持有一个分块，内存占用与输入总行数无关。
+分块计算交给有界的 bulk 执行器，与其他批量请求共用准入队列；中途过载时以一条错误记录结束。
+输入参数使用 CoolProp 代码或 calculator.INPUT_ALIASES 中的别名（SI 单位），
+其余字段（如时间戳、设备编号）原样带回输出。
+"""
+import csv
+import io
+import json
+import os
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from starlette.responses import StreamingResponse
+
+from calculator import compute_rows, INPUT_ALIASES
+from executor import bulk, Overloaded
+import batch_engine
+
+# 每个向量化分块的行数
+DEFAULT_CHUNK_ROWS = int(os.environ.get('PSYCHRO_STREAM_CHUNK_ROWS', '5000'))
+
+# 单行最大字节数，超出时中止，防止无换行的输入占满内存
+MAX_LINE_BYTES = 64 * 1024
+
+MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+RESULT_FIELDS = ('tdb', 'twb', 'rh', 'w', 'h', 'tdp', 'success', 'error')
+
+_INPUT_CODES = set(batch_engine.SUPPORTED_INPUTS) | {'P'} | set(INPUT_ALIASES)
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    边读请求体边输出的流式响应
+
+    StreamingResponse 在 ASGI 2.4 以下会并发监听客户端断开，
+    该监听会抢先消费尚未读取的请求体消息；这里由响应生成器自己读取请求体，
+    客户端断开时 request.stream() 会抛出 ClientDisconnect 结束管线。
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def detect_format(content_type: Optional[str], explicit: Optional[str] = None) -> str:
+    """根据显式参数或 Content-Type 判断数据格式"""
+    if explicit:
+        fmt = explicit.lower()
+        if fmt not in MEDIA_TYPES:
+            raise ValueError(f"不支持的格式: {explicit}")
+        return fmt
+    return 'csv' if content_type and 'csv' in content_type.lower() else 'ndjson'
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """把任意切分的字节流还原为文本行（不含换行符，跳过空行）"""
+    pending = b''
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        if len(pending) > MAX_LINE_BYTES:
+            raise ValueError(f"单行超过 {MAX_LINE_BYTES} 字节")
+        for line in lines:
+            line = line.rstrip(b'\r')
+            if line:
+                yield line.decode('utf-8-sig')
+    pending = pending.rstrip(b'\r')
+    if pending:
+        yield pending.decode('utf-8-sig')
+
+
+def _split_record(record: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """拆分为 (计算输入, 原样带回的字段)；空值视为未提供"""
+    inputs = {key: value for key, value in record.items()
+              if key in _INPUT_CODES and value not in (None, '')}
+    return inputs, record
+
+
+async def parse_ndjson(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """每行一个 JSON 对象"""
+    async for line in lines:
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("每行必须是 JSON 对象")
+        except ValueError as e:
+            yield None, {'error': f"无法解析的行: {e}"}
+            continue
+        yield _split_record(record)
+
+
+async def parse_csv(lines: AsyncIterator[str],
+                    on_header: Optional[Callable[[List[str]], None]] = None
+                    ) -> AsyncIterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """首行为表头的 CSV；on_header 在读到表头时被调用（用于确定输出列）"""
+    header = None
+    async for line in lines:
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in values]
+            if on_header is not None:
+                on_header(header)
+            continue
+        if len(values) != len(header):
+            yield None, {'error': f"列数与表头不一致: {line}"}
+            continue
+        yield _split_record(dict(zip(header, values)))
+
+
+async def chunked(items: AsyncIterator[Any], size: int) -> AsyncIterator[List[Any]]:
+    """把异步迭代器切成固定大小的分块"""
+    chunk = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _compute_chunk(chunk: List[Tuple[Optional[Dict[str, Any]], Dict[str, Any]]],
+                   pressure_pa: float) -> List[Dict[str, Any]]:
+    """计算一个分块，返回合并了原始字段的结果行"""
+    results = iter(compute_rows([inputs for inputs, _ in chunk if inputs is not None], pressure_pa))
+    rows = []
+    for inputs, record in chunk:
+        if inputs is None:
+            rows.append({'success': False, 'error': record['error']})
+            continue
+        result = next(results)
+        result.setdefault('error', None)
+        rows.append({**record, **result})
+    return rows
+
+
+class _CSVWriter:
+    """
+    逐行输出 CSV
+
+    输出列 = 输入字段 + RESULT_FIELDS。CSV 输入时由解析到的表头通过 use_header 确定；
+    NDJSON 输入时取第一条带输入字段的行，在此之前的解析错误行（只有 success/error）
+    先缓存，避免错误行把表头固定成没有输入列的形式。缓存超过 MAX_PENDING 行仍没有
+    有效行时按仅结果列输出。
+    """
+
+    MAX_PENDING = 1000
+
+    def __init__(self):
+        self._fields = None
+        self._pending = []
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+
+    def _render(self, values: Iterable[Any]) -> str:
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._writer.writerow(values)
+        return self._buffer.getvalue()
+
+    def use_header(self, header: List[str]):
+        """按输入表头确定输出列（首次调用有效）"""
+        if self._fields is None:
+            self._fields = [name for name in header if name not in RESULT_FIELDS] + list(RESULT_FIELDS)
+
+    def _flush(self, rows: List[Dict[str, Any]]) -> str:
+        if self._fields is None:
+            self._fields = list(RESULT_FIELDS)
+        parts = []
+        if self._pending is not None:
+            # 首次输出：先写表头，再写此前缓存的行
+            parts.append(self._render(self._fields))
+            rows, self._pending = self._pending + rows, None
+        for row in rows:
+            parts.append(self._render('' if row.get(key) is None else row.get(key) for key in self._fields))
+        return ''.join(parts)
+
+    def write(self, rows: List[Dict[str, Any]]) -> str:
+        if self._fields is None:
+            for row in rows:
+                extra = [key for key in row if key not in RESULT_FIELDS]
+                if extra:
+                    self._fields = extra + list(RESULT_FIELDS)
+                    break
+            else:
+                self._pending.extend(rows)
+                if len(self._pending) < self.MAX_PENDING:
+                    return ''
+                rows = []
+        return self._flush(rows)
+
+    def finish(self) -> str:
+        """流结束时输出仍在缓存中的行（已知表头但没有数据行时只输出表头）"""
+        if self._pending is None or not (self._pending or self._fields):
+            return ''
+        return self._flush([])
+
+
+def _write_ndjson(rows: List[Dict[str, Any]]) -> str:
+    return ''.join(json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n' for row in rows)
+
+
+async def stream_calculation(chunks: AsyncIterator[bytes], pressure_pa: float,
+                             input_format: str = 'ndjson', output_format: Optional[str] = None,
+                             chunk_rows: int = DEFAULT_CHUNK_ROWS) -> AsyncIterator[bytes]:
+    """
+    流式计算主管线：逐块读取、计算并输出
+
+    Args:
+        chunks: 请求体字节流
+        pressure_pa: 行内未给出 P 时使用的压力 (Pa)
+        input_format / output_format: 'ndjson' 或 'csv'，输出默认与输入相同
+        chunk_rows: 每次向量化计算的行数
+    """
+    if (output_format or input_format) == 'csv':
+        writer = _CSVWriter()
+        write, finish = writer.write, writer.finish
+    else:
+        writer = None
+        write, finish = _write_ndjson, (lambda: '')
+    if input_format == 'csv':
+        rows_in = parse_csv(iter_lines(chunks), writer.use_header if writer is not None else None)
+    else:
+        rows_in = parse_ndjson(iter_lines(chunks))
+
+    try:
+        async for chunk in chunked(rows_in, max(1, chunk_rows)):
+            rows = await bulk.run(None, _compute_chunk, chunk, pressure_pa)
+            yield write(rows).encode('utf-8')
+    except (ValueError, Overloaded) as e:
+        # 响应已经开始输出，只能以一条错误记录结束
+        yield write([{'success': False, 'error': f"流式计算中止: {e}"}]).encode('utf-8')
+    yield finish().encode('utf-8')
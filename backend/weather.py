@@ -0,0 +1,370 @@
+# weather.py - 全年逐时气象数据的焓湿分析
+"""
+读取 EPW 或 CSV 气象文件，向量化计算全年逐时状态，输出：
+
+- 焓湿分箱：干球温度 × 含湿量的二维小时数直方图
+- 区域小时数：落在各区域（干球温度、含湿量、相对湿度等上下限）内的小时数
+- 设计工况：按 ASHRAE 手册的年累计频率给出供暖/供冷干球温度、湿球温度、露点、焓值，
+  以及对应的平均同时发生值（如 0.4% 干球温度对应的平均湿球温度）
+
+文件通过 mmap 读取，只解析需要的列；多个站点可通过 analyze_portfolio 在常驻进程池中并行分析。
+
+用法::
+
+    python weather.py site.epw                       # 单个站点，输出 JSON
+    python weather.py sites/*.epw --workers 8        # 多站点并行
+"""
+import argparse
+import io
+import json
+import mmap
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+import batch_engine
+from calculator import INPUT_ALIASES
+
+Source = Union[str, bytes, bytearray]
+
+# EPW: 8 行文件头，其后每行一个小时；列号从 0 开始
+EPW_HEADER_LINES = 8
+EPW_COLUMNS = {'month': 1, 'day': 2, 'hour': 3, 'tdb': 6, 'tdp': 7, 'rh': 8, 'pressure': 9}
+# EPW 缺测值
+EPW_MISSING = {'tdb': 99.9, 'tdp': 99.9, 'rh': 999.0, 'pressure': 999999.0}
+
+# 单个气象文件的大小上限 (字节)
+MAX_WEATHER_BYTES = 32 * 1024 * 1024
+
+# 分箱步长：干球温度 °C、含湿量 g/kg
+DEFAULT_T_STEP = 1.0
+DEFAULT_W_STEP = 1.0
+
+# 默认统计区域：常用舒适区（干球温度 °C、相对湿度 %、含湿量 g/kg）
+DEFAULT_ZONES = (
+    {'name': '舒适区', 'tdb_min': 20.0, 'tdb_max': 26.0, 'rh_min': 30.0, 'rh_max': 60.0},
+    {'name': '可直接新风供冷', 'tdb_max': 18.0, 'w_max': 10.0},
+)
+ZONE_FIELDS = ('tdb', 'twb', 'rh', 'w', 'h', 'tdp')
+
+# 设计工况的年累计频率 (%)
+HEATING_LEVELS = (99.6, 99.0)
+COOLING_LEVELS = (0.4, 1.0, 2.0)
+
+
+# --- 读取 ---
+
+@contextmanager
+def _open_buffer(source: Source) -> Iterator[Any]:
+    """文件路径通过 mmap 只读映射，字节内容直接使用"""
+    if isinstance(source, (bytes, bytearray)):
+        yield source
+        return
+    with open(source, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+
+def _skip_lines(buffer, count: int) -> int:
+    """返回跳过 count 行后的偏移量"""
+    offset = 0
+    for _ in range(count):
+        offset = buffer.find(b'\n', offset)
+        if offset < 0:
+            raise ValueError("文件头不完整")
+        offset += 1
+    return offset
+
+
+def _load_columns(buffer, offset: int, usecols: Sequence[int]) -> np.ndarray:
+    """按列解析 offset 之后的逗号分隔数值，返回 (len(usecols), 行数) 的数组"""
+    data = np.loadtxt(io.BytesIO(buffer[offset:]), delimiter=',', usecols=tuple(usecols),
+                      dtype=float, ndmin=2, encoding='latin-1')
+    return data.T
+
+
+def read_epw(source: Source) -> Dict[str, Any]:
+    """
+    读取 EPW 文件
+
+    Returns:
+        {'location': 站点信息, 'inputs': {'T', 'D'} (K), 'pressure': Pa 数组, 'month', 'hour'}；
+        干球温度或露点缺测的小时记为 NaN
+    """
+    with _open_buffer(source) as buffer:
+        first = bytes(buffer[:buffer.find(b'\n')]).decode('latin-1').strip().split(',')
+        if not first or first[0].upper() != 'LOCATION':
+            raise ValueError("不是有效的 EPW 文件（缺少 LOCATION 行）")
+        names = list(EPW_COLUMNS)
+        columns = dict(zip(names, _load_columns(buffer, _skip_lines(buffer, EPW_HEADER_LINES),
+                                                [EPW_COLUMNS[name] for name in names])))
+
+    for name, missing in EPW_MISSING.items():
+        columns[name][columns[name] >= missing] = np.nan
+    location = {
+        'city': first[1] if len(first) > 1 else '',
+        'country': first[3] if len(first) > 3 else '',
+        'wmo': first[5] if len(first) > 5 else '',
+    }
+    for key, index in (('latitude', 6), ('longitude', 7), ('elevation', 9)):
+        try:
+            location[key] = float(first[index])
+        except (IndexError, ValueError):
+            pass
+    return {
+        'location': location,
+        'inputs': {'T': columns['tdb'] + 273.15, 'D': columns['tdp'] + 273.15},
+        'pressure': columns['pressure'],
+        'month': columns['month'].astype(int),
+        'hour': columns['hour'].astype(int),
+    }
+
+
+def read_csv(source: Source, pressure_pa: float = 101325.0) -> Dict[str, Any]:
+    """
+    读取 CSV 气象文件：首行为表头，输入列使用 CoolProp 代码或 calculator.INPUT_ALIASES 中的别名（SI 单位），
+    需要恰好两个输入列，压力列 P 可选；month / hour 列可选，其余列忽略
+    """
+    with _open_buffer(source) as buffer:
+        end = buffer.find(b'\n')
+        header = bytes(buffer[:end if end >= 0 else len(buffer)]).decode('utf-8-sig').strip().split(',')
+        usecols, names = [], []
+        for index, name in enumerate(header):
+            name = name.strip()
+            code = INPUT_ALIASES.get(name, name)
+            if code in batch_engine.SUPPORTED_INPUTS or code in ('P', 'month', 'hour'):
+                if code in names:
+                    raise ValueError(f"列重复: {name}")
+                usecols.append(index)
+                names.append(code)
+        codes = [code for code in names if code in batch_engine.SUPPORTED_INPUTS]
+        if len(codes) != 2:
+            raise ValueError("CSV 需要恰好两个输入参数列（如 T 与 R）")
+        columns = dict(zip(names, _load_columns(buffer, end + 1, usecols)))
+
+    n = columns[codes[0]].size
+    return {
+        'location': {},
+        'inputs': {code: columns[code] for code in codes},
+        'pressure': columns['P'] if 'P' in columns else np.full(n, float(pressure_pa)),
+        'month': columns['month'].astype(int) if 'month' in columns else None,
+        'hour': columns['hour'].astype(int) if 'hour' in columns else None,
+    }
+
+
+def detect_weather_format(source: Source, explicit: Optional[str] = None) -> str:
+    """根据显式参数、文件扩展名或首行内容判断 'epw' / 'csv'"""
+    if explicit:
+        fmt = explicit.lower()
+        if fmt not in ('epw', 'csv'):
+            raise ValueError(f"不支持的气象文件格式: {explicit}")
+        return fmt
+    if isinstance(source, str):
+        return 'epw' if source.lower().endswith('.epw') else 'csv'
+    return 'epw' if bytes(source[:8]).upper().startswith(b'LOCATION') else 'csv'
+
+
+# --- 分析 ---
+
+def _edges(values: np.ndarray, step: float) -> np.ndarray:
+    """覆盖数据范围、对齐到 step 整数倍的分箱边界"""
+    if step <= 0:
+        raise ValueError("分箱步长必须大于 0")
+    lo = np.floor(np.min(values) / step) * step
+    hi = np.ceil(np.max(values) / step) * step
+    if hi <= lo:
+        hi = lo + step
+    count = int(round((hi - lo) / step))
+    if count > 2000:
+        raise ValueError("分箱数量过多，请增大步长")
+    return lo + step * np.arange(count + 1)
+
+
+def zone_mask(columns: Dict[str, np.ndarray], zone: Dict[str, Any]) -> np.ndarray:
+    """区域内的行：zone 给出 <字段>_min / <字段>_max 上下限（含边界），字段见 ZONE_FIELDS"""
+    mask = np.ones(columns['tdb'].shape, dtype=bool)
+    for key, bound in zone.items():
+        if key == 'name' or bound is None:
+            continue
+        field, _, side = key.rpartition('_')
+        if field not in ZONE_FIELDS or side not in ('min', 'max'):
+            raise ValueError(f"不支持的区域条件: {key}")
+        mask &= columns[field] >= bound if side == 'min' else columns[field] <= bound
+    return mask
+
+
+def _coincident(values: np.ndarray, other: np.ndarray, design: float, window: float) -> float:
+    """design 附近 ±window 内各小时 other 的平均值，该范围内无数据时取最接近的小时"""
+    near = np.abs(values - design) <= window
+    if not np.any(near):
+        near = np.abs(values - design) == np.min(np.abs(values - design))
+    return float(np.mean(other[near]))
+
+
+def design_conditions(columns: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """
+    年累计频率设计工况
+
+    heating: 干球温度 99.6% / 99%（全年只有 0.4% / 1% 的小时更冷）
+    cooling / evaporation / dehumidification / enthalpy:
+        干球温度、湿球温度、露点、焓值 0.4% / 1% / 2%，附平均同时发生值
+    """
+    tdb, twb, tdp, h, w = (columns[name] for name in ('tdb', 'twb', 'tdp', 'h', 'w'))
+
+    def level(values, frequency):
+        return float(np.percentile(values, 100.0 - frequency))
+
+    result = {
+        'heating': {f'{f:g}': {'tdb': round(level(tdb, f), 1)} for f in HEATING_LEVELS},
+        'cooling': {}, 'evaporation': {}, 'dehumidification': {}, 'enthalpy': {},
+    }
+    for f in COOLING_LEVELS:
+        key = f'{f:g}'
+        db = level(tdb, f)
+        result['cooling'][key] = {'tdb': round(db, 1), 'mcwb': round(_coincident(tdb, twb, db, 0.5), 1)}
+        wb = level(twb, f)
+        result['evaporation'][key] = {'twb': round(wb, 1), 'mcdb': round(_coincident(twb, tdb, wb, 0.5), 1)}
+        dp = level(tdp, f)
+        result['dehumidification'][key] = {
+            'tdp': round(dp, 1),
+            'w': round(_coincident(tdp, w, dp, 0.5), 2),
+            'mcdb': round(_coincident(tdp, tdb, dp, 0.5), 1),
+        }
+        enthalpy = level(h, f)
+        result['enthalpy'][key] = {'h': round(enthalpy, 1), 'mcdb': round(_coincident(h, tdb, enthalpy, 1.0), 1)}
+    return result
+
+
+def analyze(data: Dict[str, Any], t_step: float = DEFAULT_T_STEP, w_step: float = DEFAULT_W_STEP,
+            zones: Optional[Sequence[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    对 read_epw / read_csv 的结果做焓湿分析
+
+    Args:
+        t_step / w_step: 分箱步长（°C、g/kg）
+        zones: 统计区域，默认 DEFAULT_ZONES
+
+    Returns:
+        {'location', 'hours', 'valid_hours', 'pressure', 'bins', 'zones', 'design', 'monthly_mean'}
+    """
+    zones = DEFAULT_ZONES if zones is None else zones
+    inputs = data['inputs']
+    pressure = data['pressure']
+    # 缺测压力按海拔折算的标准大气压补齐
+    if np.any(np.isnan(pressure)):
+        elevation = data['location'].get('elevation', 0.0)
+        pressure = np.where(np.isnan(pressure), 101325.0 * (1 - 2.25577e-5 * elevation) ** 5.2559, pressure)
+
+    columns = batch_engine.compute_batch(inputs, pressure, fallback=False)
+    valid = columns['success']
+    if not np.any(valid):
+        raise ValueError("没有可计算的小时数据")
+    hourly = {name: columns[name][valid] for name in ZONE_FIELDS}
+
+    t_edges = _edges(hourly['tdb'], t_step)
+    w_edges = _edges(hourly['w'], w_step)
+    counts, _, _ = np.histogram2d(hourly['tdb'], hourly['w'], bins=(t_edges, w_edges))
+
+    zone_hours = []
+    for index, zone in enumerate(zones):
+        hours = int(np.count_nonzero(zone_mask(hourly, zone)))
+        zone_hours.append({'name': zone.get('name') or f'zone{index + 1}', 'hours': hours,
+                           'fraction': round(hours / hourly['tdb'].size, 4)})
+
+    monthly = None
+    if data.get('month') is not None:
+        months = data['month'][valid]
+        monthly = {
+            int(m): {name: round(float(np.mean(hourly[name][months == m])), 2) for name in ('tdb', 'w', 'h')}
+            for m in np.unique(months)
+        }
+
+    return {
+        'location': data['location'],
+        'hours': int(valid.size),
+        'valid_hours': int(np.count_nonzero(valid)),
+        'pressure': round(float(np.mean(columns['P'][valid])), 1),
+        'bins': {
+            't_edges': [round(float(v), 4) for v in t_edges],
+            'w_edges': [round(float(v), 4) for v in w_edges],
+            # counts[i][j]: 干球温度位于第 i 个区间、含湿量位于第 j 个区间的小时数
+            'counts': counts.astype(int).tolist(),
+        },
+        'zones': zone_hours,
+        'design': design_conditions(hourly),
+        'monthly_mean': monthly,
+    }
+
+
+def analyze_weather(source: Source, fmt: Optional[str] = None, pressure_pa: float = 101325.0,
+                    **options) -> Dict[str, Any]:
+    """读取并分析一个气象文件（路径或字节内容），options 同 analyze"""
+    fmt = detect_weather_format(source, fmt)
+    data = read_epw(source) if fmt == 'epw' else read_csv(source, pressure_pa)
+    return analyze(data, **options)
+
+
+def _analyze_site(source: Source, options: Dict[str, Any]) -> Dict[str, Any]:
+    """进程池任务：单个站点的分析，失败时返回错误信息而不是抛出"""
+    try:
+        result = analyze_weather(source, **options)
+        result['success'] = True
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    if isinstance(source, str):
+        result['source'] = source
+    return result
+
+
+def analyze_portfolio(sources: Sequence[Source], workers: Optional[int] = None,
+                      **options) -> List[Dict[str, Any]]:
+    """
+    并行分析多个站点，结果与 sources 顺序一致
+
+    使用 parallel 模块的常驻进程池（进程数默认 PSYCHRO_POOL_WORKERS）；
+    进程池不可用或只有一个站点时在当前进程依次计算。
+    """
+    from parallel import get_pool
+
+    pool = get_pool(workers) if len(sources) > 1 else None
+    if pool is None:
+        return [_analyze_site(source, options) for source in sources]
+    return list(pool.map(_analyze_site, sources, [options] * len(sources)))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="全年逐时气象数据的焓湿分析")
+    parser.add_argument('files', nargs='+', help="EPW 或 CSV 气象文件")
+    parser.add_argument('--format', choices=('epw', 'csv'), help="文件格式（默认按扩展名判断）")
+    parser.add_argument('--pressure', type=float, default=101325.0, help="CSV 无压力列时使用的压力 (Pa)")
+    parser.add_argument('--t-step', type=float, default=DEFAULT_T_STEP, help="干球温度分箱步长 (°C)")
+    parser.add_argument('--w-step', type=float, default=DEFAULT_W_STEP, help="含湿量分箱步长 (g/kg)")
+    parser.add_argument('--workers', type=int, help="并行进程数")
+    parser.add_argument('--output', help="把结果写入 JSON 文件（默认输出到标准输出）")
+    args = parser.parse_args(argv)
+
+    options = {'fmt': args.format, 'pressure_pa': args.pressure, 't_step': args.t_step, 'w_step': args.w_step}
+    started = time.perf_counter()
+    results = analyze_portfolio(args.files, args.workers, **options)
+    elapsed = time.perf_counter() - started
+    print(f"分析 {len(results)} 个站点，耗时 {elapsed:.2f}s", file=sys.stderr)
+
+    output = results[0] if len(results) == 1 else results
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(output, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    return 0 if all(result['success'] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,404 @@
+# zones.py - 焓湿图区域（舒适区、设备运行范围）与大批量状态点的区域归属统计
+"""
+区域为 (干球温度 °C, 含湿量 g/kg) 平面上的多边形，两种定义方式：
+
+- 直接给出顶点：``{"name": "机组运行范围", "polygon": [[tdb, w], ...]}``
+- 给出上下限：``{"name": "舒适区", "tdb_min": 20, "tdb_max": 26, "rh_min": 30, "rh_max": 60}``，
+  条件字段同 weather.ZONE_FIELDS（tdb/twb/tdp °C、rh %、w g/kg、h kJ/kg），按给定压力用批量计算引擎
+  求出各条件在每个干球温度下对应的含湿量上下限，沿干球温度采样成多边形（上限不超过饱和线）
+
+大批量分类（ZoneIndex.classify）：
+
+- 预先在全部区域的外包矩形上建立均匀网格，每个格子对每个区域标记为 完全在内 / 完全在外 / 与边界相交
+- 状态点按坐标直接定位到格子；只有落在边界格子中的点才做多边形射线法判断（按边向量化），
+  百万级的点绝大多数只需一次查表
+- 返回每个区域的点数与小时数（每个点代表的小时数可统一给出或逐点给出），区域可以重叠，
+  另给出不在任何区域内的点数与小时数
+
+ZoneRegistry 保存按名称注册的区域，注册时即解析为多边形，索引在区域变化后首次分类时重建。
+
+分类请求（classify_points）为 JSON ``{"tdb": [...], "w": [...] 或 "rh": [...], "hours": 0.25 或 [...],
+"zones": [已注册的名称] 或 [区域定义], "pressure": 101325}``，或 response_format 的 f32/f64 二进制格式
+（数值列 tdb、w/rh、可选 hours，其余字段放在头部）。
+"""
+import json
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+import batch_engine
+from cache import LRUTTLCache
+
+# 上下限区域的条件字段（单位同计算结果）
+ZONE_FIELDS = ('tdb', 'twb', 'rh', 'w', 'h', 'tdp')
+# 未给出干球温度上下限时的采样范围 (°C)，与焓湿图的温度范围一致
+DEFAULT_TDB_RANGE = (-20.0, 60.0)
+# 上下限区域沿干球温度的采样步长 (°C) 与最多采样点数
+BOUNDS_T_STEP = 0.1
+MAX_BOUNDS_SAMPLES = 4000
+# 多边形最多顶点数
+MAX_POLYGON_VERTICES = 10000
+# 索引网格每个方向的格子数
+GRID_CELLS = 256
+
+# 分类请求体的大小上限 (字节)
+MAX_CLASSIFY_BYTES = 128 * 1024 * 1024
+
+# 格子状态
+_OUTSIDE, _INSIDE, _BOUNDARY = 0, 1, 2
+
+# 按定义缓存的索引（分类请求直接携带区域定义时复用）
+_index_cache = LRUTTLCache(capacity=64, default_ttl=3600.0)
+
+
+def _bounds_polygon(zone: Dict[str, Any], pressure: float) -> np.ndarray:
+    """上下限区域 → 多边形顶点 (N, 2)：上边界沿温度正向、下边界反向"""
+    limits: Dict[str, Dict[str, float]] = {}
+    for key, bound in zone.items():
+        if key == 'name' or bound is None:
+            continue
+        field, _, side = key.rpartition('_')
+        if field not in ZONE_FIELDS or side not in ('min', 'max'):
+            raise ValueError(f"不支持的区域条件: {key}")
+        limits.setdefault(field, {})[side] = float(bound)
+    if not limits:
+        raise ValueError("区域需要给出 polygon 或至少一个上下限条件")
+
+    t_lo, t_hi = DEFAULT_TDB_RANGE
+    t_lo = limits.get('tdb', {}).get('min', t_lo)
+    t_hi = limits.get('tdb', {}).get('max', t_hi)
+    if t_hi <= t_lo:
+        raise ValueError("干球温度上限应大于下限")
+    count = min(MAX_BOUNDS_SAMPLES, int(np.ceil((t_hi - t_lo) / BOUNDS_T_STEP)) + 1)
+    tdb = np.linspace(t_lo, t_hi, count)
+    T = tdb + 273.15
+    P = np.full(T.shape, float(pressure))
+
+    # 每个条件给出该温度下含湿量 (kg/kg) 的下限 / 上限
+    def humidity_ratio(field: str, value: float) -> np.ndarray:
+        if field == 'rh':
+            return batch_engine.humidity_ratio_from_rh(T, value / 100.0, P)
+        if field == 'w':
+            return np.full(T.shape, value / 1000.0)
+        if field == 'h':
+            return batch_engine.humidity_ratio_from_enthalpy(T, value * 1000.0, P)
+        if field == 'tdp':
+            return np.full(T.shape, float(batch_engine.saturation_humidity_ratio(value + 273.15, float(pressure))))
+        # twb：干球温度低于湿球温度时不存在这样的状态，结果高于饱和含湿量，由饱和上限排除
+        return batch_engine.humidity_ratio_from_wet_bulb(T, np.full(T.shape, value + 273.15), P)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        upper = batch_engine.saturation_humidity_ratio(T, P)
+        lower = np.zeros(T.shape)
+        for field, sides in limits.items():
+            if field == 'tdb':
+                continue
+            if 'min' in sides:
+                lower = np.maximum(lower, humidity_ratio(field, sides['min']))
+            if 'max' in sides:
+                upper = np.minimum(upper, humidity_ratio(field, sides['max']))
+
+    feasible = np.isfinite(lower) & np.isfinite(upper) & (upper >= lower)
+    if not np.any(feasible):
+        raise ValueError("区域为空：各条件没有共同的状态")
+    index = np.flatnonzero(feasible)
+    if index[-1] - index[0] + 1 != index.size:
+        raise ValueError("区域在干球温度方向不连续，请拆分为多个区域")
+    tdb, lower, upper = tdb[index], lower[index] * 1000.0, upper[index] * 1000.0
+    return np.concatenate([np.column_stack([tdb, upper]), np.column_stack([tdb[::-1], lower[::-1]])])
+
+
+def resolve_zone(zone: Dict[str, Any], pressure: float = 101325.0) -> Dict[str, Any]:
+    """
+    把区域定义解析为 {'name', 'polygon': [[tdb, w], ...]}
+
+    Raises:
+        ValueError: 定义无效或区域为空
+    """
+    if not isinstance(zone, dict):
+        raise ValueError("区域定义应为对象")
+    name = zone.get('name')
+    if not name or not isinstance(name, str):
+        raise ValueError("区域需要名称 name")
+    if 'polygon' in zone:
+        try:
+            polygon = np.asarray(zone['polygon'], dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError(f"区域 {name} 的 polygon 应为 [[tdb, w], ...]")
+        if polygon.ndim != 2 or polygon.shape[1] != 2 or not 3 <= len(polygon) <= MAX_POLYGON_VERTICES:
+            raise ValueError(f"区域 {name} 的 polygon 应为 3 到 {MAX_POLYGON_VERTICES} 个 [tdb, w] 顶点")
+        if not np.all(np.isfinite(polygon)):
+            raise ValueError(f"区域 {name} 的 polygon 含无效数值")
+    else:
+        try:
+            polygon = _bounds_polygon(zone, pressure)
+        except ValueError as e:
+            raise ValueError(f"区域 {name}: {e}")
+    return {'name': name, 'polygon': np.round(polygon, 6).tolist()}
+
+
+def points_in_polygon(x: np.ndarray, y: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    """射线法（偶数-奇数规则），按多边形的边循环、对点向量化"""
+    inside = np.zeros(x.shape, dtype=bool)
+    x0, y0 = polygon[-1]
+    for x1, y1 in polygon:
+        if y0 != y1:
+            crosses = (y1 > y) != (y0 > y)
+            # 交点的横坐标在点的右侧时翻转
+            inside ^= crosses & (x < (x0 - x1) * (y - y1) / (y0 - y1) + x1)
+        x0, y0 = x1, y1
+    return inside
+
+
+class ZoneIndex:
+    """一组区域的网格索引"""
+
+    def __init__(self, zones: Sequence[Dict[str, Any]], cells: int = GRID_CELLS):
+        """
+        Args:
+            zones: resolve_zone 的结果列表
+        """
+        self.names = [zone['name'] for zone in zones]
+        self.polygons = [np.asarray(zone['polygon'], dtype=float) for zone in zones]
+        self.cells = cells
+        if not zones:
+            self.origin = np.zeros(2)
+            self.size = np.ones(2)
+            self.states = np.zeros((0, cells, cells), dtype=np.int8)
+            return
+        vertices = np.concatenate(self.polygons)
+        lo, hi = vertices.min(axis=0), vertices.max(axis=0)
+        span = np.maximum(hi - lo, 1e-9)
+        # 外包矩形略微放大，边界上的顶点落在网格内部
+        self.origin = lo - span * 1e-6
+        self.size = span * (1 + 2e-6) / cells
+        self.states = np.stack([self._rasterize(polygon) for polygon in self.polygons])
+
+    def _cell(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return (np.floor((x - self.origin[0]) / self.size[0]).astype(np.int64),
+                np.floor((y - self.origin[1]) / self.size[1]).astype(np.int64))
+
+    def _rasterize(self, polygon: np.ndarray) -> np.ndarray:
+        """
+        格子状态：边经过的格子为边界，其余按格子中心判断内外
+
+        每条边按不超过半个格子的间距取点，所在格子及其相邻格子都标记为边界（保守，不会漏标）。
+        """
+        cells = self.cells
+        states = np.zeros((cells, cells), dtype=np.int8)
+        start, end = np.roll(polygon, 1, axis=0), polygon
+        steps = np.ceil(np.max(np.abs(end - start) / self.size, axis=1) * 2).astype(np.int64) + 1
+        edge = np.repeat(np.arange(len(polygon)), steps)
+        offsets = np.arange(edge.size) - np.repeat(np.cumsum(steps) - steps, steps)
+        fraction = (offsets / np.repeat(steps, steps))[:, None]
+        samples = start[edge] + (end[edge] - start[edge]) * fraction
+        cx, cy = self._cell(samples[:, 0], samples[:, 1])
+        marked = np.zeros((cells + 2, cells + 2), dtype=bool)
+        marked[np.clip(cx, 0, cells - 1) + 1, np.clip(cy, 0, cells - 1) + 1] = True
+        boundary = np.zeros((cells, cells), dtype=bool)
+        for dx in (0, 1, 2):
+            for dy in (0, 1, 2):
+                boundary |= marked[dx:dx + cells, dy:dy + cells]
+        centers = (np.arange(cells) + 0.5)
+        gx, gy = np.meshgrid(self.origin[0] + centers * self.size[0], self.origin[1] + centers * self.size[1],
+                             indexing='ij')
+        states[points_in_polygon(gx, gy, polygon)] = _INSIDE
+        states[boundary] = _BOUNDARY
+        return states
+
+    def membership(self, tdb: np.ndarray, w: np.ndarray) -> np.ndarray:
+        """各点是否在各区域内：形状 (区域数, 点数) 的布尔数组；无效点 (NaN) 不在任何区域内"""
+        tdb = np.asarray(tdb, dtype=float)
+        w = np.asarray(w, dtype=float)
+        result = np.zeros((len(self.names), tdb.size), dtype=bool)
+        if not self.names or not tdb.size:
+            return result
+        with np.errstate(invalid='ignore'):
+            ix, iy = self._cell(tdb, w)
+        inside_grid = (ix >= 0) & (ix < self.cells) & (iy >= 0) & (iy < self.cells) & np.isfinite(tdb) & np.isfinite(w)
+        rows = np.flatnonzero(inside_grid)
+        ix, iy = ix[rows], iy[rows]
+        for k, polygon in enumerate(self.polygons):
+            state = self.states[k, ix, iy]
+            result[k, rows[state == _INSIDE]] = True
+            edge = rows[state == _BOUNDARY]
+            if edge.size:
+                result[k, edge] = points_in_polygon(tdb[edge], w[edge], polygon)
+        return result
+
+    def classify(self, tdb, w, hours: Union[float, Sequence[float], np.ndarray] = 1.0) -> Dict[str, Any]:
+        """
+        统计各区域的点数与小时数
+
+        Args:
+            tdb / w: 干球温度 (°C)、含湿量 (g/kg)
+            hours: 每个点代表的小时数（标量或逐点）
+
+        Returns:
+            {'points', 'valid_points', 'zones': [{'name', 'count', 'hours', 'fraction'}], 'outside': {'count', 'hours'}}
+        """
+        tdb = np.asarray(tdb, dtype=float).ravel()
+        w = np.asarray(w, dtype=float).ravel()
+        if tdb.shape != w.shape:
+            raise ValueError("tdb 与 w 的长度不一致")
+        weights = np.asarray(hours, dtype=float)
+        if weights.ndim and weights.shape != tdb.shape:
+            raise ValueError("hours 应为数值或与状态点等长的数组")
+        weights = np.broadcast_to(weights, tdb.shape)
+        valid = np.isfinite(tdb) & np.isfinite(w)
+        member = self.membership(tdb, w)
+        valid_count = int(np.count_nonzero(valid))
+        zones = []
+        for name, row in zip(self.names, member):
+            count = int(np.count_nonzero(row))
+            zones.append({'name': name, 'count': count, 'hours': round(float(weights[row].sum()), 4),
+                          'fraction': round(count / valid_count, 6) if valid_count else 0.0})
+        outside = valid & ~member.any(axis=0)
+        return {
+            'points': int(tdb.size),
+            'valid_points': valid_count,
+            'zones': zones,
+            'outside': {'count': int(np.count_nonzero(outside)), 'hours': round(float(weights[outside].sum()), 4)},
+        }
+
+
+def build_index(zones: Sequence[Dict[str, Any]], pressure: float = 101325.0) -> ZoneIndex:
+    """由区域定义构建索引（按定义与压力缓存）"""
+    key = (repr(zones), float(pressure))
+    return _index_cache.get_or_compute(key, lambda: ZoneIndex([resolve_zone(zone, pressure) for zone in zones]))
+
+
+def point_columns(columns: Dict[str, Any], pressure: float = 101325.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    由输入列得到 (tdb °C, w g/kg)：tdb 加 w 或 rh (%) 之一
+
+    Raises:
+        ValueError: 缺少列或长度不一致
+    """
+    if 'tdb' not in columns or ('w' not in columns and 'rh' not in columns):
+        raise ValueError("状态点需要 tdb 列以及 w 或 rh 列")
+    tdb = np.asarray(columns['tdb'], dtype=float).ravel()
+    if 'w' in columns:
+        w = np.asarray(columns['w'], dtype=float).ravel()
+    else:
+        rh = np.asarray(columns['rh'], dtype=float).ravel()
+        if rh.shape != tdb.shape:
+            raise ValueError("tdb 与 rh 的长度不一致")
+        P = np.full(tdb.shape, float(pressure))
+        with np.errstate(invalid='ignore'):
+            w = batch_engine.humidity_ratio_from_rh(tdb + 273.15, rh / 100.0, P) * 1000.0
+    if w.shape != tdb.shape:
+        raise ValueError("tdb 与 w 的长度不一致")
+    return tdb, w
+
+
+class ZoneRegistry:
+    """按名称注册的区域（进程内；多实例部署时各实例分别注册，或在分类请求中直接携带区域定义）"""
+
+    def __init__(self):
+        self._zones: Dict[str, Dict[str, Any]] = {}
+        self._index: Optional[ZoneIndex] = None
+        # 指定名称子集的索引，区域变化时清空
+        self._subsets: Dict[Tuple[str, ...], ZoneIndex] = {}
+        self._lock = threading.Lock()
+
+    def register(self, zone: Dict[str, Any], pressure: float = 101325.0) -> Dict[str, Any]:
+        """解析并注册（同名覆盖），返回解析后的区域（含 polygon 与 pressure）"""
+        resolved = resolve_zone(zone, pressure)
+        resolved['pressure'] = pressure
+        resolved['definition'] = {key: value for key, value in zone.items() if key != 'name'}
+        with self._lock:
+            self._zones[resolved['name']] = resolved
+            self._index = None
+            self._subsets.clear()
+        return resolved
+
+    def remove(self, name: str) -> bool:
+        with self._lock:
+            removed = self._zones.pop(name, None) is not None
+            if removed:
+                self._index = None
+                self._subsets.clear()
+            return removed
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._zones.values())
+
+    def index(self, names: Optional[Sequence[str]] = None) -> ZoneIndex:
+        """全部或指定名称区域的索引；全部区域的索引在变化后首次使用时重建"""
+        with self._lock:
+            if names is not None:
+                missing = [name for name in names if name not in self._zones]
+                if missing:
+                    raise KeyError(f"未注册的区域: {', '.join(missing)}")
+                key = tuple(names)
+                if key not in self._subsets:
+                    self._subsets[key] = ZoneIndex([self._zones[name] for name in names])
+                return self._subsets[key]
+            if self._index is None:
+                self._index = ZoneIndex(list(self._zones.values()))
+            return self._index
+
+
+registry = ZoneRegistry()
+
+
+def parse_points(body: bytes, binary: bool = False) -> Dict[str, Any]:
+    """
+    解析分类请求体
+
+    Raises:
+        ValueError: 不是有效的 JSON 对象或二进制数据
+    """
+    if binary:
+        from response_format import read_table
+
+        header, arrays = read_table(body)
+        request = {key: header[key] for key in ('hours', 'zones', 'pressure') if key in header}
+        request.update(arrays)
+        return request
+    try:
+        request = json.loads(body)
+    except ValueError:
+        raise ValueError("请求体不是有效的 JSON")
+    if not isinstance(request, dict):
+        raise ValueError("请求体应为对象")
+    return request
+
+
+def classify_points(request: Dict[str, Any], pressure: float = 101325.0, hours: float = 1.0,
+                    zone_registry: Optional[ZoneRegistry] = None) -> Dict[str, Any]:
+    """
+    按请求统计各区域的点数与小时数（结果同 ZoneIndex.classify，另含 pressure）
+
+    请求中的 pressure / hours 优先于参数；zones 缺省时使用注册表中的全部区域。
+
+    Raises:
+        ValueError: 输入无效、区域未注册或没有可用的区域
+    """
+    zone_registry = registry if zone_registry is None else zone_registry
+    pressure = float(request.get('pressure', pressure))
+    zones = request.get('zones')
+    if zones is None:
+        index = zone_registry.index()
+    elif isinstance(zones, list) and zones and all(isinstance(zone, str) for zone in zones):
+        try:
+            index = zone_registry.index(zones)
+        except KeyError as e:
+            raise ValueError(e.args[0])
+    elif isinstance(zones, list) and zones and all(isinstance(zone, dict) for zone in zones):
+        index = build_index(zones, pressure)
+    else:
+        raise ValueError("zones 应全部为已注册的区域名称或全部为区域定义")
+    if not index.names:
+        raise ValueError("没有可用的区域，请先注册或在请求中给出 zones")
+
+    tdb, w = point_columns(request, pressure)
+    try:
+        result = index.classify(tdb, w, request.get('hours', hours))
+    except (TypeError, ValueError):
+        raise ValueError("hours 应为数值或与状态点等长的数组")
+    result['pressure'] = pressure
+    return result
@@ -98,6 +98,23 @@ install_backend_dependencies() {
         pip install -r requirements-serverless.txt
         
         log_success "后端依赖安装完成"
+        
+        # 构建 fast 模式插值表，随部署包发布
+        log_info "构建 fast 模式插值表..."
+        python fast_table.py build || log_warning "插值表构建失败，fast 模式将按精确路径计算"
+        
+        # 预先写入常用状态的第二级缓存，冷启动实例直接读取
+        log_info "生成第二级结果缓存..."
+        python result_store.py seed || log_warning "第二级缓存生成失败，冷启动实例将重新计算常用状态"
+        
+        # 预生成 matplotlib 字体缓存，运行时首次渲染不再扫描字体
+        python coldstart.py --build-font-cache || log_warning "字体缓存生成失败，首次渲染时将扫描字体"
+        
+        # 计算类接口不得加载绘图依赖（冷启动回归检查）
+        if ! python coldstart.py --check; then
+            log_error "计算类接口加载了绘图依赖，请检查 main_app / calculator 的导入"
+            exit 1
+        fi
     else
         log_warning "未找到 requirements-serverless.txt，使用标准依赖..."
         pip install -r requirements.txt